@@ -7,8 +7,12 @@ from flask_cors import CORS
 from werkzeug.utils import secure_filename
 import os
 import json
+import time
 from database import DatabaseManager
 from dxf_parser import DXFParser
+from parse_cache import ParseCache, file_content_hash
+from parse_jobs import ParseJobManager
+from segment_store import SegmentStore
 from wall_merger import WallMerger, pairs_to_dict
 
 app = Flask(__name__, static_folder='frontend', static_url_path='')
@@ -17,6 +21,10 @@ CORS(app)
 # 設定
 UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
 DB_PATH = os.path.join(os.getcwd(), 'wall_calculator.db')
+PARSE_CACHE_DIR = os.path.join(os.getcwd(), 'parse_cache')
+PARSE_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024  # 2GB，超過時依 LRU 淘汰
+PARSE_WORKERS = 2  # 同時進行的背景解析工作數
+PARSE_PROCESSES = None  # 平行提取的行程數（None 為 CPU 核心數）
 ALLOWED_EXTENSIONS = {'dxf', 'dwg'}
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
@@ -26,6 +34,9 @@ app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB max (支援大型
 # 資料庫實例
 db = DatabaseManager(DB_PATH)
 
+# 解析結果快取（以檔案內容雜湊為鍵）
+parse_cache = ParseCache(PARSE_CACHE_DIR, PARSE_CACHE_MAX_BYTES)
+
 # 牆體合併處理器
 merger = WallMerger(db)
 
@@ -110,54 +121,201 @@ def upload_file():
     })
 
 
-@app.route('/api/parse', methods=['POST'])
-def parse_dxf():
-    """解析 DXF 檔案並建立專案"""
+@app.route('/api/layers/preview', methods=['POST'])
+def preview_layers():
+    """
+    圖層預覽：不做完整解析，只掃描一次取得每個圖層的實體數、線段數、總長度與範圍
+    供圖層選擇視窗在完整解析完成前先開啟
+    """
     data = request.json
     filepath = data.get('filepath')
-    project_name = data.get('project_name', '未命名專案')
-    selected_layers = data.get('selected_layers', None)  # 使用者選擇的圖層列表
 
     if not filepath or not os.path.exists(filepath):
         return jsonify({"success": False, "error": "檔案不存在"}), 400
 
-    # 解析 DXF
+    started = time.perf_counter()
     parser = DXFParser(filepath)
-    if not parser.load():
-        return jsonify({"success": False, "error": "無法解析 DXF 檔案"}), 400
+    try:
+        layers = parser.preview_layers()
+    except Exception as e:
+        return jsonify({"success": False, "error": f"無法解析 DXF 檔案: {e}"}), 400
 
-    # 提取圖層資訊
-    layers = parser.extract_layers()
+    return jsonify({
+        "success": True,
+        "layers": layers,
+        "dimscale": parser.dimscale,
+        "insunits": parser.insunits,
+        "elapsed": round(time.perf_counter() - started, 3)
+    })
 
-    # 提取所有線段（用於顯示完整平面圖）
-    all_segments = parser.extract_wall_entities(wall_layer_prefix=None)
 
-    # 建立專案
+def run_parse_job(job, selected_layers=None, include_background=False, streaming=False,
+                  parallel=False, use_cache=True, arc_tolerance=None, arc_mode="vertices"):
+    """
+    背景解析工作：解析 DXF、建立專案並匯入線段
+    透過 job.update 回報 load / layers / entities / import 各階段進度
+
+    有 selected_layers 時只提取並匯入這些圖層（不符合的實體在解析階段就略過）；
+    include_background=True 則提取所有圖層（背景圖層總覽），只統計選中圖層的線段數
+
+    弧線以參數式快取，匯入與回傳時才依 arc_tolerance（弦高誤差）離散化；
+    arc_mode="parametric" 時回傳的弧線不含頂點，改附 arc 參數由前端自行繪製
+    （含圓弧段的多段線改附 bulges：原始頂點與凸度）
+    """
+    filepath = job.filepath
+    layer_spec = selected_layers if selected_layers and not include_background else None
+
+    # 相同內容（且圖層篩選相同）的檔案直接使用快取的解析結果
+    cache_key = parse_cache.make_key(file_content_hash(filepath),
+                                     ParseCache.layers_variant(layer_spec))
+    cached = parse_cache.get(cache_key) if use_cache else None
+
+    if cached is not None:
+        layers = cached.layers
+        all_segments = cached.segments
+        dimscale = cached.dimscale
+        insunits = cached.insunits
+        load_report = {"method": "快取", "cache_key": cache_key}
+        job.update("entities", len(all_segments), len(all_segments))
+    else:
+        # 解析 DXF
+        parser = DXFParser(filepath)
+        parser.progress_callback = job.update
+        parser.parametric_arcs = True
+        if streaming:
+            try:
+                all_segments = SegmentStore.from_segments(
+                    parser.iter_wall_entities_streaming(wall_layer_prefix=None, layers=layer_spec))
+            except (IOError, UnicodeDecodeError) as e:
+                raise ValueError(f"無法解析 DXF 檔案: {e}")
+            layers = parser.layers
+        elif parallel:
+            all_segments = parser.extract_wall_entities_parallel(wall_layer_prefix=None,
+                                                                 workers=PARSE_PROCESSES,
+                                                                 layers=layer_spec)
+            layers = parser.layers
+        else:
+            if not parser.load():
+                raise ValueError("無法解析 DXF 檔案")
+
+            # 提取圖層資訊
+            layers = parser.extract_layers()
+
+            # 提取線段（未篩選圖層時為所有線段，用於顯示完整平面圖）
+            all_segments = parser.extract_wall_entities(wall_layer_prefix=None, layers=layer_spec)
+
+        dimscale = parser.dimscale
+        insunits = parser.insunits
+        load_report = parser.load_report
+        parse_cache.put(cache_key, layers, dimscale, insunits, all_segments)
+
+    if arc_tolerance is not None:
+        all_segments.arc_tolerance = float(arc_tolerance)
+
+    # 建立專案並匯入所有線段到資料庫（寫入由 DatabaseManager 依序進行，每個執行緒使用自己的連線）
+    job.update("import", 0, len(all_segments))
     project_id = db.create_project(
-        name=project_name,
+        name=job.project_name,
         source_file=os.path.basename(filepath)
     )
-
-    # 匯入所有線段到資料庫
-    segment_dicts = [seg.to_dict() for seg in all_segments]
-    count = db.import_segments(project_id, segment_dicts)
+    count = db.import_segments(
+        project_id, all_segments,
+        progress_callback=lambda done, total: job.update("import", done, total)
+    )
 
     # 如果使用者有選擇特定圖層，標記這些圖層的線段
     selected_segment_count = 0
-    if selected_layers:
-        selected_segments = [seg for seg in all_segments if seg.layer in selected_layers]
-        selected_segment_count = len(selected_segments)
+    if layer_spec is not None:
+        selected_segment_count = count
+    elif selected_layers:
+        selected_segment_count = int(all_segments.layer_mask(selected_layers).sum())
 
-    return jsonify({
+    return {
         "success": True,
         "project_id": project_id,
         "layers": layers,  # 所有圖層資訊
-        "dimscale": parser.dimscale,  # DXF DIMSCALE (尺寸縮放比例)
-        "insunits": parser.insunits,  # DXF INSUNITS (插入單位)
+        "dimscale": dimscale,  # DXF DIMSCALE (尺寸縮放比例)
+        "insunits": insunits,  # DXF INSUNITS (插入單位)
+        "load_report": load_report,  # 載入方式與耗時
+        "cache_key": cache_key,  # 解析快取鍵
+        "from_cache": cached is not None,
+        "layers_filtered": layer_spec is not None,  # 是否只提取選中的圖層
         "total_segment_count": count,  # 總線段數
         "selected_segment_count": selected_segment_count,  # 選中的線段數
-        "segments": [seg.to_dict() for seg in all_segments]  # 返回所有線段用於繪圖
-    })
+        # 返回所有線段用於繪圖
+        "segments": all_segments.to_dicts(parametric=arc_mode == "parametric")
+    }
+
+
+# 背景解析工作（多個上傳可同時解析，不阻塞其他 API）
+parse_jobs = ParseJobManager(run_parse_job, max_workers=PARSE_WORKERS)
+
+
+@app.route('/api/parse', methods=['POST'])
+def parse_dxf():
+    """
+    建立背景解析工作，立即回傳工作 ID
+    以 GET /api/parse/jobs/<job_id> 查詢進度與結果；
+    傳入 wait: true 則等待解析完成後直接回傳結果（舊版同步行為）
+    """
+    data = request.json
+    filepath = data.get('filepath')
+    project_name = data.get('project_name', '未命名專案')
+
+    if not filepath or not os.path.exists(filepath):
+        return jsonify({"success": False, "error": "檔案不存在"}), 400
+
+    job = parse_jobs.submit(
+        filepath, project_name,
+        selected_layers=data.get('selected_layers', None),  # 使用者選擇的圖層列表（只匯入這些圖層）
+        include_background=data.get('include_background', False),  # 同時匯入其他圖層（背景圖層總覽）
+        streaming=data.get('streaming', False),  # 串流模式：不建立完整 ezdxf 文件，適合超大檔案
+        parallel=data.get('parallel', False),  # 平行模式：多行程提取線段
+        use_cache=data.get('use_cache', True),  # 設為 False 可強制重新解析
+        arc_tolerance=data.get('arc_tolerance', None),  # 弧線離散化的弦高誤差（繪圖單位）
+        arc_mode=data.get('arc_mode', 'vertices')  # parametric：弧線只回傳圓心、半徑與角度
+    )
+
+    if data.get('wait', False):
+        job = parse_jobs.wait(job.job_id)
+        if job.status == "failed":
+            return jsonify({"success": False, "error": job.error}), 400
+        return jsonify(job.result)
+
+    return jsonify({
+        "success": True,
+        "job_id": job.job_id,
+        "status_url": f"/api/parse/jobs/{job.job_id}"
+    }), 202
+
+
+@app.route('/api/parse/jobs', methods=['GET'])
+def list_parse_jobs():
+    """列出解析工作（不含結果）"""
+    return jsonify({"success": True, "data": [job.to_dict() for job in parse_jobs.list_jobs()]})
+
+
+@app.route('/api/parse/jobs/<job_id>', methods=['GET'])
+def get_parse_job(job_id):
+    """查詢解析工作的階段與進度；完成時一併回傳解析結果"""
+    job = parse_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "找不到解析工作"}), 404
+    return jsonify({"success": True, "data": job.to_dict(include_result=job.status == "done")})
+
+
+@app.route('/api/parse-cache', methods=['GET'])
+def get_parse_cache_stats():
+    """取得解析快取使用狀況"""
+    return jsonify({"success": True, "data": parse_cache.stats()})
+
+
+@app.route('/api/parse-cache', methods=['DELETE'])
+@app.route('/api/parse-cache/<key>', methods=['DELETE'])
+def invalidate_parse_cache(key=None):
+    """清除解析快取（指定快取鍵或檔案雜湊；未指定則全部清除）"""
+    removed = parse_cache.invalidate(key)
+    return jsonify({"success": True, "removed": removed})
 
 
 # ==================== 牆類型 API ====================
@@ -329,8 +487,10 @@ def detect_parallel_walls(project_id):
     category_ids = data.get('category_ids')  # 可選，None 表示全部
     auto_apply = data.get('auto_apply', False)
 
-    # 偵測所有平行線對
-    all_pairs = merger.find_all_parallel_pairs(project_id, category_ids)
+    # 只比對已分類的牆線段（指定 category_ids 時只比對這些類型）；
+    # 平行牆對索引只重新比對上次偵測後有變更的線段及其鄰近線段
+    db.refresh_parallel_pairs(project_id, category_ids)
+    all_pairs = db.get_parallel_pairs(project_id, category_ids)
 
     # 轉換為可序列化格式
     result = {}
@@ -457,7 +617,7 @@ def get_summary(project_id):
 def get_floor_summary(floor_id):
     """取得指定樓層的統計摘要"""
     # Get project_id from floor
-    cursor = db.conn.cursor()
+    cursor = db.reader.cursor()
     cursor.execute("""
         SELECT b.project_id
         FROM floors f
@@ -483,7 +643,7 @@ def get_floor_summary(floor_id):
 def get_building_summary(building_id):
     """取得指定棟別的統計摘要（所有樓層合計）"""
     # Get project_id from building
-    cursor = db.conn.cursor()
+    cursor = db.reader.cursor()
     cursor.execute("SELECT project_id FROM buildings WHERE id = ?", (building_id,))
     row = cursor.fetchone()
     if not row:
@@ -556,7 +716,10 @@ if __name__ == '__main__':
     print("    PUT  /api/categories/<id>                   - 更新牆類型")
     print("\n  檔案處理:")
     print("    POST /api/upload                            - 上傳 DXF 檔案")
-    print("    POST /api/parse                             - 解析 DXF 並建立專案")
+    print("    POST /api/parse                             - 建立背景解析工作")
+    print("    GET  /api/parse/jobs/<job_id>               - 查詢解析進度與結果")
+    print("    GET  /api/parse-cache                       - 解析快取使用狀況")
+    print("    DELETE /api/parse-cache[/<key>]             - 清除解析快取")
     print("\n  牆體合併:")
     print("    PUT  /api/categories/<id>/thickness         - 設定牆厚度")
     print("    POST /api/projects/<id>/detect-parallels    - 偵測平行牆")
@@ -0,0 +1,124 @@
+"""
+Database Import Benchmark
+量測線段匯入資料庫的耗時：逐筆 execute（舊版）vs executemany 批次匯入，
+並列出匯入後的資料庫大小
+
+用法:
+    python bench_database.py                        # 預設 10,000 / 100,000 / 1,000,000 筆
+    python bench_database.py --sizes 10000,50000
+    python bench_database.py --skip-legacy          # 不執行逐筆匯入（大量資料時很慢）
+"""
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import tempfile
+import time
+
+import numpy as np
+
+from database import DatabaseManager, encode_vertices
+from segment_store import SegmentStore
+
+LAYERS = ["A-WALL-EXT", "A-WALL-INT", "A-WALL-RC", "S-COL", "A-ANNO"]
+
+
+def generate_segments(count: int, seed: int = 42) -> SegmentStore:
+    """產生測試線段：70% 直線、30% 3~6 點的多段線"""
+    rng = np.random.default_rng(seed)
+    starts = rng.uniform(0, 200000, (count, 2)).tolist()
+    deltas = rng.uniform(-6000, 6000, (count, 2)).tolist()
+    layers = rng.integers(0, len(LAYERS), count).tolist()
+    kinds = (rng.random(count) < 0.3).tolist()
+    sizes = rng.integers(3, 7, count).tolist()
+
+    store = SegmentStore()
+    for (x, y), (dx, dy), layer, is_polyline, size in zip(starts, deltas, layers, kinds, sizes):
+        if is_polyline:
+            vertices = [(x + dx * k / size, y + dy * (k % 2)) for k in range(size)]
+            store.append((LAYERS[layer], "LWPOLYLINE", vertices[0], vertices[-1], None, vertices))
+        else:
+            store.append((LAYERS[layer], "LINE", (x, y), (x + dx, y + dy), None, None))
+    store.fill_lengths()
+    return store
+
+
+@contextlib.contextmanager
+def fresh_database():
+    """每項測試使用新的資料庫檔案（隱藏連線訊息）"""
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bench.db")
+    with contextlib.redirect_stdout(io.StringIO()):
+        db = DatabaseManager(path)
+        project_id = db.create_project("bench")
+    try:
+        yield db, project_id, path
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            db.close()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+def legacy_import(db: DatabaseManager, project_id: int, segments) -> int:
+    """舊版匯入：每筆線段一次 cursor.execute，逐筆捕捉 IntegrityError"""
+    cursor = db.conn.cursor()
+    mappings = db.get_layer_mappings(project_id)
+    count = 0
+    for seg in segments:
+        vertices = encode_vertices(seg['vertices']) if seg.get('vertices') else None
+        try:
+            cursor.execute("""
+                INSERT INTO wall_segments
+                (project_id, floor_id, segment_uid, dxf_layer, category_id, entity_type,
+                 start_x, start_y, end_x, end_y, length, vertices)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (project_id, None, seg['id'], seg['layer'], mappings.get(seg.get('layer')),
+                  seg['entity_type'], seg['start_point'][0], seg['start_point'][1],
+                  seg['end_point'][0], seg['end_point'][1], seg['length'], vertices))
+            count += 1
+        except sqlite3.IntegrityError:
+            pass
+    db.conn.commit()
+    return count
+
+
+def bench_size(count: int, skip_legacy: bool):
+    store = generate_segments(count)
+    print(f"  {count:,} 筆線段")
+
+    cases = []
+    if not skip_legacy:
+        cases.append(("逐筆 execute (dict)", lambda db, pid: legacy_import(db, pid, store.to_dicts())))
+    cases.append(("executemany (dict)", lambda db, pid: db.import_segments(pid, store.to_dicts())))
+    cases.append(("executemany (欄位陣列)", lambda db, pid: db.import_segments(pid, store)))
+
+    baseline = None
+    for label, run in cases:
+        with fresh_database() as (db, project_id, path):
+            t0 = time.perf_counter()
+            inserted = run(db, project_id)
+            elapsed = time.perf_counter() - t0
+            db.conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            size_mb = os.path.getsize(path) / 1e6
+        assert inserted == count, f"{label}: 匯入 {inserted} 筆，預期 {count} 筆"
+        baseline = baseline or elapsed
+        print(f"    {label:<22}: {elapsed:8.3f} s  ({count / elapsed:>10,.0f} 筆/秒, "
+              f"x{baseline / elapsed:.1f})  {size_mb:8.1f} MB")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="線段匯入效能測試")
+    arg_parser.add_argument("--sizes", default="10000,100000,1000000", help="測試的線段數列表")
+    arg_parser.add_argument("--skip-legacy", action="store_true", help="不執行逐筆匯入")
+    args = arg_parser.parse_args()
+
+    print("=== 線段匯入效能測試 ===")
+    for size in (int(n) for n in args.sizes.split(",")):
+        bench_size(size, args.skip_legacy)
+
+
+if __name__ == "__main__":
+    main()
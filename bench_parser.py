@@ -0,0 +1,314 @@
+"""
+DXF Parser Benchmark
+產生大型測試 DXF 並量測解析各階段的耗時
+
+用法:
+    python bench_parser.py                   # 預設 300,000 個實體
+    python bench_parser.py --entities 50000
+    python bench_parser.py --keep bench.dxf  # 保留產生的檔案供重複測試
+    python bench_parser.py --entities 1000000 --parallel --workers 1,2,4,8,16
+                                             # 平行提取的擴展性測試
+    python bench_parser.py --lengths 1000000  # 長度計算：逐筆 vs 批次 (NumPy)
+    python bench_parser.py --pairs 1000000    # 平行牆對判斷：逐對 vs 批次 (NumPy)
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import ezdxf
+import numpy as np
+
+from dxf_parser import DXFParser, ENTITY_ORDER
+from geometry_utils import find_parallel_pair, line_lengths, parallel_pair_batch, polyline_lengths
+
+WALL_LAYERS = ["A-WALL-EXT", "A-WALL-INT", "A-WALL-RC"]
+OTHER_LAYERS = ["S-COL", "A-ANNO", "A-FURN", "A-HATCH"]
+
+
+def generate_dxf(path: str, entity_count: int, seed: int = 42):
+    """產生包含各類型實體的大型 DXF 檔案（類似結構平面圖的組成比例）"""
+    random.seed(seed)
+    doc = ezdxf.new('R2018')
+    msp = doc.modelspace()
+
+    for name in WALL_LAYERS + OTHER_LAYERS:
+        doc.layers.new(name)
+
+    # 常見的門、柱圖塊
+    door = doc.blocks.new("DOOR")
+    door.add_line((0, 0), (900, 0), dxfattribs={'layer': '0'})
+    door.add_arc((0, 0), 900, 0, 90, dxfattribs={'layer': '0'})
+    column = doc.blocks.new("COLUMN")
+    column.add_lwpolyline([(0, 0), (600, 0), (600, 600), (0, 600), (0, 0)], dxfattribs={'layer': '0'})
+
+    layers = WALL_LAYERS + OTHER_LAYERS
+    for _ in range(entity_count):
+        layer = random.choice(layers)
+        attribs = {'layer': layer}
+        x = random.uniform(0, 200000)
+        y = random.uniform(0, 200000)
+        r = random.random()
+
+        if r < 0.60:
+            msp.add_line((x, y), (x + random.uniform(-6000, 6000), y + random.uniform(-6000, 6000)),
+                         dxfattribs=attribs)
+        elif r < 0.80:
+            msp.add_lwpolyline([(x, y), (x + 3000, y), (x + 3000, y + 1500)], dxfattribs=attribs)
+        elif r < 0.85:
+            msp.add_arc((x, y), random.uniform(50, 3000), random.uniform(0, 360),
+                        random.uniform(0, 360), dxfattribs=attribs)
+        elif r < 0.90:
+            msp.add_circle((x, y), random.uniform(25, 300), dxfattribs=attribs)
+        elif r < 0.92:
+            msp.add_spline([(x, y), (x + 300, y + 800), (x + 1200, y - 400), (x + 2000, y)],
+                           dxfattribs=attribs)
+        elif r < 0.93:
+            msp.add_polyline2d([(x, y), (x + 800, y), (x + 800, y + 800)], dxfattribs=attribs)
+        else:
+            block = "DOOR" if r < 0.97 else "COLUMN"
+            attribs['rotation'] = random.choice([0, 90, 180, 270])
+            msp.add_blockref(block, (x, y), dxfattribs=attribs)
+
+    doc.saveas(path)
+
+
+@contextlib.contextmanager
+def quiet():
+    """隱藏解析器的進度輸出"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def timed(func, repeat: int = 1):
+    """回傳 (最佳耗時秒數, 最後一次結果)"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - t0)
+    return best, result
+
+
+def bench_modelspace_scan(parser: DXFParser, repeat: int):
+    """比較逐類型查詢（舊版七次掃描）與單次走訪分派的掃描成本"""
+    msp = parser.doc.modelspace()
+
+    def per_type_queries():
+        count = 0
+        for entity_type in ENTITY_ORDER:
+            for entity in msp.query(entity_type):
+                entity.dxf.layer.startswith("A-WALL")
+                count += 1
+        return count
+
+    def single_pass():
+        wanted = set(ENTITY_ORDER)
+        layer_cache = {}
+        count = 0
+        for entity in msp:
+            if entity.dxftype() not in wanted:
+                continue
+            layer = entity.dxf.layer
+            if layer not in layer_cache:
+                layer_cache[layer] = layer.startswith("A-WALL")
+            count += 1
+        return count
+
+    t_query, n_query = timed(per_type_queries, repeat)
+    t_single, n_single = timed(single_pass, repeat)
+    assert n_query == n_single
+
+    print(f"  模型空間掃描 ({n_single:,} 個實體)")
+    print(f"    逐類型查詢 x{len(ENTITY_ORDER)}: {t_query:8.3f} s")
+    print(f"    單次走訪分派:    {t_single:8.3f} s  (x{t_query / t_single:.1f})")
+
+
+def bench_extract(loaded: DXFParser, repeat: int):
+    """量測完整的 extract_wall_entities 耗時（共用已載入的文件）"""
+    for prefix in ("A-WALL", None):
+        def run():
+            parser = DXFParser(loaded.filepath)
+            parser.doc = loaded.doc
+            with quiet():
+                return parser.extract_wall_entities(wall_layer_prefix=prefix)
+
+        t, segments = timed(run, repeat)
+        label = prefix or "(全部圖層)"
+        print(f"  extract_wall_entities {label:<12}: {t:8.3f} s  ({len(segments):,} 條線段)")
+
+
+def bench_streaming_memory(path: str):
+    """比較完整載入與串流模式的尖峰記憶體用量（只計數線段，不保留）"""
+    def full_load():
+        parser = DXFParser(path)
+        with quiet():
+            parser.load()
+            return len(parser.extract_wall_entities(wall_layer_prefix=None))
+
+    def streaming():
+        parser = DXFParser(path)
+        with quiet():
+            return sum(1 for _ in parser.iter_wall_entities_streaming(wall_layer_prefix=None))
+
+    print("  尖峰記憶體 (tracemalloc)")
+    for label, func in (("load + extract", full_load), ("串流模式", streaming)):
+        tracemalloc.start()
+        t0 = time.perf_counter()
+        count = func()
+        elapsed = time.perf_counter() - t0
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"    {label:<16}: {peak / 1024 / 1024:8.1f} MB  {elapsed:8.3f} s  ({count:,} 條線段)")
+
+
+def bench_parallel_scaling(path: str, workers_list):
+    """平行提取在不同行程數下的耗時（以單行程為基準計算加速比）"""
+    print(f"  平行提取擴展性 (CPU 核心數: {os.cpu_count()})")
+    baseline = None
+    expected = None
+    for workers in workers_list:
+        def run():
+            parser = DXFParser(path)
+            with quiet():
+                return parser.extract_wall_entities_parallel(wall_layer_prefix=None, workers=workers)
+
+        t, segments = timed(run)
+        # 各行程數的結果必須完全相同
+        ids = [(seg.id, seg.layer, seg.start_point) for seg in segments]
+        if expected is None:
+            expected = ids
+        assert ids == expected, f"{workers} 個行程的結果與單行程不同"
+
+        baseline = baseline or t
+        print(f"    {workers:>3} 個行程: {t:8.3f} s  (x{baseline / t:.2f}, {len(segments):,} 條線段)")
+
+
+def bench_length_kernels(segment_count: int, repeat: int = 3):
+    """長度計算：逐筆 math.sqrt 與批次 NumPy 核心的比較（直線與 3~10 點的多段線）"""
+    rng = np.random.default_rng(42)
+    parser = DXFParser("")
+    print(f"  長度計算 ({segment_count:,} 條線段)")
+
+    starts = rng.uniform(0, 200000, (segment_count, 2))
+    ends = starts + rng.uniform(-6000, 6000, (segment_count, 2))
+    start_list = list(map(tuple, starts.tolist()))
+    end_list = list(map(tuple, ends.tolist()))
+
+    sizes = rng.integers(3, 11, segment_count)
+    offsets = np.concatenate(([0], np.cumsum(sizes)))
+    points = rng.uniform(0, 200000, (int(offsets[-1]), 2))
+    point_list = list(map(tuple, points.tolist()))
+    offset_list = offsets.tolist()
+    polylines = [point_list[offset_list[i]:offset_list[i + 1]] for i in range(segment_count)]
+
+    cases = (
+        ("LINE",
+         lambda: [parser._calculate_length(s, e) for s, e in zip(start_list, end_list)],
+         lambda: line_lengths(starts, ends)),
+        ("POLYLINE",
+         lambda: [parser._calculate_polyline_length(v) for v in polylines],
+         lambda: polyline_lengths(points, offsets)),
+    )
+    for label, scalar, batched in cases:
+        t_scalar, expected = timed(scalar, repeat)
+        t_batched, actual = timed(batched, repeat)
+        worst = float(np.max(np.abs(actual - expected) / np.maximum(np.abs(expected), 1e-300)))
+        print(f"    {label:<10} 逐筆: {t_scalar:8.3f} s  批次: {t_batched:8.3f} s  "
+              f"(x{t_scalar / t_batched:.1f}, 最大相對誤差 {worst:.1e})")
+
+
+def bench_pair_kernel(pair_count: int, repeat: int = 3):
+    """平行牆對判斷：逐對 find_parallel_pair 與批次核心的比較（約三成候選取自相鄰的平行線）"""
+    rng = np.random.default_rng(42)
+    segment_count = max(pair_count // 10, 2)
+    print(f"  平行牆對判斷 ({pair_count:,} 個候選對, {segment_count:,} 條線段)")
+
+    # 每條線段旁放一條平行線，距離在牆厚附近；候選對一部分取相鄰的平行線，其餘隨機
+    half = segment_count // 2
+    angles = rng.choice([0.0, np.pi / 2, rng.uniform(0, np.pi)], half)
+    directions = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    normals = np.stack([-directions[:, 1], directions[:, 0]], axis=1)
+    origins = rng.uniform(0, 200000, (half, 2))
+    spans = rng.uniform(500, 8000, (half, 1))
+    gaps = 150 + rng.uniform(-2, 2, (half, 1))
+    starts = np.concatenate([origins, origins + normals * gaps + directions * spans * 0.1])
+    ends = np.concatenate([origins + directions * spans, origins + normals * gaps + directions * spans])
+    lengths = np.hypot(*(ends - starts).T)
+    segments = [{'id': i, 'start_x': sx, 'start_y': sy, 'end_x': ex, 'end_y': ey, 'length': length}
+                for i, ((sx, sy), (ex, ey), length)
+                in enumerate(zip(starts.tolist(), ends.tolist(), lengths.tolist()))]
+
+    partner = rng.integers(0, half, pair_count)
+    neighbour = rng.random(pair_count) < 0.3
+    first = np.where(neighbour, partner, rng.integers(0, len(segments), pair_count))
+    second = np.where(neighbour, partner + half, rng.integers(0, len(segments), pair_count))
+    pair_list = list(zip(first.tolist(), second.tolist()))
+
+    def scalar():
+        return [pair for pair in (find_parallel_pair(segments[i], segments[j], 150.0)
+                                  for i, j in pair_list) if pair is not None]
+
+    t_scalar, expected = timed(scalar, repeat)
+    t_batched, actual = timed(lambda: parallel_pair_batch(starts, ends, lengths, first, second, 150.0), repeat)
+    assert len(actual) == len(expected)
+    assert actual["distance"].tolist() == [pair.distance for pair in expected]
+    print(f"    逐對: {t_scalar:8.3f} s  批次: {t_batched:8.3f} s  "
+          f"(x{t_scalar / t_batched:.1f}, {len(actual):,} 對平行牆，結果相同)")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="DXF 解析效能測試")
+    arg_parser.add_argument("--entities", type=int, default=300000, help="產生的實體數量")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="每項測試重複次數（取最佳值）")
+    arg_parser.add_argument("--keep", metavar="PATH", help="保留產生的 DXF 檔案於指定路徑")
+    arg_parser.add_argument("--parallel", action="store_true", help="執行平行提取擴展性測試")
+    arg_parser.add_argument("--workers", default="1,2,4,8,16", help="擴展性測試的行程數列表")
+    arg_parser.add_argument("--lengths", type=int, metavar="N",
+                            help="只執行長度計算的微基準測試（N 條線段）")
+    arg_parser.add_argument("--pairs", type=int, metavar="N",
+                            help="只執行平行牆對判斷的微基準測試（N 個候選對）")
+    args = arg_parser.parse_args()
+
+    if args.lengths:
+        print("=== 長度計算效能測試 ===")
+        bench_length_kernels(args.lengths, args.repeat)
+        return
+    if args.pairs:
+        print("=== 平行牆對判斷效能測試 ===")
+        bench_pair_kernel(args.pairs, args.repeat)
+        return
+
+    path = args.keep or os.path.join(tempfile.mkdtemp(), "bench.dxf")
+    if not os.path.exists(path):
+        print(f"產生測試檔案 ({args.entities:,} 個實體)...")
+        t, _ = timed(lambda: generate_dxf(path, args.entities))
+        print(f"  完成: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB, {t:.1f} s)")
+
+    print("\n載入 DXF...")
+    parser = DXFParser(path)
+    with quiet():
+        t, ok = timed(parser.load)
+    if not ok:
+        print("[X] 載入失敗")
+        return
+    print(f"  load: {t:.3f} s")
+
+    print("\n=== 效能測試 ===")
+    bench_modelspace_scan(parser, args.repeat)
+    bench_extract(parser, args.repeat)
+    bench_streaming_memory(path)
+    if args.parallel:
+        bench_parallel_scaling(path, [int(n) for n in args.workers.split(",")])
+
+    if not args.keep:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,27 +2,376 @@
 SQLite Database Manager for Wall Quantity Calculator
 管理專案、牆類型對應、線段資料的儲存與讀取
 """
+import contextlib
+import functools
+import itertools
 import sqlite3
+import struct
+import threading
+import types
 import json
+import zlib
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Tuple, Callable, Iterator, Union
 from pathlib import Path
 
+import numpy as np
+
+from geometry_utils import ParallelPair, parallel_pair_batch, parallel_pair_candidates
+from segment_store import SegmentStore, segment_id
+
+# 等待其他連線（或行程）釋放寫入鎖的秒數
+DB_BUSY_TIMEOUT = 30.0
+
+# 匯入線段時每次 executemany 的筆數（同時也是回報進度的間隔）
+IMPORT_BATCH_SIZE = 5000
+
+# 平行牆對索引：待更新的線段超過此數量時，整個專案重新偵測（比逐一查詢鄰近線段快）
+PAIR_INDEX_MAX_DIRTY = 5000
+
+# 頂點 BLOB 格式：8 bytes 標頭（"VX"、版本、旗標、點數）+ 小端序座標 (x0, y0, x1, y1, ...)
+# 旗標：float32 儲存（有損）、delta（對 IEEE 位元做整數差分，無損）、zlib 壓縮
+VERTEX_FLOAT32 = 0x01
+VERTEX_DELTA = 0x02
+VERTEX_ZLIB = 0x04
+_VERTEX_HEADER = struct.Struct("<2sBBI")
+_VERTEX_MAGIC = b"VX"
+_VERTEX_VERSION = 1
+
+# 預設以 float64 儲存；點數達到此值的多段線改用 delta + zlib（壓縮後較小時才採用）
+VERTEX_COMPRESS_MIN_POINTS = 32
+
+_INSERT_SEGMENT_SQL = """
+    INSERT OR IGNORE INTO wall_segments
+    (project_id, floor_id, segment_uid, dxf_layer, category_id, entity_type,
+     start_x, start_y, end_x, end_y, length, vertices)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+# 統計彙總表 segment_summary 的鍵：未指定樓層 / 未分類以 0 表示（PRIMARY KEY 不能用 NULL 比對）
+_SUMMARY_KEY = {
+    "floor_id": "COALESCE({row}.floor_id, 0)",
+    "category_id": "COALESCE({row}.category_id, 0)",
+    "is_merged": "(COALESCE({row}.is_merged, 0) != 0)",
+}
+
+
+def _summary_add_sql(row: str) -> str:
+    """將一筆線段（NEW / OLD）加入彙總表"""
+    keys = {name: expr.format(row=row) for name, expr in _SUMMARY_KEY.items()}
+    return f"""
+        INSERT INTO segment_summary
+        (project_id, floor_id, category_id, is_merged, segment_count, total_length)
+        VALUES ({row}.project_id, {keys['floor_id']}, {keys['category_id']}, {keys['is_merged']},
+                1, {row}.length)
+        ON CONFLICT(project_id, floor_id, category_id, is_merged) DO UPDATE SET
+            segment_count = segment_count + 1,
+            total_length = total_length + excluded.total_length;
+    """
+
+
+def _summary_remove_sql(row: str) -> str:
+    """將一筆線段（OLD）自彙總表扣除，數量歸零的列直接刪除（避免長度累積誤差）"""
+    match = " AND ".join(
+        [f"project_id = {row}.project_id"]
+        + [f"{name} = {expr.format(row=row)}" for name, expr in _SUMMARY_KEY.items()]
+    )
+    return f"""
+        UPDATE segment_summary
+        SET segment_count = segment_count - 1, total_length = total_length - {row}.length
+        WHERE {match};
+        DELETE FROM segment_summary WHERE {match} AND segment_count <= 0;
+    """
+
+
+def _sql_text(sql: str) -> str:
+    """比較用的 SQL 文字（sqlite_master 保存的定義不含 IF NOT EXISTS，空白可能不同）"""
+    return " ".join(sql.replace("IF NOT EXISTS ", "").split())
+
+
+# 由觸發器維護彙總表：匯入、重新分類、合併（is_merged）等所有寫入路徑都會更新
+# 批次匯入期間（bulk_import_flag 有紀錄）新增的線段由 import_segments 一次累加
+_SUMMARY_TRIGGERS = {
+    "trg_segment_summary_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_segment_summary_insert
+        AFTER INSERT ON wall_segments
+        WHEN NOT EXISTS (SELECT 1 FROM bulk_import_flag)
+        BEGIN {_summary_add_sql("NEW")} END
+    """,
+    "trg_segment_summary_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_segment_summary_delete
+        AFTER DELETE ON wall_segments
+        BEGIN {_summary_remove_sql("OLD")} END
+    """,
+    "trg_segment_summary_update": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_segment_summary_update
+        AFTER UPDATE OF project_id, floor_id, category_id, is_merged, length ON wall_segments
+        WHEN OLD.project_id IS NOT NEW.project_id OR OLD.floor_id IS NOT NEW.floor_id
+          OR OLD.category_id IS NOT NEW.category_id OR OLD.is_merged IS NOT NEW.is_merged
+          OR OLD.length IS NOT NEW.length
+        BEGIN {_summary_remove_sql("OLD")} {_summary_add_sql("NEW")} END
+    """,
+}
+
+# 平行牆對索引（parallel_pairs）：只對建立過索引的專案（parallel_pair_state 有紀錄）維護。
+# 線段新增、幾何、牆類型或合併狀態變更時更新外框 R*Tree（segment_rtree）並標記待更新
+# （parallel_pair_dirty；只有已分類的牆線段參與偵測）；刪除時直接移除相關的牆對。
+# 刪除專案時一併清除該專案的索引。
+_PAIR_INDEX_BOX = """
+    NEW.id, MIN(NEW.start_x, NEW.end_x), MAX(NEW.start_x, NEW.end_x),
+    MIN(NEW.start_y, NEW.end_y), MAX(NEW.start_y, NEW.end_y)
+"""
+_PAIR_INDEX_TRIGGERS = {
+    "trg_pair_index_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_pair_index_insert
+        AFTER INSERT ON wall_segments
+        WHEN EXISTS (SELECT 1 FROM parallel_pair_state WHERE project_id = NEW.project_id)
+          AND NOT EXISTS (SELECT 1 FROM bulk_import_flag)
+        BEGIN
+            INSERT OR REPLACE INTO segment_rtree VALUES ({_PAIR_INDEX_BOX});
+            INSERT OR IGNORE INTO parallel_pair_dirty VALUES (NEW.project_id, NEW.id);
+        END
+    """,
+    "trg_pair_index_update": f"""
+        CREATE TRIGGER IF NOT EXISTS trg_pair_index_update
+        AFTER UPDATE OF start_x, start_y, end_x, end_y, length, category_id, is_merged, merge_excluded
+        ON wall_segments
+        WHEN EXISTS (SELECT 1 FROM parallel_pair_state WHERE project_id = NEW.project_id)
+          AND (OLD.start_x IS NOT NEW.start_x OR OLD.start_y IS NOT NEW.start_y
+            OR OLD.end_x IS NOT NEW.end_x OR OLD.end_y IS NOT NEW.end_y
+            OR OLD.length IS NOT NEW.length OR OLD.category_id IS NOT NEW.category_id
+            OR OLD.is_merged IS NOT NEW.is_merged OR OLD.merge_excluded IS NOT NEW.merge_excluded)
+        BEGIN
+            INSERT OR REPLACE INTO segment_rtree VALUES ({_PAIR_INDEX_BOX});
+            INSERT OR IGNORE INTO parallel_pair_dirty VALUES (NEW.project_id, NEW.id);
+        END
+    """,
+    "trg_pair_index_delete": """
+        CREATE TRIGGER IF NOT EXISTS trg_pair_index_delete
+        AFTER DELETE ON wall_segments
+        BEGIN
+            DELETE FROM segment_rtree WHERE id = OLD.id;
+            DELETE FROM parallel_pairs WHERE segment_a = OLD.id OR segment_b = OLD.id;
+            DELETE FROM parallel_pair_dirty WHERE project_id = OLD.project_id AND segment_id = OLD.id;
+        END
+    """,
+    "trg_pair_index_project_delete": """
+        CREATE TRIGGER IF NOT EXISTS trg_pair_index_project_delete
+        AFTER DELETE ON projects
+        BEGIN
+            DELETE FROM segment_rtree WHERE id IN (SELECT id FROM wall_segments WHERE project_id = OLD.id);
+            DELETE FROM parallel_pairs WHERE project_id = OLD.id;
+            DELETE FROM parallel_pair_dirty WHERE project_id = OLD.id;
+            DELETE FROM parallel_pair_state WHERE project_id = OLD.id;
+        END
+    """,
+}
+
+# 參與平行牆偵測的線段（已分類為牆、未合併、未排除；可限定牆類型），
+# 依 id 排序（與 find_parallel_pairs 的線段順序相同）
+_PAIR_SEGMENT_SQL = """
+    SELECT ws.id, ws.start_x, ws.start_y, ws.end_x, ws.end_y, ws.length
+    FROM {source}
+    WHERE ws.project_id = :project_id AND ws.category_id IS NOT NULL
+      AND (:category_ids IS NULL OR ws.category_id IN (SELECT value FROM json_each(:category_ids)))
+      AND COALESCE(ws.is_merged, 0) = 0 AND COALESCE(ws.merge_excluded, 0) = 0
+    ORDER BY ws.id
+"""
+
+# 待更新線段外框附近的線段（R*Tree 查詢）；CROSS JOIN 固定由鄰近線段依主鍵查線段表
+_PAIR_NEIGHBOUR_SOURCE = """
+    (SELECT DISTINCT r.id FROM parallel_pair_dirty d
+     JOIN segment_rtree q ON q.id = d.segment_id
+     JOIN segment_rtree r ON r.min_x <= q.max_x + :margin AND r.max_x >= q.min_x - :margin
+         AND r.min_y <= q.max_y + :margin AND r.max_y >= q.min_y - :margin
+     WHERE d.project_id = :project_id) AS near
+    CROSS JOIN wall_segments ws ON ws.id = near.id
+"""
+
+# 以 GROUP BY 將 wall_segments 的資料列累加進彙總表（重建與批次匯入使用）
+_SUMMARY_AGGREGATE_SQL = """
+    INSERT INTO segment_summary
+    (project_id, floor_id, category_id, is_merged, segment_count, total_length)
+    SELECT project_id, {floor_id}, {category_id}, {is_merged}, COUNT(*), SUM(length)
+    FROM wall_segments AS ws
+    WHERE {where}
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT(project_id, floor_id, category_id, is_merged) DO UPDATE SET
+        segment_count = segment_count + excluded.segment_count,
+        total_length = total_length + excluded.total_length
+"""
+
+
+def encode_vertices(points, float32: bool = False,
+                    compress_min_points: Optional[int] = None) -> Optional[bytes]:
+    """
+    頂點 → BLOB；沒有頂點時回傳 None
+    compress_min_points 為 None 時使用 VERTEX_COMPRESS_MIN_POINTS
+    """
+    coords = np.ascontiguousarray(points, dtype="<f4" if float32 else "<f8").reshape(-1, 2)
+    count = len(coords)
+    if count == 0:
+        return None
+    flags = VERTEX_FLOAT32 if float32 else 0
+    payload = coords.tobytes()
+
+    if compress_min_points is None:
+        compress_min_points = VERTEX_COMPRESS_MIN_POINTS
+    if count >= compress_min_points:
+        # 相鄰座標的位元樣式相近，差分後多為小整數，壓縮率遠高於直接壓縮浮點數
+        bits = coords.view("<i4" if float32 else "<i8")
+        deltas = np.diff(bits, axis=0, prepend=np.zeros((1, 2), dtype=bits.dtype))
+        packed = zlib.compress(deltas.tobytes(), 6)
+        if len(packed) < len(payload):
+            flags |= VERTEX_DELTA | VERTEX_ZLIB
+            payload = packed
+
+    return _VERTEX_HEADER.pack(_VERTEX_MAGIC, _VERTEX_VERSION, flags, count) + payload
+
+
+def decode_vertices(blob) -> Optional[np.ndarray]:
+    """
+    BLOB → (N, 2) 陣列；未壓縮的 float64 直接引用 BLOB 的記憶體（唯讀、不複製）
+    """
+    if blob is None:
+        return None
+    magic, version, flags, count = _VERTEX_HEADER.unpack_from(blob)
+    if magic != _VERTEX_MAGIC or version != _VERTEX_VERSION:
+        raise ValueError(f"無法辨識的頂點資料格式: {bytes(blob[:4])!r}")
+    dtype = np.dtype("<f4" if flags & VERTEX_FLOAT32 else "<f8")
+    if flags & VERTEX_ZLIB:
+        data = zlib.decompress(memoryview(blob)[_VERTEX_HEADER.size:])
+        coords = np.frombuffer(data, dtype=dtype)
+    else:
+        coords = np.frombuffer(blob, dtype=dtype, count=count * 2, offset=_VERTEX_HEADER.size)
+    coords = coords.reshape(count, 2)
+    if flags & VERTEX_DELTA:
+        int_type = "<i4" if flags & VERTEX_FLOAT32 else "<i8"
+        coords = np.cumsum(coords.view(int_type), axis=0, dtype=int_type).view(dtype)
+    return coords
+
+
+def _dict_rows(project_id: int, floor_id: Optional[int], segments: List[dict],
+               mappings: Dict[str, Optional[int]]) -> Iterator[tuple]:
+    """線段 dict → wall_segments 資料列"""
+    for seg in segments:
+        vertices = seg.get('vertices')
+        yield (project_id, floor_id, seg['id'], seg['layer'], mappings.get(seg.get('layer')),
+               seg['entity_type'], seg['start_point'][0], seg['start_point'][1],
+               seg['end_point'][0], seg['end_point'][1], seg['length'],
+               encode_vertices(vertices) if vertices else None)
+
+
+def _store_rows(project_id: int, floor_id: Optional[int], store: SegmentStore,
+                mappings: Dict[str, Optional[int]]) -> Iterator[tuple]:
+    """
+    SegmentStore 欄位陣列 → wall_segments 資料列（與 to_dicts 後再匯入的結果相同）
+    尚未離散化的弧線與凸度多段線先批次離散化
+    """
+    store.tessellate()
+    layer_names = store.layers.names
+    categories = [mappings.get(name) for name in layer_names]
+    type_names = store.types.names
+    layer_codes = store.layer_codes.tolist()
+    type_codes = store.type_codes.tolist()
+    starts = store.start.tolist()
+    ends = store.end.tolist()
+    lengths = store.length.tolist()
+    offsets = store.vertex_offsets_array.tolist()
+    vertex_buffer = np.ascontiguousarray(store.vertex_buffer, dtype="<f8")
+    vertex_bytes = vertex_buffer.tobytes()
+    point_size = vertex_buffer.itemsize * 2
+    compress_min_points = VERTEX_COMPRESS_MIN_POINTS
+
+    for i, ((x0, y0), (x1, y1), length) in enumerate(zip(starts, ends, lengths)):
+        lo, hi = offsets[i], offsets[i + 1]
+        layer = layer_codes[i]
+        if hi == lo:
+            blob = None
+        elif hi - lo >= compress_min_points:
+            blob = encode_vertices(vertex_buffer[lo:hi])
+        else:
+            # 未壓縮格式：標頭 + 原始位元組，不經過 numpy 逐筆轉換
+            blob = (_VERTEX_HEADER.pack(_VERTEX_MAGIC, _VERTEX_VERSION, 0, hi - lo)
+                    + vertex_bytes[lo * point_size:hi * point_size])
+        yield (project_id, floor_id, segment_id(i), layer_names[layer], categories[layer],
+               type_names[type_codes[i]], x0, y0, x1, y1, length, blob)
+
+
+def _writes(method):
+    """寫入方法：同一行程內的寫入依序進行（SQLite 同時只允許一個寫入者），讀取不受影響"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._write_lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class DatabaseManager:
-    """SQLite 資料庫管理器"""
+    """
+    SQLite 資料庫管理器
+
+    每個執行緒使用自己的連線（寫入用 conn、唯讀用 reader），資料庫使用 WAL 模式：
+    大量匯入進行中時，其他執行緒的查詢讀取最後一次提交的資料，不必等待匯入完成。
+    寫入方法以行程內的寫入鎖依序進行；跨行程的寫入衝突由 busy timeout 等待。
+    結束的執行緒的連線在下次建立連線時關閉。
+    """
     
-    def __init__(self, db_path: str = "wall_calculator.db"):
+    def __init__(self, db_path: str = "wall_calculator.db", busy_timeout: float = DB_BUSY_TIMEOUT):
         self.db_path = db_path
-        self.conn = None
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._shared = types.SimpleNamespace()
+        self._pool: Dict[int, Tuple[threading.Thread, List[sqlite3.Connection]]] = {}
+        self._pool_lock = threading.Lock()
+        self._write_lock = threading.RLock()
         self._connect()
         self._create_tables()
     
     def _connect(self):
-        """建立資料庫連線"""
-        # 使用 check_same_thread=False 允許多線程使用（Flask 會自動處理並發）
-        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row  # 讓查詢結果可以用欄位名稱存取
-        print(f"[OK] 已連接資料庫: {self.db_path}")
+        """建立資料庫連線並切換為 WAL 模式（設定保存在資料庫檔案中）"""
+        journal_mode = self.conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        print(f"[OK] 已連接資料庫: {self.db_path} (journal_mode={journal_mode})")
+    
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """目前執行緒的寫入連線"""
+        local = self._shared if self.db_path == ":memory:" else self._local
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = self._open(read_only=False)
+        return conn
+    
+    @property
+    def reader(self) -> sqlite3.Connection:
+        """目前執行緒的唯讀連線（query_only，不會取得寫入鎖）"""
+        if self.db_path == ":memory:":
+            return self.conn  # 記憶體資料庫無法跨連線共用，所有執行緒共用一條連線
+        reader = getattr(self._local, "reader", None)
+        if reader is None:
+            reader = self._local.reader = self._open(read_only=True)
+        return reader
+    
+    def _open(self, read_only: bool) -> sqlite3.Connection:
+        # check_same_thread=False：close() 可從其他執行緒關閉連線
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False)
+        conn.row_factory = sqlite3.Row  # 讓查詢結果可以用欄位名稱存取
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        else:
+            conn.execute("PRAGMA synchronous = NORMAL")  # WAL 模式下仍可保證資料庫一致
+        
+        thread = threading.current_thread()
+        with self._pool_lock:
+            # 順便關閉已結束執行緒的連線
+            for ident, (owner, connections) in list(self._pool.items()):
+                if not owner.is_alive():
+                    for stale in connections:
+                        stale.close()
+                    del self._pool[ident]
+            self._pool.setdefault(thread.ident, (thread, []))[1].append(conn)
+        return conn
     
     def _create_tables(self):
         """建立資料表結構"""
@@ -119,7 +468,7 @@ class DatabaseManager:
                 end_x REAL NOT NULL,
                 end_y REAL NOT NULL,
                 length REAL NOT NULL,
-                vertices_json TEXT,
+                vertices BLOB,
                 is_modified INTEGER DEFAULT 0,
                 is_merged INTEGER DEFAULT 0,
                 merged_into_id INTEGER DEFAULT NULL,
@@ -170,20 +519,108 @@ class DatabaseManager:
             )
         """)
 
+        # 統計彙總表 - 依 (專案, 樓層, 牆類型, 是否已合併) 預先累計線段數與長度，
+        # 統計查詢不必每次掃描 wall_segments；由 wall_segments 的觸發器維護
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS segment_summary (
+                project_id INTEGER NOT NULL,
+                floor_id INTEGER NOT NULL DEFAULT 0,
+                category_id INTEGER NOT NULL DEFAULT 0,
+                is_merged INTEGER NOT NULL DEFAULT 0,
+                segment_count INTEGER NOT NULL DEFAULT 0,
+                total_length REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (project_id, floor_id, category_id, is_merged)
+            ) WITHOUT ROWID
+        """)
+
+        # 平行牆對索引 - 與 merged_segments 相同的欄位，另記錄符合的牆類型；
+        # segment_a < segment_b（候選對的 seg1 / seg2），由 refresh_parallel_pairs 增量維護
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS parallel_pairs (
+                segment_a INTEGER NOT NULL,
+                segment_b INTEGER NOT NULL,
+                project_id INTEGER NOT NULL,
+                category_id INTEGER NOT NULL,
+                primary_segment_id INTEGER NOT NULL,
+                secondary_segment_id INTEGER NOT NULL,
+                parallel_distance REAL NOT NULL,
+                overlap_length REAL NOT NULL,
+                overlap_start_x REAL NOT NULL,
+                overlap_start_y REAL NOT NULL,
+                overlap_end_x REAL NOT NULL,
+                overlap_end_y REAL NOT NULL,
+                t_start REAL NOT NULL,
+                t_end REAL NOT NULL,
+                PRIMARY KEY (segment_a, segment_b)
+            ) WITHOUT ROWID
+        """)
+        # 各專案建立索引時的牆厚表與參數；不同時整個專案重新偵測
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS parallel_pair_state (
+                project_id INTEGER PRIMARY KEY,
+                settings TEXT NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS parallel_pair_dirty (
+                project_id INTEGER NOT NULL,
+                segment_id INTEGER NOT NULL,
+                PRIMARY KEY (project_id, segment_id)
+            ) WITHOUT ROWID
+        """)
+        # 批次匯入進行中的旗標（見 import_segments）
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS bulk_import_flag (
+                active INTEGER PRIMARY KEY
+            )
+        """)
+        # 線段外框（查詢鄰近線段）
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS segment_rtree
+            USING rtree(id, min_x, max_x, min_y, max_y)
+        """)
+
         self.conn.commit()
 
         # 執行資料庫遷移（為既有資料表新增欄位）- 必須在建立索引之前
         self._migrate_database()
 
+        # 彙總表與平行牆對索引的觸發器（遷移之後，確保 is_merged、merge_excluded 欄位存在）
+        # 定義已變更的觸發器（舊版資料庫）移除後重新建立
+        existing = dict(cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"))
+        for name, trigger_sql in (*_SUMMARY_TRIGGERS.items(), *_PAIR_INDEX_TRIGGERS.items()):
+            if name in existing and _sql_text(existing[name]) != _sql_text(trigger_sql):
+                cursor.execute(f"DROP TRIGGER {name}")
+            cursor.execute(trigger_sql)
+        has_summary = cursor.execute("SELECT EXISTS(SELECT 1 FROM segment_summary)").fetchone()[0]
+        has_segments = cursor.execute("SELECT EXISTS(SELECT 1 FROM wall_segments)").fetchone()[0]
+        if has_segments and not has_summary:
+            self._rebuild_summaries(cursor)
+            print("[OK] 已建立統計彙總表")
+
         # 建立索引以提升查詢效能（在遷移之後，確保欄位存在）
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_segments_category
-            ON wall_segments(category_id)
-        """)
+        # 舊版的 idx_segments_category(category_id) 已由 idx_segments_project_category 取代
+        # （所有依牆類型的查詢都同時指定專案），移除以減少匯入時的索引維護
+        cursor.execute("DROP INDEX IF EXISTS idx_segments_category")
         cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_segments_merged
             ON wall_segments(is_merged, merged_into_id)
         """)
+        # 依專案 + 牆類型篩選線段（get_segments）；未分類統計（category_id IS NULL
+        # GROUP BY dxf_layer）可直接依索引順序彙總，不必回表
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_segments_project_category
+            ON wall_segments(project_id, category_id, dxf_layer, length)
+        """)
+        # 彙總表：依牆類型（分類 / 樓層 / 棟別統計）與依樓層（分棟分樓層統計）查詢
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_summary_category
+            ON segment_summary(category_id, floor_id, segment_count, total_length)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_summary_floor
+            ON segment_summary(floor_id, category_id, segment_count, total_length)
+        """)
         cursor.execute("""
             CREATE INDEX IF NOT EXISTS idx_merged_primary
             ON merged_segments(primary_segment_id)
@@ -192,6 +629,15 @@ class DatabaseManager:
             CREATE INDEX IF NOT EXISTS idx_merged_secondary
             ON merged_segments(merged_segment_id)
         """)
+        # 依專案取出牆對；刪除線段時依 segment_b 找出牆對
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_pairs_project
+            ON parallel_pairs(project_id, category_id)
+        """)
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_pairs_segment_b
+            ON parallel_pairs(segment_b)
+        """)
 
         self.conn.commit()
 
@@ -218,10 +664,38 @@ class DatabaseManager:
             cursor.execute("ALTER TABLE wall_segments ADD COLUMN merge_excluded INTEGER DEFAULT 0")
             print("[OK] 已新增 wall_segments 合併相關欄位")
 
+        # 頂點由 JSON 文字 (vertices_json) 改為二進位 BLOB (vertices)
+        columns = {row['name'] for row in cursor.execute("PRAGMA table_info(wall_segments)")}
+        if 'vertices' not in columns:
+            cursor.execute("ALTER TABLE wall_segments ADD COLUMN vertices BLOB")
+        if 'vertices_json' in columns:
+            converted = self._migrate_vertices_json(cursor)
+            if converted:
+                print(f"[OK] 已將 {converted} 筆線段的頂點轉為二進位格式（可執行 VACUUM 釋放空間）")
+
         self.conn.commit()
 
+    def _migrate_vertices_json(self, cursor) -> int:
+        """vertices_json → vertices BLOB，轉換後清空舊欄位；回傳轉換筆數"""
+        count = 0
+        while True:
+            # 轉換過的列已清空 vertices_json，每次重新查詢下一批
+            rows = cursor.execute(
+                "SELECT id, vertices_json FROM wall_segments WHERE vertices_json IS NOT NULL LIMIT ?",
+                (IMPORT_BATCH_SIZE,)
+            ).fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                "UPDATE wall_segments SET vertices = ?, vertices_json = NULL WHERE id = ?",
+                [(encode_vertices(json.loads(text)) if text else None, seg_id) for seg_id, text in rows]
+            )
+            count += len(rows)
+        return count
+
     # ==================== 專案管理 ====================
     
+    @_writes
     def create_project(self, name: str, source_file: str = None, notes: str = None) -> int:
         """建立新專案，回傳專案 ID"""
         cursor = self.conn.cursor()
@@ -234,19 +708,20 @@ class DatabaseManager:
     
     def get_project(self, project_id: int) -> Optional[dict]:
         """取得專案資訊"""
-        cursor = self.conn.cursor()
+        cursor = self.reader.cursor()
         cursor.execute("SELECT * FROM projects WHERE id = ?", (project_id,))
         row = cursor.fetchone()
         return dict(row) if row else None
     
     def list_projects(self) -> List[dict]:
         """列出所有專案"""
-        cursor = self.conn.cursor()
+        cursor = self.reader.cursor()
         cursor.execute("SELECT * FROM projects ORDER BY updated_at DESC")
         return [dict(row) for row in cursor.fetchall()]
 
     # ==================== 結構物/棟別管理 ====================
 
+    @_writes
     def add_building(self, project_id: int, code: str, name: str,
                      is_basement: bool = False, display_order: int = 0) -> int:
         """新增結構物/棟別"""
@@ -261,13 +736,14 @@ class DatabaseManager:
 
     def get_buildings(self, project_id: int) -> List[dict]:
         """取得專案的所有結構物/棟別"""
-        cursor = self.conn.cursor()
+        cursor = self.reader.cursor()
         cursor.execute(
             "SELECT * FROM buildings WHERE project_id = ? ORDER BY display_order",
             (project_id,)
         )
         return [dict(row) for row in cursor.fetchall()]
 
+    @_writes
     def update_building(self, building_id: int, **kwargs) -> bool:
         """更新結構物/棟別資訊"""
         allowed_fields = ['building_code', 'building_name', 'is_basement', 'display_order', 'notes']
@@ -287,6 +763,7 @@ class DatabaseManager:
 
     # ==================== 樓層管理 ====================
 
+    @_writes
     def add_floor(self, building_id: int, code: str, name: str,
                   floor_level: int = None, is_combined: bool = False,
                   display_order: int = 0) -> int:
@@ -302,7 +779,7 @@ class DatabaseManager:
 
     def get_floors(self, building_id: int) -> List[dict]:
         """取得棟別的所有樓層"""
-        cursor = self.conn.cursor()
+        cursor = self.reader.cursor()
         cursor.execute(
             "SELECT * FROM floors WHERE building_id = ? ORDER BY display_order",
             (building_id,)
@@ -311,7 +788,7 @@ class DatabaseManager:
 
     def get_all_floors_by_project(self, project_id: int) -> List[dict]:
         """取得專案的所有樓層（含棟別資訊）"""
-        cursor = self.conn.cursor()
+        cursor = self.reader.cursor()
         cursor.execute("""
             SELECT f.*, b.building_code, b.building_name, b.is_basement
             FROM floors f
@@ -321,6 +798,7 @@ class DatabaseManager:
         """, (project_id,))
         return [dict(row) for row in cursor.fetchall()]
 
+    @_writes
     def update_floor(self, floor_id: int, **kwargs) -> bool:
         """更新樓層資訊"""
         allowed_fields = ['floor_code', 'floor_name', 'floor_level', 'is_combined', 'display_order', 'notes']
@@ -340,6 +818,7 @@ class DatabaseManager:
 
     # ==================== 牆類型管理 ====================
     
+    @_writes
     def add_wall_category(self, project_id: int, code: str, name: str, 
                           height_type: str = None, height_formula: str = None,
                           color: str = "#888888", line_weight: float = 1.0) -> int:
@@ -355,13 +834,14 @@ class DatabaseManager:
     
     def get_categories(self, project_id: int) -> List[dict]:
         """取得專案的所有牆類型"""
-        cursor = self.conn.cursor()
+        cursor = self.reader.cursor()
         cursor.execute(
             "SELECT * FROM wall_categories WHERE project_id = ? ORDER BY display_order",
             (project_id,)
         )
         return [dict(row) for row in cursor.fetchall()]
     
+    @_writes
     def update_category(self, category_id: int, **kwargs) -> bool:
         """更新牆類型"""
         allowed_fields = ['category_code', 'category_name', 'height_type',
@@ -383,6 +863,7 @@ class DatabaseManager:
     
     # ==================== 圖層對應管理 ====================
     
+    @_writes
     def set_layer_mapping(self, project_id: int, dxf_layer: str, category_id: int = None):
         """設定或更新圖層對應"""
         cursor = self.conn.cursor()
@@ -396,7 +877,7 @@ class DatabaseManager:
     
     def get_layer_mappings(self, project_id: int) -> Dict[str, Optional[int]]:
         """取得圖層對應關係 (圖層名稱 → 類型ID)"""
-        cursor = self.conn.cursor()
+        cursor = self.reader.cursor()
         cursor.execute(
             "SELECT dxf_layer_name, category_id FROM layer_mappings WHERE project_id = ?",
             (project_id,)
@@ -405,49 +886,112 @@ class DatabaseManager:
     
     # ==================== 線段管理 ====================
     
-    def import_segments(self, project_id: int, segments: List[dict], floor_id: int = None) -> int:
-        """批次匯入線段資料"""
-        cursor = self.conn.cursor()
-        count = 0
-
-        # 先取得圖層對應
+    @_writes
+    def import_segments(self, project_id: int, segments: Union[List[dict], SegmentStore],
+                        floor_id: int = None,
+                        progress_callback: Callable[[int, int], None] = None) -> int:
+        """
+        批次匯入線段資料（progress_callback(已處理, 總數) 供背景工作回報進度）
+        segments 可為 dict 列表或 SegmentStore（直接讀取欄位陣列，不建立 dict）；
+        重複的線段 UID 略過，回傳實際新增的筆數
+        """
         mappings = self.get_layer_mappings(project_id)
+        if isinstance(segments, SegmentStore):
+            rows = _store_rows(project_id, floor_id, segments, mappings)
+        else:
+            rows = _dict_rows(project_id, floor_id, segments, mappings)
+        total = len(segments)
 
-        for seg in segments:
-            category_id = mappings.get(seg.get('layer'))
-            vertices_json = json.dumps(seg.get('vertices')) if seg.get('vertices') else None
+        with self._bulk_write() as cursor:
+            # 匯入期間略過逐列的新增觸發器，匯入後一次 GROUP BY 累加；
+            # 旗標只存在於這個交易內（其他連線看不到），失敗時一併復原
+            cursor.execute("INSERT INTO bulk_import_flag VALUES (1)")
+            last_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM wall_segments").fetchone()[0]
+            changes_before = self.conn.total_changes
+            done = 0
+            while True:
+                batch = list(itertools.islice(rows, IMPORT_BATCH_SIZE))
+                if not batch:
+                    break
+                cursor.executemany(_INSERT_SEGMENT_SQL, batch)
+                done += len(batch)
+                if progress_callback and done < total:
+                    progress_callback(done, total)
+            count = self.conn.total_changes - changes_before
+            self._add_to_summaries(cursor, "id > ?", (last_id,))
+            if cursor.execute("SELECT 1 FROM parallel_pair_state WHERE project_id = ?",
+                              (project_id,)).fetchone():
+                self._add_to_pair_index(cursor, project_id, "ws.id > ?", (last_id,))
+            cursor.execute("DELETE FROM bulk_import_flag")
 
-            try:
-                cursor.execute("""
-                    INSERT INTO wall_segments
-                    (project_id, floor_id, segment_uid, dxf_layer, category_id, entity_type,
-                     start_x, start_y, end_x, end_y, length, vertices_json)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    project_id,
-                    floor_id,
-                    seg['id'],
-                    seg['layer'],
-                    category_id,
-                    seg['entity_type'],
-                    seg['start_point'][0],
-                    seg['start_point'][1],
-                    seg['end_point'][0],
-                    seg['end_point'][1],
-                    seg['length'],
-                    vertices_json
-                ))
-                count += 1
-            except sqlite3.IntegrityError:
-                # 重複的線段 UID，跳過
-                pass
+        if progress_callback:
+            progress_callback(total, total)
+        return count
 
+    @_writes
+    def rebuild_summaries(self):
+        """由 wall_segments 重新計算統計彙總表"""
+        cursor = self.conn.cursor()
+        self._rebuild_summaries(cursor)
         self.conn.commit()
-        return count
+
+    def _rebuild_summaries(self, cursor):
+        cursor.execute("DELETE FROM segment_summary")
+        self._add_to_summaries(cursor, "1", ())
+
+    @staticmethod
+    def _add_to_summaries(cursor, where: str, params: tuple):
+        keys = {name: expr.format(row="ws") for name, expr in _SUMMARY_KEY.items()}
+        cursor.execute(_SUMMARY_AGGREGATE_SQL.format(where=where, **keys), params)
+
+    @staticmethod
+    def _add_to_pair_index(cursor, project_id: int, where: str, params: tuple, mark_dirty: bool = True):
+        """將線段加入外框 R*Tree 並標記待更新（匯入與建立索引使用）"""
+        cursor.execute(f"""
+            INSERT OR REPLACE INTO segment_rtree
+            SELECT id, MIN(start_x, end_x), MAX(start_x, end_x), MIN(start_y, end_y), MAX(start_y, end_y)
+            FROM wall_segments AS ws WHERE ws.project_id = ? AND {where}
+        """, (project_id, *params))
+        if not mark_dirty:
+            return
+        cursor.execute(f"""
+            INSERT OR IGNORE INTO parallel_pair_dirty
+            SELECT project_id, id FROM wall_segments AS ws WHERE ws.project_id = ? AND {where}
+        """, (project_id, *params))
+
+    @contextlib.contextmanager
+    def _bulk_write(self):
+        """
+        大量寫入：整批在單一交易中完成，期間暫時放寬 synchronous 與 journal_mode
+        （WAL 模式不變更），結束後恢復原設定；發生錯誤時整批復原
+        """
+        conn = self.conn
+        conn.commit()
+        synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        relax_journal = journal_mode.lower() != "wal"
+        conn.execute("PRAGMA synchronous = OFF")
+        if relax_journal:
+            conn.execute("PRAGMA journal_mode = MEMORY")
+        try:
+            conn.execute("BEGIN")
+            yield conn.cursor()
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.execute(f"PRAGMA synchronous = {int(synchronous)}")
+            if relax_journal:
+                conn.execute(f"PRAGMA journal_mode = {journal_mode}")
     
-    def get_segments(self, project_id: int, category_id: int = None) -> List[dict]:
-        """取得線段資料，可依類型篩選"""
-        cursor = self.conn.cursor()
+    def get_segments(self, project_id: int, category_id: int = None,
+                     vertices_as_arrays: bool = False) -> List[dict]:
+        """
+        取得線段資料，可依類型篩選
+        vertices 預設轉為座標列表（可直接輸出 JSON）；vertices_as_arrays=True 時為 (N, 2) 陣列
+        """
+        cursor = self.reader.cursor()
         
         if category_id is not None:
             cursor.execute("""
@@ -464,8 +1008,17 @@ class DatabaseManager:
                 WHERE ws.project_id = ?
             """, (project_id,))
         
-        return [dict(row) for row in cursor.fetchall()]
+        segments = []
+        for row in cursor.fetchall():
+            seg = dict(row)
+            vertices = decode_vertices(seg['vertices'])
+            if vertices is not None and not vertices_as_arrays:
+                vertices = vertices.tolist()
+            seg['vertices'] = vertices
+            segments.append(seg)
+        return segments
     
+    @_writes
     def update_segment_category(self, segment_id: int, category_id: int, 
                                  record_history: bool = True) -> bool:
         """更新線段的分類"""
@@ -493,64 +1046,165 @@ class DatabaseManager:
         self.conn.commit()
         return cursor.rowcount > 0
     
+    # ==================== 平行牆對索引 ====================
+
+    @_writes
+    def refresh_parallel_pairs(self, project_id: int, category_ids: List[int] = None,
+                               angle_tolerance: float = 1.0, min_overlap: float = 10.0) -> int:
+        """
+        更新專案的平行牆對索引，回傳重新比對的線段數
+
+        只比對已分類的牆線段；指定 category_ids 時只比對這些牆類型的線段與牆厚
+
+        只重新比對新增、幾何、牆類型或合併狀態有變更的線段，以及外框距離在 2 × (牆厚 + 容許誤差) 以內的
+        鄰近線段（平行牆對的兩條線段一定在此範圍內）。第一次建立、牆厚表或參數變更、
+        或待更新的線段超過 PAIR_INDEX_MAX_DIRTY 時，整個專案重新偵測。
+        結果與對所有線段呼叫 find_parallel_pairs_by_category 相同。
+        """
+        thicknesses = {
+            cat['id']: (cat['wall_thickness'], 1.0 if cat['wall_thickness_tolerance'] is None
+                        else cat['wall_thickness_tolerance'])
+            for cat in self.get_categories(project_id)
+            if cat['wall_thickness'] and (category_ids is None or cat['id'] in category_ids)
+        }
+        scope = None if category_ids is None else json.dumps(sorted(category_ids))
+        settings = json.dumps([sorted(thicknesses.items()), scope, angle_tolerance, min_overlap])
+        with self.conn:
+            cursor = self.conn.cursor()
+            state = cursor.execute("SELECT settings FROM parallel_pair_state WHERE project_id = ?",
+                                   (project_id,)).fetchone()
+            if state is None:
+                cursor.execute("INSERT INTO parallel_pair_state VALUES (?, ?)", (project_id, settings))
+                self._add_to_pair_index(cursor, project_id, "1", (), mark_dirty=False)
+            dirty_count = cursor.execute("SELECT COUNT(*) FROM parallel_pair_dirty WHERE project_id = ?",
+                                         (project_id,)).fetchone()[0]
+            full = state is None or state[0] != settings or dirty_count > PAIR_INDEX_MAX_DIRTY
+            if not full and dirty_count == 0:
+                return 0
+
+            if full:
+                rows = cursor.execute(_PAIR_SEGMENT_SQL.format(source="wall_segments ws"),
+                                      {"project_id": project_id, "category_ids": scope}).fetchall()
+            else:
+                reach = max((t + tol for t, tol in thicknesses.values()), default=0.0)
+                rows = cursor.execute(_PAIR_SEGMENT_SQL.format(source=_PAIR_NEIGHBOUR_SOURCE),
+                                      {"project_id": project_id, "category_ids": scope,
+                                       "margin": 2 * max(reach, 0.0) + 1.0}).fetchall()
+            pair_rows = self._detect_pair_rows(cursor, project_id, rows, thicknesses,
+                                               angle_tolerance, min_overlap, dirty_only=not full)
+
+            if full:
+                cursor.execute("DELETE FROM parallel_pairs WHERE project_id = ?", (project_id,))
+                cursor.execute("UPDATE parallel_pair_state SET settings = ? WHERE project_id = ?",
+                               (settings, project_id))
+            else:
+                for column in ("segment_a", "segment_b"):
+                    cursor.execute(f"""
+                        DELETE FROM parallel_pairs WHERE {column} IN
+                        (SELECT segment_id FROM parallel_pair_dirty WHERE project_id = ?)
+                    """, (project_id,))
+            cursor.executemany("""
+                INSERT INTO parallel_pairs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, pair_rows)
+            cursor.execute("DELETE FROM parallel_pair_dirty WHERE project_id = ?", (project_id,))
+        return len(rows)
+
+    @staticmethod
+    def _detect_pair_rows(cursor, project_id: int, rows: list, thicknesses: Dict[int, Tuple[float, float]],
+                          angle_tolerance: float, min_overlap: float, dirty_only: bool) -> Iterator[tuple]:
+        """
+        偵測線段（依 id 排序）之間的平行牆對，產生 parallel_pairs 的資料列
+        dirty_only=True 時只比對至少一條線段待更新的候選對
+        """
+        if len(rows) < 2 or not thicknesses:
+            return iter(())
+        data = np.array([tuple(row) for row in rows], dtype=np.float64)
+        ids = data[:, 0].astype(np.int64)
+        starts, ends, lengths = data[:, 1:3], data[:, 3:5], data[:, 5]
+        categories = np.array(list(thicknesses), dtype=np.int64)
+        wall_thickness = [thickness for thickness, _ in thicknesses.values()]
+        tolerance = [tol for _, tol in thicknesses.values()]
+
+        candidates = parallel_pair_candidates(starts, ends, wall_thickness, tolerance, angle_tolerance)
+        if dirty_only:
+            dirty = np.isin(ids, [row[0] for row in cursor.execute(
+                "SELECT segment_id FROM parallel_pair_dirty WHERE project_id = ?", (project_id,))])
+            candidates = candidates[dirty[candidates[:, 0]] | dirty[candidates[:, 1]]]
+        batch = parallel_pair_batch(starts, ends, lengths, candidates[:, 0], candidates[:, 1],
+                                    wall_thickness, tolerance, angle_tolerance, min_overlap)
+        columns = (ids[batch["first"]], ids[batch["second"]], np.full(len(batch), project_id),
+                   categories[batch["thickness"]], ids[batch["primary"]], ids[batch["secondary"]],
+                   batch["distance"], batch["overlap_length"],
+                   batch["overlap_start"][:, 0], batch["overlap_start"][:, 1],
+                   batch["overlap_end"][:, 0], batch["overlap_end"][:, 1],
+                   batch["t_start"], batch["t_end"])
+        return zip(*(column.tolist() for column in columns))
+
+    def get_parallel_pairs(self, project_id: int,
+                           category_ids: List[int] = None) -> Dict[int, List[ParallelPair]]:
+        """
+        讀取平行牆對索引（需先 refresh_parallel_pairs）
+        回傳 {牆類型 ID: ParallelPair 列表}，與 find_parallel_pairs_by_category 相同
+        """
+        cursor = self.reader.cursor()
+        cursor.execute("""
+            SELECT * FROM parallel_pairs WHERE project_id = ? ORDER BY segment_a, segment_b
+        """, (project_id,))
+        result = {}
+        for row in cursor.fetchall():
+            if category_ids is not None and row['category_id'] not in category_ids:
+                continue
+            result.setdefault(row['category_id'], []).append(ParallelPair(
+                primary_id=row['primary_segment_id'],
+                secondary_id=row['secondary_segment_id'],
+                distance=row['parallel_distance'],
+                overlap_length=row['overlap_length'],
+                overlap_region={
+                    'start': (row['overlap_start_x'], row['overlap_start_y']),
+                    'end': (row['overlap_end_x'], row['overlap_end_y']),
+                    'length': row['overlap_length'],
+                    't_start': row['t_start'],
+                    't_end': row['t_end']
+                }
+            ))
+        return result
+
     # ==================== 統計查詢 ====================
 
     def get_summary(self, project_id: int, include_merged: bool = False) -> List[dict]:
         """
-        取得專案的牆長度統計
+        取得專案的牆長度統計（讀取彙總表，不掃描線段）
 
         Args:
             project_id: 專案 ID
             include_merged: 是否包含已合併的線段（預設 False，排除已合併線段）
         """
-        cursor = self.conn.cursor()
-
-        if include_merged:
-            # 包含所有線段
-            cursor.execute("""
-                SELECT
-                    wc.id as category_id,
-                    wc.category_code,
-                    wc.category_name,
-                    wc.color,
-                    wc.height_type,
-                    wc.height_formula,
-                    wc.wall_thickness,
-                    COUNT(ws.id) as segment_count,
-                    COALESCE(SUM(ws.length), 0) as total_length
-                FROM wall_categories wc
-                LEFT JOIN wall_segments ws ON wc.id = ws.category_id AND ws.project_id = wc.project_id
-                WHERE wc.project_id = ?
-                GROUP BY wc.id
-                ORDER BY wc.display_order
-            """, (project_id,))
-        else:
-            # 排除已合併線段
-            cursor.execute("""
-                SELECT
-                    wc.id as category_id,
-                    wc.category_code,
-                    wc.category_name,
-                    wc.color,
-                    wc.height_type,
-                    wc.height_formula,
-                    wc.wall_thickness,
-                    COUNT(ws.id) as segment_count,
-                    COALESCE(SUM(ws.length), 0) as total_length
-                FROM wall_categories wc
-                LEFT JOIN wall_segments ws ON wc.id = ws.category_id
-                    AND ws.project_id = wc.project_id
-                    AND (ws.is_merged = 0 OR ws.is_merged IS NULL)
-                WHERE wc.project_id = ?
-                GROUP BY wc.id
-                ORDER BY wc.display_order
-            """, (project_id,))
+        cursor = self.reader.cursor()
+        cursor.execute(f"""
+            SELECT
+                wc.id as category_id,
+                wc.category_code,
+                wc.category_name,
+                wc.color,
+                wc.height_type,
+                wc.height_formula,
+                wc.wall_thickness,
+                COALESCE(SUM(s.segment_count), 0) as segment_count,
+                COALESCE(SUM(s.total_length), 0) as total_length
+            FROM wall_categories wc
+            LEFT JOIN segment_summary s ON s.category_id = wc.id
+                AND s.project_id = wc.project_id
+                {"" if include_merged else "AND s.is_merged = 0"}
+            WHERE wc.project_id = ?
+            GROUP BY wc.id
+            ORDER BY wc.display_order
+        """, (project_id,))
 
         return [dict(row) for row in cursor.fetchall()]
     
     def get_uncategorized_summary(self, project_id: int) -> dict:
         """取得未分類線段的統計"""
-        cursor = self.conn.cursor()
+        cursor = self.reader.cursor()
         cursor.execute("""
             SELECT
                 dxf_layer,
@@ -565,7 +1219,7 @@ class DatabaseManager:
 
     def get_summary_by_floor(self, project_id: int, floor_id: int) -> List[dict]:
         """取得指定樓層的牆長度統計"""
-        cursor = self.conn.cursor()
+        cursor = self.reader.cursor()
         cursor.execute("""
             SELECT
                 wc.id as category_id,
@@ -574,10 +1228,10 @@ class DatabaseManager:
                 wc.color,
                 wc.height_type,
                 wc.height_formula,
-                COUNT(ws.id) as segment_count,
-                COALESCE(SUM(ws.length), 0) as total_length
+                COALESCE(SUM(s.segment_count), 0) as segment_count,
+                COALESCE(SUM(s.total_length), 0) as total_length
             FROM wall_categories wc
-            LEFT JOIN wall_segments ws ON wc.id = ws.category_id AND ws.floor_id = ?
+            LEFT JOIN segment_summary s ON s.category_id = wc.id AND s.floor_id = ?
             WHERE wc.project_id = ?
             GROUP BY wc.id
             ORDER BY wc.display_order
@@ -587,7 +1241,7 @@ class DatabaseManager:
 
     def get_summary_by_building(self, project_id: int, building_id: int) -> List[dict]:
         """取得指定棟別的牆長度統計（所有樓層合計）"""
-        cursor = self.conn.cursor()
+        cursor = self.reader.cursor()
         cursor.execute("""
             SELECT
                 wc.id as category_id,
@@ -596,11 +1250,11 @@ class DatabaseManager:
                 wc.color,
                 wc.height_type,
                 wc.height_formula,
-                COUNT(ws.id) as segment_count,
-                COALESCE(SUM(ws.length), 0) as total_length
+                SUM(s.segment_count) as segment_count,
+                SUM(s.total_length) as total_length
             FROM wall_categories wc
-            LEFT JOIN wall_segments ws ON wc.id = ws.category_id
-            LEFT JOIN floors f ON ws.floor_id = f.id
+            JOIN segment_summary s ON s.category_id = wc.id
+            JOIN floors f ON s.floor_id = f.id
             WHERE wc.project_id = ? AND f.building_id = ?
             GROUP BY wc.id
             ORDER BY wc.display_order
@@ -610,7 +1264,7 @@ class DatabaseManager:
 
     def get_full_hierarchy_summary(self, project_id: int) -> dict:
         """取得完整的分棟分樓層統計"""
-        cursor = self.conn.cursor()
+        cursor = self.reader.cursor()
         cursor.execute("""
             SELECT
                 b.id as building_id,
@@ -624,12 +1278,12 @@ class DatabaseManager:
                 wc.category_code,
                 wc.category_name,
                 wc.color,
-                COUNT(ws.id) as segment_count,
-                COALESCE(SUM(ws.length), 0) as total_length
+                COALESCE(SUM(s.segment_count), 0) as segment_count,
+                COALESCE(SUM(s.total_length), 0) as total_length
             FROM buildings b
             LEFT JOIN floors f ON b.id = f.building_id
-            LEFT JOIN wall_segments ws ON f.id = ws.floor_id
-            LEFT JOIN wall_categories wc ON ws.category_id = wc.id
+            LEFT JOIN segment_summary s ON f.id = s.floor_id
+            LEFT JOIN wall_categories wc ON s.category_id = wc.id
             WHERE b.project_id = ?
             GROUP BY b.id, f.id, wc.id
             ORDER BY b.display_order, f.display_order, wc.display_order
@@ -638,10 +1292,15 @@ class DatabaseManager:
         return [dict(row) for row in cursor.fetchall()]
     
     def close(self):
-        """關閉資料庫連線"""
-        if self.conn:
-            self.conn.close()
-            print("[OK] 資料庫連線已關閉")
+        """關閉所有執行緒的資料庫連線"""
+        with self._pool_lock:
+            for _, connections in self._pool.values():
+                for conn in connections:
+                    conn.close()
+            self._pool.clear()
+        self._local = threading.local()
+        self._shared = types.SimpleNamespace()
+        print("[OK] 資料庫連線已關閉")
 
 
 def demo():
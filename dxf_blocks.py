@@ -0,0 +1,368 @@
+"""
+Block Geometry Cache for Wall Quantity Calculator
+圖塊定義展平快取與 INSERT 批次展開
+
+每個圖塊只展平一次：圖塊內的幾何（含巢狀 INSERT）轉為區域座標的點陣列與項目表。
+INSERT 引用先收集起來，同一圖塊的所有引用（含 MINSERT 陣列的每個實例）
+以一次向量化仿射轉換處理，再依引用的原始順序輸出線段記錄。
+
+INSERT 幾何基本資料：
+    ("INSERT", layer, block_name, insert_point, x_scale, y_scale, rotation,
+     column_count, row_count, column_spacing, row_spacing)
+"""
+import math
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 項目類型
+KIND_LINE = 0       # 直線：不保留頂點，長度由轉換後的端點計算
+KIND_POLYLINE = 1   # 多段線：長度為轉換後各段長度總和
+KIND_CURVE = 2      # 弧 / 圓 / 含圓弧段的多段線：長度為區域長度 × max(|x 縮放|, |y 縮放|)
+
+
+@dataclass
+class BlockItem:
+    """展平後圖塊中的一個幾何項目，頂點為 points[start:stop]"""
+    layer: str
+    entity_type: str
+    start: int
+    stop: int
+    kind: int
+    curve_length: float = 0.0
+
+
+@dataclass
+class FlatBlock:
+    """展平後的圖塊定義（區域座標）"""
+    points: np.ndarray          # (N, 2)
+    items: List[BlockItem]
+
+
+@dataclass
+class InstanceTransforms:
+    """
+    一組 INSERT 引用展開後的實例轉換（MINSERT 每個格點一個實例）
+    world_x = a * x + b * y + tx，world_y = c * x + d * y + ty
+    """
+    counts: np.ndarray          # 每個引用的實例數
+    tx: np.ndarray
+    ty: np.ndarray
+    a: np.ndarray
+    b: np.ndarray
+    c: np.ndarray
+    d: np.ndarray
+    curve_scale: np.ndarray     # 弧 / 圓長度的縮放 max(|x 縮放|, |y 縮放|)
+
+    def apply(self, points: np.ndarray):
+        """回傳世界座標 (x, y)，形狀皆為 (實例數, 點數)"""
+        local_x = points[:, 0]
+        local_y = points[:, 1]
+        world_x = np.outer(self.a, local_x) + np.outer(self.b, local_y) + self.tx[:, None]
+        world_y = np.outer(self.c, local_x) + np.outer(self.d, local_y) + self.ty[:, None]
+        return world_x, world_y
+
+
+def instance_transforms(refs: List[tuple]) -> InstanceTransforms:
+    """
+    計算 INSERT 引用的所有實例轉換（先縮放再旋轉再平移）
+    MINSERT 的格點依列優先順序（與 ezdxf multi_insert 相同），
+    格距只隨 INSERT 旋轉、不隨縮放；格距為 0 的方向只產生一個實例
+    """
+    insert_x = np.array([ref[3][0] for ref in refs], dtype=float)
+    insert_y = np.array([ref[3][1] for ref in refs], dtype=float)
+    x_scale = np.array([ref[4] for ref in refs], dtype=float)
+    y_scale = np.array([ref[5] for ref in refs], dtype=float)
+    rotation = np.radians([ref[6] for ref in refs])
+    col_spacing = np.array([ref[9] for ref in refs], dtype=float)
+    row_spacing = np.array([ref[10] for ref in refs], dtype=float)
+    cols = np.where(col_spacing != 0, np.maximum([ref[7] for ref in refs], 1), 1)
+    rows = np.where(row_spacing != 0, np.maximum([ref[8] for ref in refs], 1), 1)
+    cos_r = np.cos(rotation)
+    sin_r = np.sin(rotation)
+
+    counts = cols * rows
+    if counts.max() > 1:
+        # 每個實例所屬的引用與格點位置
+        owner = np.repeat(np.arange(len(refs)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        col = local % cols[owner]
+        row = local // cols[owner]
+        dx = col * col_spacing[owner]
+        dy = row * row_spacing[owner]
+        cos_o = cos_r[owner]
+        sin_o = sin_r[owner]
+        tx = insert_x[owner] + dx * cos_o - dy * sin_o
+        ty = insert_y[owner] + dx * sin_o + dy * cos_o
+        x_scale, y_scale, cos_r, sin_r = x_scale[owner], y_scale[owner], cos_o, sin_o
+    else:
+        tx, ty = insert_x, insert_y
+
+    return InstanceTransforms(
+        counts=counts,
+        tx=tx,
+        ty=ty,
+        a=x_scale * cos_r,
+        b=-y_scale * sin_r,
+        c=x_scale * sin_r,
+        d=y_scale * cos_r,
+        curve_scale=np.maximum(np.abs(x_scale), np.abs(y_scale)),
+    )
+
+
+class BlockFlattener:
+    """
+    將圖塊定義展平為 FlatBlock（結果快取，每個圖塊只處理一次）
+    巢狀 INSERT 遞迴展開；遇到循環引用時略過該引用
+    """
+
+    def __init__(self, get_block: Callable[[str], Optional[List[tuple]]],
+                 arc_vertices: Callable, circle_vertices: Callable, polyline_vertices: Callable):
+        self._get_block = get_block
+        self._arc_vertices = arc_vertices
+        self._circle_vertices = circle_vertices
+        self._polyline_vertices = polyline_vertices  # 多段線 → (頂點, 圓弧段精確長度或 None)
+        self._cache: Dict[str, Optional[FlatBlock]] = {}
+
+    def get(self, block_name: str, _stack: Tuple[str, ...] = ()) -> Optional[FlatBlock]:
+        key = block_name.lower()
+        if key in self._cache:
+            return self._cache[key]
+        if key in _stack:
+            print(f"  [!] 圖塊循環引用，略過: {' -> '.join(_stack + (key,))}")
+            return None
+
+        primitives = self._get_block(block_name)
+        if primitives is None:
+            self._cache[key] = None
+            return None
+
+        points: List = []
+        items: List[BlockItem] = []
+
+        def add(layer, entity_type, vertices, kind, curve_length=0.0):
+            start = len(points)
+            points.extend(vertices)
+            items.append(BlockItem(layer, entity_type, start, len(points), kind, curve_length))
+
+        for primitive in primitives:
+            entity_type = primitive[0]
+            layer = primitive[1]
+
+            if entity_type == "LINE":
+                add(layer, "LINE", (primitive[2], primitive[3]), KIND_LINE)
+
+            elif entity_type == "LWPOLYLINE":
+                vertices, curve_length = self._polyline_vertices(primitive)
+                if len(vertices) >= 2:
+                    if curve_length is None:
+                        add(layer, "LWPOLYLINE", vertices, KIND_POLYLINE)
+                    else:
+                        add(layer, "LWPOLYLINE", vertices, KIND_CURVE, curve_length)
+
+            elif entity_type == "ARC":
+                _, _, center, radius, start_angle, end_angle = primitive
+                start_angle = math.radians(start_angle)
+                angle_diff = math.radians(end_angle) - start_angle
+                if angle_diff < 0:
+                    angle_diff += 2 * math.pi
+                vertices = self._arc_vertices(center, radius, start_angle, angle_diff)
+                if len(vertices) >= 2:
+                    add(layer, "ARC", vertices, KIND_CURVE, radius * angle_diff)
+
+            elif entity_type == "CIRCLE":
+                _, _, center, radius = primitive
+                add(layer, "CIRCLE", self._circle_vertices(center, radius), KIND_CURVE,
+                    2 * math.pi * radius)
+
+            elif entity_type == "INSERT":
+                child = self.get(primitive[2], _stack + (key,))
+                if child is None or not child.items:
+                    continue
+                # 巢狀圖塊（含 MINSERT 陣列）在展平時就轉換到本圖塊的區域座標
+                transforms = instance_transforms([primitive])
+                world_x, world_y = transforms.apply(child.points)
+                for scale, xs, ys in zip(transforms.curve_scale.tolist(),
+                                         world_x.tolist(), world_y.tolist()):
+                    offset = len(points)
+                    points.extend(zip(xs, ys))
+                    for item in child.items:
+                        items.append(BlockItem(
+                            layer if item.layer == "0" else item.layer,
+                            item.entity_type,
+                            item.start + offset,
+                            item.stop + offset,
+                            item.kind,
+                            item.curve_length * scale
+                        ))
+
+        flat = FlatBlock(np.array(points, dtype=float).reshape(-1, 2), items)
+        self._cache[key] = flat
+        return flat
+
+
+class InsertExpander:
+    """
+    收集 INSERT 引用並批次展開
+    handle() 可直接作為 INSERT 的處理函式；flush() 依引用順序將線段記錄寫入 out
+    """
+
+    # 累積的引用數達到此值時自動展開，限制記憶體用量（串流模式）
+    BATCH_SIZE = 8192
+
+    def __init__(self, flattener: BlockFlattener, out, layer_filter: Callable[[str], bool]):
+        self.flattener = flattener
+        self.out = out
+        self.layer_filter = layer_filter
+        self._pending: List[tuple] = []
+        self._accepted: Dict[Tuple[str, str], bool] = {}
+
+    def accepts(self, layer: str, block_name: str) -> bool:
+        """
+        引用本身的圖層通過篩選，且展開後有任何項目通過圖層篩選
+        （圖層 0 的項目跟隨引用的圖層，其他項目可能在引用以外的圖層）
+        """
+        key = (block_name.lower(), layer)
+        accepted = self._accepted.get(key)
+        if accepted is None and not self.layer_filter(layer):
+            accepted = self._accepted[key] = False
+        if accepted is None:
+            flat = self.flattener.get(block_name)
+            item_layers = {item.layer for item in flat.items} if flat is not None else ()
+            accepted = any(self.layer_filter(layer if item_layer == "0" else item_layer)
+                           for item_layer in item_layers)
+            self._accepted[key] = accepted
+        return accepted
+
+    def handle(self, primitive: tuple, out=None, layer_filter=None):
+        if not self.accepts(primitive[1], primitive[2]):
+            return
+        self._pending.append(primitive)
+        if len(self._pending) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        pending = self._pending
+        if not pending:
+            return
+        self._pending = []
+
+        # 依圖塊分組，每組一次轉換
+        groups: Dict[str, List[int]] = {}
+        for index, primitive in enumerate(pending):
+            groups.setdefault(primitive[2].lower(), []).append(index)
+
+        # 每個引用 → (該組的轉換結果, 第一個實例的位置, 實例數)
+        expanded: List[Optional[tuple]] = [None] * len(pending)
+        for indices in groups.values():
+            try:
+                group = self._transform_group(pending, indices)
+            except Exception as e:
+                print(f"  [!] 無法處理 INSERT 實體 '{pending[indices[0]][2]}': {e}")
+                continue
+            if group is not None:
+                counts = group[-1]
+                first = 0
+                for index, count in zip(indices, counts):
+                    expanded[index] = (group, first, count)
+                    first += count
+
+        # 依引用的原始順序輸出（MINSERT 的實例依格點順序）
+        append = self.out.append
+        layer_filter = self.layer_filter
+        for primitive, entry in zip(pending, expanded):
+            if entry is None:
+                continue
+            (items, world_x, world_y, item_lengths, _), first, count = entry
+            insert_layer = primitive[1]
+            layers = [insert_layer if item.layer == "0" else item.layer for item in items]
+            wanted = [(item, layer, lengths)
+                      for item, layer, lengths in zip(items, layers, item_lengths)
+                      if layer_filter(layer)]
+            if not wanted:
+                continue
+            stop = first + count
+            for k, xs, ys in zip(range(first, stop), world_x[first:stop].tolist(),
+                                 world_y[first:stop].tolist()):
+                for item, layer, lengths in wanted:
+                    lo, hi = item.start, item.stop
+                    start = (xs[lo], ys[lo])
+                    end = (xs[hi - 1], ys[hi - 1])
+                    if item.kind == KIND_LINE:
+                        append((layer, item.entity_type, start, end, lengths[k], None))
+                    else:
+                        append((layer, item.entity_type, start, end, lengths[k],
+                                list(zip(xs[lo:hi], ys[lo:hi]))))
+
+    def _transform_group(self, pending: List[tuple], indices: List[int]):
+        """
+        同一圖塊的所有引用（含 MINSERT 的每個實例）一次完成仿射轉換
+        回傳 (項目表, 世界座標 x, 世界座標 y, 各項目長度, 各引用的實例數)
+        座標陣列形狀為 (實例總數, 點數)
+        """
+        flat = self.flattener.get(pending[indices[0]][2])
+        if flat is None or not flat.items:
+            return None
+
+        transforms = instance_transforms([pending[i] for i in indices])
+        world_x, world_y = transforms.apply(flat.points)
+        item_lengths = [lengths.tolist()
+                        for lengths in _item_lengths(flat, transforms, world_x, world_y)]
+        return flat.items, world_x, world_y, item_lengths, transforms.counts.tolist()
+
+
+def _item_lengths(flat: FlatBlock, transforms: InstanceTransforms,
+                  world_x: np.ndarray, world_y: np.ndarray) -> List[np.ndarray]:
+    """各項目在每個實例中的長度（每個項目一個 (實例數,) 陣列）"""
+    # 各段長度 (實例數, 點數-1)；直線與多段線的長度由此加總
+    seg_lengths = np.hypot(np.diff(world_x, axis=1), np.diff(world_y, axis=1))
+
+    item_lengths = []
+    for item in flat.items:
+        if item.kind == KIND_CURVE:
+            lengths = item.curve_length * transforms.curve_scale
+        else:
+            lengths = seg_lengths[:, item.start:item.stop - 1].sum(axis=1)
+        item_lengths.append(lengths)
+    return item_lengths
+
+
+def summarize_inserts(flattener: BlockFlattener, refs: List[tuple]) -> Dict[str, list]:
+    """
+    統計 INSERT 引用展開後各圖層的線段數、總長度與範圍，不產生線段記錄（圖層預覽用）
+    回傳 圖層 → [線段數, 總長度, min_x, min_y, max_x, max_y]；
+    圖塊內圖層 "0" 的項目歸屬到 INSERT 所在的圖層
+    """
+    groups: Dict[str, List[int]] = {}
+    for index, ref in enumerate(refs):
+        groups.setdefault(ref[2].lower(), []).append(index)
+
+    stats: Dict[str, list] = {}
+    for indices in groups.values():
+        flat = flattener.get(refs[indices[0]][2])
+        if flat is None or not flat.items:
+            continue
+        group = [refs[i] for i in indices]
+        transforms = instance_transforms(group)
+        world_x, world_y = transforms.apply(flat.points)
+        lengths = _item_lengths(flat, transforms, world_x, world_y)
+        # 每個實例所屬的引用圖層 → 實例遮罩（圖層 "0" 的項目依此分配）
+        instance_layers = np.repeat(np.array([ref[1] for ref in group], dtype=object),
+                                    transforms.counts)
+        by_insert_layer = [(layer, instance_layers == layer) for layer in set(instance_layers)]
+        everything = np.ones(len(instance_layers), dtype=bool)
+
+        for item, item_length in zip(flat.items, lengths):
+            xs = world_x[:, item.start:item.stop]
+            ys = world_y[:, item.start:item.stop]
+            targets = by_insert_layer if item.layer == "0" else [(item.layer, everything)]
+            for layer, mask in targets:
+                entry = stats.setdefault(layer, [0, 0.0, math.inf, math.inf, -math.inf, -math.inf])
+                entry[0] += int(mask.sum())
+                entry[1] += float(item_length[mask].sum())
+                entry[2] = min(entry[2], float(xs[mask].min()))
+                entry[3] = min(entry[3], float(ys[mask].min()))
+                entry[4] = max(entry[4], float(xs[mask].max()))
+                entry[5] = max(entry[5], float(ys[mask].max()))
+    return stats
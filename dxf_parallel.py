@@ -0,0 +1,112 @@
+"""
+Parallel DXF Extraction for Wall Quantity Calculator
+以多個行程平行提取模型空間線段
+
+主行程以串流讀取器讀取 HEADER / TABLES / BLOCKS，並將 ENTITIES 區段
+切成位元組範圍；每個工作行程處理一個範圍（INSERT 的圖塊在同一個行程中展開），
+以 SegmentStore（欄位式陣列）回傳各實體類型的線段記錄。
+主行程依 ENTITY_ORDER → 範圍順序合併，線段 ID 與 extract_wall_entities 完全相同。
+"""
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from dxf_parser import DXFParser, ENTITY_ORDER, LayerFilter, LayerSpec
+from dxf_stream import DXFStream
+from segment_store import SegmentStore
+
+# 每個工作行程分配的範圍數（多切幾塊，讓各行程負載平均）
+CHUNKS_PER_WORKER = 4
+
+# 工作行程共用的圖塊定義（由 initializer 設定，每個行程只傳送一次）
+_worker_blocks: Dict[str, List[tuple]] = {}
+
+
+def _init_worker(blocks: Dict[str, List[tuple]]):
+    global _worker_blocks
+    _worker_blocks = blocks
+
+
+def _extract_range(filepath: str, encoding: str, start: int, end: int,
+                   wall_layer_prefix: Optional[str], layers: LayerSpec,
+                   arc_tolerance: float) -> Dict[str, SegmentStore]:
+    """工作行程：提取 ENTITIES 區段中一個位元組範圍的線段記錄"""
+    parser = DXFParser(filepath)
+    parser._blocks = _worker_blocks
+    parser.arc_tolerance = arc_tolerance
+    handlers = parser._entity_handlers()
+    layer_filter = LayerFilter(wall_layer_prefix, layers)
+    buckets = {entity_type: SegmentStore() for entity_type in ENTITY_ORDER}
+    inserts = parser._insert_expander(buckets["INSERT"], layer_filter)
+    handlers["INSERT"] = inserts.handle
+    splines = parser._spline_batch(buckets["SPLINE"])
+    handlers["SPLINE"] = splines.handle
+
+    stream = DXFStream(filepath, encoding=encoding)
+    for primitive in stream.iter_entity_range(start, end, layer_filter):
+        entity_type = primitive[0]
+        handlers[entity_type](primitive, buckets[entity_type], layer_filter)
+
+    inserts.flush()
+    splines.flush()
+    for bucket in buckets.values():
+        bucket.fill_lengths()
+    return buckets
+
+
+def extract_parallel(parser: DXFParser, wall_layer_prefix: Optional[str] = "A-WALL",
+                     workers: Optional[int] = None, layers: LayerSpec = None) -> SegmentStore:
+    """
+    平行提取牆線段，結果加入 parser.segments 並回傳
+    workers 預設為 CPU 核心數；workers=1 時在目前行程中依序處理
+    layers 為判斷函式時須可 pickle（模組層級函式）才能傳給工作行程，否則改為依序處理
+    """
+    workers = workers or os.cpu_count() or 1
+    if layers is not None and not callable(layers) and not isinstance(layers, str):
+        layers = frozenset(layers)  # 每個範圍各自建立篩選器，不能是只能走訪一次的迭代器
+    if workers > 1 and callable(layers):
+        try:
+            pickle.dumps(layers)
+        except Exception:
+            print("  [!] 圖層判斷函式無法傳給工作行程，改為依序處理")
+            workers = 1
+
+    with parser._open_stream() as stream:
+        encoding = stream.encoding
+        ranges: List[Tuple[int, int]] = stream.partition_entities(workers * CHUNKS_PER_WORKER)
+    blocks = parser._blocks
+
+    print(f"  平行提取: {workers} 個行程, {len(ranges)} 個範圍")
+    parser._report_progress("entities", 0, len(ranges))
+
+    if workers == 1:
+        _init_worker(blocks)
+        results = []
+        for start, end in ranges:
+            results.append(_extract_range(parser.filepath, encoding, start, end, wall_layer_prefix,
+                                          layers, parser.arc_tolerance))
+            parser._report_progress("entities", len(results), len(ranges))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(blocks,)) as pool:
+            futures = [pool.submit(_extract_range, parser.filepath, encoding, start, end,
+                                   wall_layer_prefix, layers, parser.arc_tolerance)
+                       for start, end in ranges]
+            # 依範圍順序收集，合併順序與工作完成順序無關
+            results = []
+            for future in futures:
+                results.append(future.result())
+                parser._report_progress("entities", len(results), len(ranges))
+
+    for entity_type in ENTITY_ORDER:
+        for buckets in results:
+            parser.segments.extend(buckets[entity_type])
+    parser._finish_segments()
+
+    insert_count = sum(len(buckets["INSERT"]) for buckets in results)
+    if insert_count > 0:
+        print(f"  從圖塊中展開了 {insert_count} 個幾何元素")
+
+    print(f"\n提取到 {len(parser.segments)} 條線段")
+    return parser.segments
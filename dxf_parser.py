@@ -4,10 +4,16 @@ DXF Parser for Wall Quantity Calculator
 使用 DXF Group Codes 資料庫進行解析
 """
 import ezdxf
+from ezdxf import recover
+import contextlib
+import fnmatch
 import math
+import os
+import time
 import json
-from typing import Dict, List, Tuple, Any, Optional
-from dataclasses import dataclass, asdict, field
+import pickle
+import tempfile
+from typing import Dict, List, Tuple, Any, Optional, Iterator, Iterable, Callable, Union
 
 # 導入 DXF 組碼資料庫
 try:
@@ -21,19 +27,192 @@ except ImportError:
     DXF_DB_AVAILABLE = False
     print("[!] DXF Group Codes database not available")
 
-@dataclass
-class WallSegment:
-    """代表一條牆線段"""
-    id: str
-    layer: str
-    entity_type: str
-    start_point: Tuple[float, float]
-    end_point: Tuple[float, float]
-    length: float
-    vertices: List[Tuple[float, float]] = None  # For polylines
+from dxf_stream import DXFProbe, probe_dxf, is_binary_dxf
+from dxf_blocks import BlockFlattener, InsertExpander
+from dxf_splines import SplineBatch
+from segment_store import SegmentStore, WallSegment, segment_id
+from geometry_utils import (
+    ArcParams, BulgePolyline, DEFAULT_ARC_TOLERANCE, arc_points, bulge_points, bulge_polyline_length
+)
+
+
+# 解析器版本：提取結果（線段內容或編號）有變動時遞增，使舊的解析快取失效
+PARSER_VERSION = "7"
+
+# 提取線段時每處理多少個實體回報一次進度
+PROGRESS_INTERVAL = 5000
+
+# 實體類型的輸出順序（線段依此順序分組編號，維持 ID 穩定）
+ENTITY_ORDER = ("LINE", "LWPOLYLINE", "POLYLINE", "ARC", "CIRCLE", "SPLINE", "INSERT")
+
+
+# 圖層篩選條件：圖層名稱集合（可含 * ? [] 萬用字元）或判斷函式 layer -> bool
+LayerSpec = Union[Iterable[str], Callable[[str], bool], None]
+_GLOB_CHARS = frozenset("*?[")
+
+
+class LayerFilter:
+    """
+    圖層篩選器
+    依圖層名稱前綴與 layers（名稱集合、萬用字元樣式或判斷函式）篩選，兩者皆指定時須同時符合。
+    每個圖層名稱只判斷一次，結果快取供後續實體直接查表
+    """
+    
+    def __init__(self, prefix: Optional[str] = None, layers: LayerSpec = None):
+        self.prefix = prefix
+        self.predicate: Optional[Callable[[str], bool]] = None
+        self.names: Optional[frozenset] = None
+        self.patterns: Tuple[str, ...] = ()
+        if callable(layers):
+            self.predicate = layers
+        elif layers is not None:
+            self.names = frozenset([layers] if isinstance(layers, str) else layers)
+            self.patterns = tuple(name for name in self.names if _GLOB_CHARS.intersection(name))
+        self._cache: Dict[str, bool] = {}
     
-    def to_dict(self):
-        return asdict(self)
+    def __call__(self, layer: str) -> bool:
+        try:
+            return self._cache[layer]
+        except KeyError:
+            accepted = self._accepts(layer)
+            self._cache[layer] = accepted
+            return accepted
+    
+    def _accepts(self, layer: str) -> bool:
+        if self.prefix and not layer.startswith(self.prefix):
+            return False
+        if self.predicate is not None:
+            return bool(self.predicate(layer))
+        if self.names is not None:
+            return layer in self.names or any(fnmatch.fnmatchcase(layer, pattern)
+                                              for pattern in self.patterns)
+        return True
+
+
+# ==================== 實體讀取 ====================
+# 將 ezdxf 實體轉為幾何基本資料 (primitive)，第一個元素為實體類型：
+#   ("LINE", layer, start, end)
+#   ("LWPOLYLINE" | "POLYLINE", layer, points, bulges, closed)    bulges 全為 0 時為 None
+#   ("SPLINE", layer, control_points, degree, knots, weights, fit_points, tangents)   見 dxf_splines
+#   ("ARC", layer, center, radius, start_angle, end_angle)      角度單位為度
+#   ("CIRCLE", layer, center, radius)
+#   ("INSERT", layer, block_name, insert_point, x_scale, y_scale, rotation,
+#    column_count, row_count, column_spacing, row_spacing)          MINSERT 陣列；一般 INSERT 為 1, 1, 0, 0
+# 串流讀取 (dxf_stream) 產生相同格式，後續計算共用同一組處理函式
+
+def _read_line(entity) -> tuple:
+    return ("LINE", entity.dxf.layer,
+            (entity.dxf.start.x, entity.dxf.start.y),
+            (entity.dxf.end.x, entity.dxf.end.y))
+
+
+def _read_lwpolyline(entity) -> tuple:
+    points = entity.get_points('xyb')
+    bulges = [p[2] for p in points]
+    return ("LWPOLYLINE", entity.dxf.layer, [(p[0], p[1]) for p in points],
+            bulges if any(bulges) else None, entity.closed)
+
+
+def _read_polyline(entity) -> tuple:
+    bulges = [v.dxf.bulge for v in entity.vertices]
+    return ("POLYLINE", entity.dxf.layer,
+            [(v.dxf.location.x, v.dxf.location.y) for v in entity.vertices],
+            bulges if any(bulges) else None, entity.is_closed)
+
+
+def _read_arc(entity) -> tuple:
+    return ("ARC", entity.dxf.layer,
+            (entity.dxf.center.x, entity.dxf.center.y),
+            entity.dxf.radius, entity.dxf.start_angle, entity.dxf.end_angle)
+
+
+def _read_circle(entity) -> tuple:
+    return ("CIRCLE", entity.dxf.layer,
+            (entity.dxf.center.x, entity.dxf.center.y), entity.dxf.radius)
+
+
+def _read_spline(entity) -> tuple:
+    tangents = None
+    if entity.dxf.hasattr('start_tangent') and entity.dxf.hasattr('end_tangent'):
+        start, end = entity.dxf.start_tangent, entity.dxf.end_tangent
+        tangents = ((start.x, start.y), (end.x, end.y))
+    return ("SPLINE", entity.dxf.layer,
+            [(p[0], p[1]) for p in entity.control_points], entity.dxf.degree,
+            list(entity.knots), list(entity.weights),
+            [(p[0], p[1]) for p in entity.fit_points], tangents)
+
+
+def _read_insert(entity) -> tuple:
+    return ("INSERT", entity.dxf.layer, entity.dxf.name,
+            (entity.dxf.insert.x, entity.dxf.insert.y),
+            entity.dxf.xscale if hasattr(entity.dxf, 'xscale') else 1.0,
+            entity.dxf.yscale if hasattr(entity.dxf, 'yscale') else 1.0,
+            entity.dxf.rotation if hasattr(entity.dxf, 'rotation') else 0,
+            entity.dxf.get('column_count', 1),
+            entity.dxf.get('row_count', 1),
+            entity.dxf.get('column_spacing', 0.0),
+            entity.dxf.get('row_spacing', 0.0))
+
+
+ENTITY_READERS = {
+    "LINE": _read_line,
+    "LWPOLYLINE": _read_lwpolyline,
+    "POLYLINE": _read_polyline,
+    "ARC": _read_arc,
+    "CIRCLE": _read_circle,
+    "SPLINE": _read_spline,
+    "INSERT": _read_insert,
+}
+
+
+def _polyline_geometry(primitive: tuple):
+    """
+    多段線幾何基本資料 → (頂點, 凸度)
+    封閉多段線補上回到起點的閉合邊（閉合邊的凸度為最後一個頂點的凸度）；
+    沒有圓弧段時凸度為 None
+    """
+    _, _, vertices, bulges, closed = primitive
+    if closed and len(vertices) >= 2 and vertices[0] != vertices[-1]:
+        vertices = vertices + [vertices[0]]
+        if bulges:
+            bulges = bulges + [0.0]
+    return vertices, bulges
+
+
+def _polyline_record(primitive: tuple) -> Optional[tuple]:
+    """多段線的線段記錄；有圓弧段時頂點為 BulgePolyline（長度與顯示頂點延後計算）"""
+    vertices, bulges = _polyline_geometry(primitive)
+    if len(vertices) < 2:
+        return None
+    if bulges:
+        vertices = BulgePolyline(vertices, bulges)
+        return (primitive[1], primitive[0], vertices.points[0], vertices.points[-1], None, vertices)
+    return (primitive[1], primitive[0], vertices[0], vertices[-1], None, vertices)
+
+
+class _SegmentSpool:
+    """
+    暫存線段記錄的磁碟緩衝區（串流模式用）
+    記錄以 pickle 逐筆寫入暫存檔，重播時依寫入順序讀回
+    """
+    
+    def __init__(self):
+        self._file = tempfile.TemporaryFile()
+    
+    def append(self, record: tuple):
+        pickle.dump(record, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+    
+    def __iter__(self) -> Iterator[tuple]:
+        self._file.seek(0)
+        while True:
+            try:
+                yield pickle.load(self._file)
+            except EOFError:
+                return
+    
+    def close(self):
+        self._file.close()
+
 
 class DXFParser:
     """解析 DXF 檔案並提取牆線段資訊"""
@@ -42,10 +221,24 @@ class DXFParser:
         self.filepath = filepath
         self.doc = None
         self.layers: Dict[str, dict] = {}
-        self.segments: List[WallSegment] = []
+        self.segments = SegmentStore()  # 欄位式儲存，迭代 / 索引時才建立 WallSegment
         self._segment_counter = 0
+        self._blocks: Dict[str, List[tuple]] = {}  # 圖塊名稱（小寫）→ 幾何基本資料
+        self._block_flattener = self._new_block_flattener()  # 圖塊名稱 → 展平後的區域座標幾何
+        self._spline_cache: Dict[tuple, Optional[tuple]] = {}  # SPLINE 定義 → (頂點, 長度)
         self.dimscale = 1.0  # DXF DIMSCALE 變數（尺寸縮放比例）
         self.insunits = 0    # DXF INSUNITS 變數（插入單位）
+        self.load_report: Dict[str, Any] = {}  # 載入方式與耗時
+        # 弧線 / 圓離散化的弦高誤差上限（繪圖單位）
+        self.arc_tolerance = DEFAULT_ARC_TOLERANCE
+        # True 時弧線 / 圓以參數式保存在 segments 中，需要頂點時才離散化
+        self.parametric_arcs = False
+        # 進度回呼 (階段, 已處理數量, 總數量)；階段為 load / layers / entities
+        self.progress_callback: Optional[Callable[[str, int, int], None]] = None
+    
+    def _report_progress(self, phase: str, done: int, total: int):
+        if self.progress_callback:
+            self.progress_callback(phase, done, total)
     
     def load(self):
         """載入 DXF 檔案（支援多種版本和編碼）"""
@@ -56,22 +249,44 @@ class DXFParser:
             print(f"[X] 檔案不存在: {self.filepath}")
             return False
 
-        # 嘗試多種方式讀取
-        attempts = [
+        load_start = time.perf_counter()
+        self._report_progress("load", 0, 1)
+
+        # 多種讀取方式（預檢無法判斷時依序嘗試）
+        ladder = [
             ("預設讀取", lambda: ezdxf.readfile(self.filepath)),
             ("指定 UTF-8 編碼", lambda: ezdxf.readfile(self.filepath, encoding='utf-8')),
             ("指定 CP950 編碼 (繁中)", lambda: ezdxf.readfile(self.filepath, encoding='cp950')),
             ("指定 GBK 編碼 (簡中)", lambda: ezdxf.readfile(self.filepath, encoding='gbk')),
-            ("自動修復模式", lambda: ezdxf.recover.readfile(self.filepath)),
+            ("自動修復模式", lambda: recover.readfile(self.filepath)),
         ]
 
-        for method_name, read_func in attempts:
+        # 預檢：只讀 HEADER 與一段取樣，事先決定編碼與載入方式
+        probe = probe_dxf(self.filepath)
+        print(f">> 預檢: {probe.reason}")
+        if probe.conclusive:
+            chosen = self._probe_attempt(probe)
+            # 預檢選定的方式失敗時，才退回其餘方式
+            attempts = [chosen] + [a for a in ladder if a[0] != chosen[0]]
+        else:
+            attempts = ladder
+
+        for attempt_no, (method_name, read_func) in enumerate(attempts, 1):
             try:
                 print(f">> 嘗試 {method_name}...")
                 self.doc = read_func()
+                self.load_report = {
+                    "method": method_name,
+                    "probe": probe.reason,
+                    "probe_conclusive": probe.conclusive,
+                    "encoding": probe.encoding,
+                    "attempts": attempt_no,
+                    "seconds": round(time.perf_counter() - load_start, 3),
+                }
                 print(f"[OK] 成功載入 DXF 檔案: {self.filepath}")
                 print(f"     DXF 版本: {self.doc.dxfversion}")
-                print(f"     使用方法: {method_name}")
+                print(f"     使用方法: {method_name} (第 {attempt_no} 次嘗試)")
+                print(f"     載入耗時: {self.load_report['seconds']:.3f} 秒")
 
                 # 檢查檔案是否有效
                 if self.doc.modelspace() is None:
@@ -97,6 +312,7 @@ class DXFParser:
                     self.insunits = 0
                     print("     INSUNITS: 0 (未指定)")
 
+                self._report_progress("load", 1, 1)
                 return True
 
             except IOError as e:
@@ -119,6 +335,14 @@ class DXFParser:
                     print(f"[X] 未知錯誤: {type(e).__name__}: {e}")
                 continue
 
+        self.load_report = {
+            "method": None,
+            "probe": probe.reason,
+            "probe_conclusive": probe.conclusive,
+            "encoding": probe.encoding,
+            "attempts": len(attempts),
+            "seconds": round(time.perf_counter() - load_start, 3),
+        }
         print("\n[X] 所有讀取方法都失敗")
         print("建議：")
         print("  1. 確認檔案不是 DWG 格式（需先轉換為 DXF）")
@@ -126,6 +350,23 @@ class DXFParser:
         print("  3. 在 AutoCAD 中開啟後另存為 DXF，選擇 'AutoCAD 2018 DXF' 格式")
         return False
     
+    def _probe_attempt(self, probe: DXFProbe) -> Tuple[str, Any]:
+        """依預檢結果產生唯一的讀取方式 (名稱, 讀取函式)"""
+        if probe.loader == "recover":
+            return ("自動修復模式", lambda: recover.readfile(self.filepath))
+        
+        if probe.is_binary or probe.encoding == probe.declared_encoding:
+            return ("預設讀取", lambda: ezdxf.readfile(self.filepath))
+        
+        names = {
+            "utf-8": "指定 UTF-8 編碼",
+            "cp950": "指定 CP950 編碼 (繁中)",
+            "gbk": "指定 GBK 編碼 (簡中)",
+        }
+        encoding = probe.encoding
+        name = names.get(encoding, f"指定 {encoding} 編碼")
+        return (name, lambda: ezdxf.readfile(self.filepath, encoding=encoding))
+    
     def extract_layers(self) -> Dict[str, dict]:
         """提取所有圖層資訊"""
         if not self.doc:
@@ -142,6 +383,7 @@ class DXFParser:
 
         # 避免 Unicode 編碼錯誤，不直接 print
         print(f"\n找到 {len(self.layers)} 個圖層")
+        self._report_progress("layers", len(self.layers), len(self.layers))
 
         return self.layers
     
@@ -221,7 +463,7 @@ class DXFParser:
     def _generate_id(self) -> str:
         """生成唯一 ID"""
         self._segment_counter += 1
-        return f"seg_{self._segment_counter:05d}"
+        return segment_id(self._segment_counter - 1)
     
     def _calculate_length(self, start: Tuple, end: Tuple) -> float:
         """計算兩點間距離"""
@@ -236,379 +478,358 @@ class DXFParser:
             total += self._calculate_length(vertices[i], vertices[i + 1])
         return total
     
-    def _transform_point(self, point: Tuple[float, float], 
-                         insert: Tuple[float, float], 
-                         rotation: float, 
-                         x_scale: float, 
-                         y_scale: float) -> Tuple[float, float]:
-        """
-        將圖塊內的座標轉換到世界座標
-        處理縮放、旋轉和平移變換
-        """
-        x, y = point
-        # 先縮放
-        x *= x_scale
-        y *= y_scale
-        # 再旋轉
-        cos_r = math.cos(rotation)
-        sin_r = math.sin(rotation)
-        rx = x * cos_r - y * sin_r
-        ry = x * sin_r + y * cos_r
-        # 最後平移
-        return (rx + insert[0], ry + insert[1])
-    
-    def extract_wall_entities(self, wall_layer_prefix: str = "A-WALL") -> List[WallSegment]:
+    def extract_wall_entities(self, wall_layer_prefix: str = "A-WALL",
+                              layers: LayerSpec = None) -> SegmentStore:
         """
         提取牆相關的實體
-        預設只提取以 'A-WALL' 開頭的圖層（建築圖層命名慣例）
+        預設只提取以 'A-WALL' 開頭的圖層（建築圖層命名慣例）；
+        layers 可再指定圖層名稱集合、萬用字元樣式（如 "A-WALL-*"）或判斷函式，
+        不符合的實體在讀取幾何之前就略過
+
+        只走訪模型空間一次，依實體類型分派到對應的處理函式；
+        輸出順序仍依 ENTITY_ORDER 分組，線段 ID 與逐類型查詢時相同
         """
         if not self.doc:
-            return []
+            return self.segments
         
         msp = self.doc.modelspace()
+        layer_filter = LayerFilter(wall_layer_prefix, layers)
+        handlers = self._entity_handlers()
+        buckets = {entity_type: SegmentStore() for entity_type in ENTITY_ORDER}
+        inserts = self._insert_expander(buckets["INSERT"], layer_filter)
+        handlers["INSERT"] = inserts.handle
+        splines = self._spline_batch(buckets["SPLINE"])
+        handlers["SPLINE"] = splines.handle
+        total = len(msp)
+        self._report_progress("entities", 0, total)
         
-        # 處理 LINE 實體
-        for entity in msp.query("LINE"):
-            layer = entity.dxf.layer
-            if wall_layer_prefix and not layer.startswith(wall_layer_prefix):
-                continue
-            
-            start = (entity.dxf.start.x, entity.dxf.start.y)
-            end = (entity.dxf.end.x, entity.dxf.end.y)
-            length = self._calculate_length(start, end)
-            
-            segment = WallSegment(
-                id=self._generate_id(),
-                layer=layer,
-                entity_type="LINE",
-                start_point=start,
-                end_point=end,
-                length=length
-            )
-            self.segments.append(segment)
-        
-        # 處理 LWPOLYLINE 實體 (輕量多段線，最常見)
-        for entity in msp.query("LWPOLYLINE"):
-            layer = entity.dxf.layer
-            if wall_layer_prefix and not layer.startswith(wall_layer_prefix):
-                continue
+        for index, entity in enumerate(msp, 1):
+            if index % PROGRESS_INTERVAL == 0:
+                self._report_progress("entities", index, total)
             
-            # 取得所有頂點
-            vertices = [(p[0], p[1]) for p in entity.get_points()]
-            if len(vertices) < 2:
+            entity_type = entity.dxftype()
+            reader = ENTITY_READERS.get(entity_type)
+            if reader is None:
                 continue
             
-            length = self._calculate_polyline_length(vertices)
-            
-            segment = WallSegment(
-                id=self._generate_id(),
-                layer=layer,
-                entity_type="LWPOLYLINE",
-                start_point=vertices[0],
-                end_point=vertices[-1],
-                length=length,
-                vertices=vertices
-            )
-            self.segments.append(segment)
-        
-        # 處理 POLYLINE 實體 (舊版多段線)
-        for entity in msp.query("POLYLINE"):
-            layer = entity.dxf.layer
-            if wall_layer_prefix and not layer.startswith(wall_layer_prefix):
-                continue
-            
-            vertices = [(v.dxf.location.x, v.dxf.location.y) for v in entity.vertices]
-            if len(vertices) < 2:
-                continue
-            
-            length = self._calculate_polyline_length(vertices)
-            
-            segment = WallSegment(
-                id=self._generate_id(),
-                layer=layer,
-                entity_type="POLYLINE",
-                start_point=vertices[0],
-                end_point=vertices[-1],
-                length=length,
-                vertices=vertices
-            )
-            self.segments.append(segment)
-        
-        # 處理 ARC 實體 (弧線)
-        for entity in msp.query("ARC"):
-            layer = entity.dxf.layer
-            if wall_layer_prefix and not layer.startswith(wall_layer_prefix):
+            if not layer_filter(entity.dxf.layer):
                 continue
             
             try:
-                # 取得弧線資訊
-                center = (entity.dxf.center.x, entity.dxf.center.y)
-                radius = entity.dxf.radius
-                start_angle = math.radians(entity.dxf.start_angle)
-                end_angle = math.radians(entity.dxf.end_angle)
-                
-                # 計算起點和終點
-                start = (center[0] + radius * math.cos(start_angle),
-                        center[1] + radius * math.sin(start_angle))
-                end = (center[0] + radius * math.cos(end_angle),
-                      center[1] + radius * math.sin(end_angle))
-                
-                # 計算弧長
-                angle_diff = end_angle - start_angle
-                if angle_diff < 0:
-                    angle_diff += 2 * math.pi
-                length = radius * angle_diff
-                
-                # 生成弧線的多邊形近似點（用於繪製）
-                num_points = max(8, int(abs(angle_diff) / (math.pi / 16)))
-                vertices = []
-                for i in range(num_points + 1):
-                    t = start_angle + (angle_diff * i / num_points)
-                    vx = center[0] + radius * math.cos(t)
-                    vy = center[1] + radius * math.sin(t)
-                    vertices.append((vx, vy))
-                
-                segment = WallSegment(
-                    id=self._generate_id(),
-                    layer=layer,
-                    entity_type="ARC",
-                    start_point=start,
-                    end_point=end,
-                    length=length,
-                    vertices=vertices
-                )
-                self.segments.append(segment)
+                primitive = reader(entity)
             except Exception as e:
-                print(f"  [!] 無法處理 ARC 實體: {e}")
-        
-        # 處理 CIRCLE 實體 (圓形) - 轉換為多邊形近似
-        for entity in msp.query("CIRCLE"):
-            layer = entity.dxf.layer
-            if wall_layer_prefix and not layer.startswith(wall_layer_prefix):
+                print(f"  [!] 無法讀取 {entity_type} 實體: {e}")
                 continue
             
-            try:
-                center = (entity.dxf.center.x, entity.dxf.center.y)
-                radius = entity.dxf.radius
-                
-                # 計算圓周長
-                length = 2 * math.pi * radius
-                
-                # 生成圓的多邊形近似點
-                num_points = 32
-                vertices = []
-                for i in range(num_points + 1):
-                    angle = 2 * math.pi * i / num_points
-                    vx = center[0] + radius * math.cos(angle)
-                    vy = center[1] + radius * math.sin(angle)
-                    vertices.append((vx, vy))
-                
-                segment = WallSegment(
-                    id=self._generate_id(),
-                    layer=layer,
-                    entity_type="CIRCLE",
-                    start_point=vertices[0],
-                    end_point=vertices[-1],
-                    length=length,
-                    vertices=vertices
-                )
-                self.segments.append(segment)
-            except Exception as e:
-                print(f"  [!] 無法處理 CIRCLE 實體: {e}")
+            handlers[entity_type](primitive, buckets[entity_type], layer_filter)
         
-        # 處理 SPLINE 實體 (樣條曲線)
-        for entity in msp.query("SPLINE"):
-            layer = entity.dxf.layer
-            if wall_layer_prefix and not layer.startswith(wall_layer_prefix):
-                continue
-            
-            try:
-                # 取得控制點或計算點
-                control_points = list(entity.control_points)
-                if len(control_points) < 2:
-                    continue
-                
-                vertices = [(p[0], p[1]) for p in control_points]
-                length = self._calculate_polyline_length(vertices)
-                
-                segment = WallSegment(
-                    id=self._generate_id(),
-                    layer=layer,
-                    entity_type="SPLINE",
-                    start_point=vertices[0],
-                    end_point=vertices[-1],
-                    length=length,
-                    vertices=vertices
-                )
-                self.segments.append(segment)
-            except Exception as e:
-                print(f"  [!] 無法處理 SPLINE 實體: {e}")
+        inserts.flush()
+        splines.flush()
         
-        # 處理 INSERT 實體 (圖塊引用) - 展開圖塊中的幾何
-        insert_count = 0
-        for entity in msp.query("INSERT"):
-            layer = entity.dxf.layer
-            if wall_layer_prefix and not layer.startswith(wall_layer_prefix):
-                continue
-            
-            try:
-                # 取得圖塊名稱和定義
-                block_name = entity.dxf.name
-                if block_name not in self.doc.blocks:
-                    continue
-                
-                block = self.doc.blocks[block_name]
-                
-                # 取得變換參數
-                insert_point = (entity.dxf.insert.x, entity.dxf.insert.y)
-                x_scale = entity.dxf.xscale if hasattr(entity.dxf, 'xscale') else 1.0
-                y_scale = entity.dxf.yscale if hasattr(entity.dxf, 'yscale') else 1.0
-                rotation = math.radians(entity.dxf.rotation if hasattr(entity.dxf, 'rotation') else 0)
-                
-                # 遍歷圖塊中的實體
-                for block_entity in block:
-                    entity_type = block_entity.dxftype()
-                    block_layer = block_entity.dxf.layer if hasattr(block_entity.dxf, 'layer') else layer
-                    
-                    # 如果圖塊實體的圖層是 "0"，使用 INSERT 的圖層
-                    if block_layer == "0":
-                        block_layer = layer
-                    
-                    if wall_layer_prefix and not block_layer.startswith(wall_layer_prefix):
-                        continue
-                    
-                    if entity_type == "LINE":
-                        start = self._transform_point(
-                            (block_entity.dxf.start.x, block_entity.dxf.start.y),
-                            insert_point, rotation, x_scale, y_scale
-                        )
-                        end = self._transform_point(
-                            (block_entity.dxf.end.x, block_entity.dxf.end.y),
-                            insert_point, rotation, x_scale, y_scale
-                        )
-                        length = self._calculate_length(start, end)
-                        
-                        segment = WallSegment(
-                            id=self._generate_id(),
-                            layer=block_layer,
-                            entity_type="LINE",
-                            start_point=start,
-                            end_point=end,
-                            length=length
-                        )
-                        self.segments.append(segment)
-                        insert_count += 1
-                    
-                    elif entity_type == "LWPOLYLINE":
-                        vertices = []
-                        for p in block_entity.get_points():
-                            tp = self._transform_point((p[0], p[1]), insert_point, rotation, x_scale, y_scale)
-                            vertices.append(tp)
-                        
-                        if len(vertices) >= 2:
-                            length = self._calculate_polyline_length(vertices)
-                            segment = WallSegment(
-                                id=self._generate_id(),
-                                layer=block_layer,
-                                entity_type="LWPOLYLINE",
-                                start_point=vertices[0],
-                                end_point=vertices[-1],
-                                length=length,
-                                vertices=vertices
-                            )
-                            self.segments.append(segment)
-                            insert_count += 1
-                    
-                    elif entity_type == "ARC":
-                        center = self._transform_point(
-                            (block_entity.dxf.center.x, block_entity.dxf.center.y),
-                            insert_point, rotation, x_scale, y_scale
-                        )
-                        radius = block_entity.dxf.radius * max(abs(x_scale), abs(y_scale))
-                        start_angle = math.radians(block_entity.dxf.start_angle) + rotation
-                        end_angle = math.radians(block_entity.dxf.end_angle) + rotation
-                        
-                        angle_diff = end_angle - start_angle
-                        if angle_diff < 0:
-                            angle_diff += 2 * math.pi
-                        
-                        num_points = max(8, int(abs(angle_diff) / (math.pi / 16)))
-                        vertices = []
-                        for i in range(num_points + 1):
-                            t = start_angle + (angle_diff * i / num_points)
-                            vx = center[0] + radius * math.cos(t)
-                            vy = center[1] + radius * math.sin(t)
-                            vertices.append((vx, vy))
-                        
-                        if len(vertices) >= 2:
-                            length = radius * angle_diff
-                            segment = WallSegment(
-                                id=self._generate_id(),
-                                layer=block_layer,
-                                entity_type="ARC",
-                                start_point=vertices[0],
-                                end_point=vertices[-1],
-                                length=length,
-                                vertices=vertices
-                            )
-                            self.segments.append(segment)
-                            insert_count += 1
-                    
-                    elif entity_type == "CIRCLE":
-                        center = self._transform_point(
-                            (block_entity.dxf.center.x, block_entity.dxf.center.y),
-                            insert_point, rotation, x_scale, y_scale
-                        )
-                        radius = block_entity.dxf.radius * max(abs(x_scale), abs(y_scale))
-                        
-                        num_points = 32
-                        vertices = []
-                        for i in range(num_points + 1):
-                            angle = 2 * math.pi * i / num_points
-                            vx = center[0] + radius * math.cos(angle)
-                            vy = center[1] + radius * math.sin(angle)
-                            vertices.append((vx, vy))
-                        
-                        length = 2 * math.pi * radius
-                        segment = WallSegment(
-                            id=self._generate_id(),
-                            layer=block_layer,
-                            entity_type="CIRCLE",
-                            start_point=vertices[0],
-                            end_point=vertices[-1],
-                            length=length,
-                            vertices=vertices
-                        )
-                        self.segments.append(segment)
-                        insert_count += 1
-                        
-            except Exception as e:
-                print(f"  [!] 無法處理 INSERT 實體 '{entity.dxf.name}': {e}")
+        # 依固定類型順序串接（線段 ID 由位置決定）
+        for entity_type in ENTITY_ORDER:
+            self.segments.extend(buckets[entity_type])
+        self._finish_segments()
+        
+        self._report_progress("entities", total, total)
         
+        insert_count = len(buckets["INSERT"])
         if insert_count > 0:
             print(f"  從圖塊中展開了 {insert_count} 個幾何元素")
         
         print(f"\n提取到 {len(self.segments)} 條線段")
         return self.segments
     
-    def summarize_by_layer(self) -> Dict[str, dict]:
-        """按圖層統計牆長度"""
-        summary = {}
+    def iter_wall_entities_streaming(self, wall_layer_prefix: str = "A-WALL",
+                                     layers: LayerSpec = None) -> Iterator[WallSegment]:
+        """
+        串流模式提取牆線段（不需先呼叫 load()）
+
+        直接讀取 DXF 組碼串流，不建立 ezdxf 文件，記憶體用量不隨檔案大小成長。
+        線段 ID 與 extract_wall_entities 相同：LINE 讀到即產生，
+        其他類型先暫存到磁碟，讀完後依 ENTITY_ORDER 依序產生。
+        線段不會加入 self.segments，由呼叫端自行處理。
+        """
+        if is_binary_dxf(self.filepath):
+            print("  [!] 二進位 DXF 不支援串流模式，改用完整載入")
+            if self.doc or self.load():
+                yield from self.extract_wall_entities(wall_layer_prefix, layers)
+            return
         
-        for seg in self.segments:
-            if seg.layer not in summary:
-                summary[seg.layer] = {
-                    "layer": seg.layer,
-                    "count": 0,
-                    "total_length": 0.0,
-                    "segments": []
-                }
+        layer_filter = LayerFilter(wall_layer_prefix, layers)
+        handlers = self._entity_handlers()
+        line_buffer: list = []
+        spools = {entity_type: _SegmentSpool() for entity_type in ENTITY_ORDER if entity_type != "LINE"}
+        
+        try:
+            with self._open_stream() as stream:
+                inserts = self._insert_expander(spools["INSERT"], layer_filter)
+                handlers["INSERT"] = inserts.handle
+                splines = self._spline_batch(spools["SPLINE"])
+                handlers["SPLINE"] = splines.handle
+                
+                # 串流模式以檔案位元組位置回報進度
+                file_size = os.path.getsize(self.filepath)
+                for index, primitive in enumerate(stream.iter_entities(layer_filter), 1):
+                    if index % PROGRESS_INTERVAL == 0:
+                        self._report_progress("entities", stream.position, file_size)
+                    
+                    entity_type = primitive[0]
+                    if entity_type == "LINE":
+                        handlers["LINE"](primitive, line_buffer, layer_filter)
+                        for record in line_buffer:
+                            yield self._make_segment(record)
+                        line_buffer.clear()
+                    else:
+                        handlers[entity_type](primitive, spools[entity_type], layer_filter)
+                
+                inserts.flush()
+                splines.flush()
             
-            summary[seg.layer]["count"] += 1
-            summary[seg.layer]["total_length"] += seg.length
-            summary[seg.layer]["segments"].append(seg.id)
+            self._report_progress("entities", file_size, file_size)
+            for entity_type in ENTITY_ORDER:
+                if entity_type == "LINE":
+                    continue
+                for record in spools[entity_type]:
+                    yield self._make_segment(record)
+        finally:
+            for spool in spools.values():
+                spool.close()
+    
+    def extract_wall_entities_parallel(self, wall_layer_prefix: str = "A-WALL",
+                                       workers: Optional[int] = None,
+                                       layers: LayerSpec = None) -> SegmentStore:
+        """
+        多行程平行提取牆線段（不需先呼叫 load()）
+        結果與 extract_wall_entities 完全相同（含線段 ID 順序），詳見 dxf_parallel
+        """
+        from dxf_parallel import extract_parallel
         
-        return summary
+        if is_binary_dxf(self.filepath):
+            print("  [!] 二進位 DXF 不支援平行提取，改用完整載入")
+            if not self.doc and not self.load():
+                return SegmentStore()
+            return self.extract_wall_entities(wall_layer_prefix, layers)
+        
+        return extract_parallel(self, wall_layer_prefix, workers, layers)
+
+    def preview_layers(self) -> Dict[str, dict]:
+        """
+        圖層預覽（不需先呼叫 load()）：一次掃描取得每個圖層的
+        實體數、線段數、總長度與範圍，詳見 dxf_preview
+        """
+        from dxf_preview import preview_layers
+        return preview_layers(self)
+
+    @contextlib.contextmanager
+    def _open_stream(self):
+        """
+        開啟串流讀取器並讀入 ENTITIES 之前的區段（串流與平行模式共用）
+        標頭變數、圖層與圖塊定義會設定到 parser 上
+        """
+        from dxf_stream import DXFStream
+        
+        probe = probe_dxf(self.filepath)
+        encoding = probe.encoding if probe.conclusive else None
+        
+        with DXFStream(self.filepath, encoding=encoding) as stream:
+            self.dimscale = stream.header.get('$DIMSCALE', 1.0)
+            self.insunits = stream.header.get('$INSUNITS', 0)
+            self.layers.update(stream.layers)
+            self._blocks = stream.blocks
+            self._block_flattener = self._new_block_flattener()
+            self._report_progress("layers", len(self.layers), len(self.layers))
+            yield stream
+    
+    def _finish_segments(self):
+        """提取結束後批次計算待定的長度，並離散化弧線（parametric_arcs 時保留參數式）"""
+        self.segments.fill_lengths()
+        self.segments.arc_tolerance = self.arc_tolerance
+        if not self.parametric_arcs:
+            self.segments.tessellate()
+        self._segment_counter = len(self.segments)
+    
+    def _make_segment(self, record: tuple) -> WallSegment:
+        """將處理函式產生的記錄編號為 WallSegment"""
+        layer, entity_type, start, end, length, vertices = record
+        if isinstance(vertices, ArcParams):
+            vertices = arc_points(vertices, self.arc_tolerance)
+        elif isinstance(vertices, BulgePolyline):
+            if length is None:
+                length = bulge_polyline_length(vertices)
+            vertices = bulge_points(vertices, self.arc_tolerance)
+        if length is None:
+            length = (self._calculate_polyline_length(vertices) if vertices
+                      else self._calculate_length(start, end))
+        return WallSegment(
+            id=self._generate_id(),
+            layer=layer,
+            entity_type=entity_type,
+            start_point=start,
+            end_point=end,
+            length=length,
+            vertices=vertices
+        )
+    
+    def _entity_handlers(self) -> Dict[str, Any]:
+        """實體類型 → 處理函式"""
+        return {
+            "LINE": self._handle_line,
+            "LWPOLYLINE": self._handle_lwpolyline,
+            "POLYLINE": self._handle_polyline,
+            "ARC": self._handle_arc,
+            "CIRCLE": self._handle_circle,
+            "SPLINE": self._handle_spline,
+            "INSERT": self._handle_insert,
+        }
+    
+    def _new_block_flattener(self) -> BlockFlattener:
+        return BlockFlattener(self._get_block, self._arc_vertices, self._circle_vertices,
+                              self._polyline_vertices)
+    
+    def _insert_expander(self, out, layer_filter: 'LayerFilter') -> InsertExpander:
+        """
+        建立 INSERT 批次展開器：以 expander.handle 作為 INSERT 處理函式，
+        走訪結束後呼叫 flush() 依引用順序寫入 out
+        """
+        return InsertExpander(self._block_flattener, out, layer_filter)
+    
+    def _spline_batch(self, out) -> SplineBatch:
+        """
+        建立 SPLINE 批次計算器：以 batch.handle 作為 SPLINE 處理函式，
+        走訪結束後呼叫 flush() 依原始順序寫入 out（相同定義的曲線只計算一次）
+        """
+        return SplineBatch(out, self.arc_tolerance, self._spline_cache)
+    
+    def _get_block(self, block_name: str) -> Optional[List[tuple]]:
+        """
+        取得圖塊定義的幾何基本資料（每個圖塊只讀取一次）
+        找不到圖塊時回傳 None
+        """
+        key = block_name.lower()
+        if key in self._blocks:
+            return self._blocks[key]
+        
+        if not self.doc or block_name not in self.doc.blocks:
+            return None
+        
+        primitives = []
+        for block_entity in self.doc.blocks[block_name]:
+            reader = ENTITY_READERS.get(block_entity.dxftype())
+            if reader is not None:
+                primitives.append(reader(block_entity))
+        self._blocks[key] = primitives
+        return primitives
+    
+    # ==================== 實體處理函式 ====================
+    # 每個處理函式接收幾何基本資料 (見 ENTITY_READERS)，
+    # 將 (圖層, 類型, 起點, 終點, 長度, 頂點) 加入 out，由呼叫端統一編號
+    # 直線與多段線的長度為 None：由 SegmentStore.fill_lengths 批次計算；
+    # 弧線與圓的頂點為 ArcParams、含圓弧段的多段線為 BulgePolyline：由 SegmentStore.tessellate 批次離散化
+    # （串流模式皆由 _make_segment 逐筆計算）
+    
+    def _handle_line(self, primitive: tuple, out: list, layer_filter: 'LayerFilter'):
+        """處理 LINE 實體"""
+        _, layer, start, end = primitive
+        out.append((layer, "LINE", start, end, None, None))
+    
+    def _handle_lwpolyline(self, primitive: tuple, out: list, layer_filter: 'LayerFilter'):
+        """處理 LWPOLYLINE 實體 (輕量多段線，最常見)"""
+        record = _polyline_record(primitive)
+        if record is not None:
+            out.append(record)
+    
+    def _handle_polyline(self, primitive: tuple, out: list, layer_filter: 'LayerFilter'):
+        """處理 POLYLINE 實體 (舊版多段線)"""
+        record = _polyline_record(primitive)
+        if record is not None:
+            out.append(record)
+    
+    def _handle_arc(self, primitive: tuple, out: list, layer_filter: 'LayerFilter'):
+        """處理 ARC 實體 (弧線)"""
+        try:
+            # 取得弧線資訊
+            _, layer, center, radius, start_angle, end_angle = primitive
+            start_angle = math.radians(start_angle)
+            end_angle = math.radians(end_angle)
+            
+            # 計算起點和終點
+            start = (center[0] + radius * math.cos(start_angle),
+                    center[1] + radius * math.sin(start_angle))
+            end = (center[0] + radius * math.cos(end_angle),
+                  center[1] + radius * math.sin(end_angle))
+            
+            # 計算弧長
+            angle_diff = end_angle - start_angle
+            if angle_diff < 0:
+                angle_diff += 2 * math.pi
+            length = radius * angle_diff
+            
+            # 弧線參數（多邊形近似點於提取結束後批次產生）
+            arc = ArcParams(center[0], center[1], radius, start_angle, angle_diff)
+            out.append((layer, "ARC", start, end, length, arc))
+        except Exception as e:
+            print(f"  [!] 無法處理 ARC 實體: {e}")
+    
+    def _handle_circle(self, primitive: tuple, out: list, layer_filter: 'LayerFilter'):
+        """處理 CIRCLE 實體 (圓形) - 轉換為多邊形近似"""
+        try:
+            _, layer, center, radius = primitive
+            
+            # 計算圓周長
+            length = 2 * math.pi * radius
+            
+            # 圓以 0° 為起點的整圈弧線表示（多邊形近似點於提取結束後批次產生）
+            start = (center[0] + radius, center[1])
+            end = (center[0] + radius * math.cos(2 * math.pi),
+                   center[1] + radius * math.sin(2 * math.pi))
+            arc = ArcParams(center[0], center[1], radius, 0.0, 2 * math.pi)
+            out.append((layer, "CIRCLE", start, end, length, arc))
+        except Exception as e:
+            print(f"  [!] 無法處理 CIRCLE 實體: {e}")
+    
+    def _handle_spline(self, primitive: tuple, out: list, layer_filter: 'LayerFilter'):
+        """
+        處理 SPLINE 實體 (樣條曲線)
+        單一曲線立即計算；大量曲線請使用 _spline_batch 批次處理
+        """
+        splines = self._spline_batch(out)
+        splines.handle(primitive)
+        splines.flush()
+    
+    def _handle_insert(self, primitive: tuple, out: list, layer_filter: 'LayerFilter'):
+        """
+        處理 INSERT 實體 (圖塊引用) - 展開圖塊中的幾何（含巢狀圖塊）
+        單一引用立即展開；大量引用請使用 _insert_expander 批次處理
+        """
+        inserts = self._insert_expander(out, layer_filter)
+        inserts.handle(primitive)
+        inserts.flush()
+    
+    def _arc_vertices(self, center: Tuple[float, float], radius: float,
+                      start_angle: float, angle_diff: float) -> List[Tuple[float, float]]:
+        """生成弧線的多邊形近似點（線段數依弦高誤差決定）"""
+        arc = ArcParams(center[0], center[1], radius, start_angle, angle_diff)
+        return arc_points(arc, self.arc_tolerance)
+    
+    def _circle_vertices(self, center: Tuple[float, float], radius: float) -> List[Tuple[float, float]]:
+        """生成圓的多邊形近似點（線段數依弦高誤差決定）"""
+        return self._arc_vertices(center, radius, 0.0, 2 * math.pi)
+    
+    def _polyline_vertices(self, primitive: tuple) -> Tuple[List[Tuple[float, float]], Optional[float]]:
+        """
+        多段線的頂點（含閉合邊，圓弧段依弦高誤差離散化）
+        有圓弧段時一併回傳精確長度，否則長度為 None
+        """
+        vertices, bulges = _polyline_geometry(primitive)
+        if not bulges or len(vertices) < 2:
+            return vertices, None
+        polyline = BulgePolyline(vertices, bulges)
+        return bulge_points(polyline, self.arc_tolerance), bulge_polyline_length(polyline)
+    
+    def summarize_by_layer(self) -> Dict[str, dict]:
+        """按圖層統計牆長度"""
+        return self.segments.summarize_by_layer()
     
     def print_summary(self):
         """印出統計摘要"""
@@ -640,7 +861,7 @@ class DXFParser:
             "dimscale": self.dimscale,
             "insunits": self.insunits,
             "layers": self.layers,
-            "segments": [seg.to_dict() for seg in self.segments],
+            "segments": self.segments.to_dicts(),
             "summary": self.summarize_by_layer()
         }
         
@@ -0,0 +1,401 @@
+"""
+Layer Preview for Wall Quantity Calculator
+圖層預覽：一次掃描模型空間，統計每個圖層的實體數、線段數、總長度與範圍
+
+不建立線段記錄，供圖層選擇視窗在完整解析之前顯示：
+    - ASCII DXF：ENTITIES 區段分塊讀入，組碼與數值轉為 NumPy 陣列後向量化計算，
+      不建立逐一實體的物件
+    - 二進位 DXF：以 ezdxf 載入後逐一讀取實體
+長度的計算方式與完整解析相同（多段線含凸度與閉合邊，圖塊引用依 dxf_blocks 展開），
+只有 SPLINE 以擬合點（沒有擬合點時為控制點）折線估計。
+範圍中的 ARC 與多段線圓弧段以完整圓估計（可能略大於實際範圍）。
+"""
+import math
+import os
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from dxf_blocks import BlockFlattener, summarize_inserts
+from dxf_parser import DXFParser, ENTITY_READERS, _polyline_geometry
+from dxf_stream import is_binary_dxf, tag_float
+from geometry_utils import bulge_arcs, bulge_length_factors, polyline_lengths
+
+# ENTITIES 區段每次讀入的位元組數（限制記憶體用量）
+PREVIEW_CHUNK_SIZE = 32 * 1024 * 1024
+
+# 附屬於前一個實體的類型，不是獨立的模型空間實體
+_CONTINUATION_TYPES = frozenset((b"VERTEX", b"SEQEND", b"ATTRIB"))
+
+
+class LayerTotals:
+    """各圖層的累計值：實體數、線段數、總長度、範圍 [min_x, min_y, max_x, max_y]"""
+
+    def __init__(self):
+        self.entries: Dict[str, list] = {}
+
+    def _entry(self, layer: str) -> list:
+        entry = self.entries.get(layer)
+        if entry is None:
+            entry = self.entries[layer] = [0, 0, 0.0, math.inf, math.inf, -math.inf, -math.inf]
+        return entry
+
+    def add_entities(self, layer: str, count: int = 1):
+        self._entry(layer)[0] += count
+
+    def add_segments(self, layer: str, count: int, length: float,
+                     min_x: float, min_y: float, max_x: float, max_y: float):
+        entry = self._entry(layer)
+        entry[1] += count
+        entry[2] += length
+        entry[3] = min(entry[3], min_x)
+        entry[4] = min(entry[4], min_y)
+        entry[5] = max(entry[5], max_x)
+        entry[6] = max(entry[6], max_y)
+
+    def add_inserts(self, flattener: BlockFlattener, refs: List[tuple]):
+        """圖塊引用展開後的線段（由 dxf_blocks.summarize_inserts 計算）"""
+        if not refs:
+            return
+        for layer, (count, length, *bbox) in summarize_inserts(flattener, refs).items():
+            self.add_segments(layer, count, length, *bbox)
+
+    def stats(self, layer: str) -> dict:
+        entity_count, segment_count, length, min_x, min_y, max_x, max_y = self.entries.get(
+            layer, [0, 0, 0.0, math.inf, math.inf, -math.inf, -math.inf])
+        return {
+            "entity_count": entity_count,
+            "segment_count": segment_count,
+            "total_length": length,
+            "bbox": [min_x, min_y, max_x, max_y] if segment_count else None,
+        }
+
+
+def preview_layers(parser: DXFParser) -> Dict[str, dict]:
+    """
+    掃描模型空間一次，回傳所有圖層（含圖層表中沒有實體的圖層）：
+    圖層表資訊 + entity_count（模型空間實體數）、segment_count（完整解析會產生的線段數）、
+    total_length、bbox（[min_x, min_y, max_x, max_y]，沒有線段時為 None）
+    """
+    totals = LayerTotals()
+    if is_binary_dxf(parser.filepath):
+        _scan_document(parser, totals)
+    else:
+        with parser._open_stream() as stream:
+            size = os.path.getsize(parser.filepath)
+            parts = max(1, math.ceil((size - stream.position) / PREVIEW_CHUNK_SIZE))
+            ranges = stream.partition_entities(parts)
+            with open(parser.filepath, "rb") as fp:
+                for start, end in ranges:
+                    fp.seek(start)
+                    _scan_tags(fp.read(end - start), stream.decode, parser._block_flattener, totals)
+                    parser._report_progress("entities", end, size)
+
+    layers: Dict[str, dict] = {}
+    for name in list(parser.layers) + [name for name in totals.entries if name not in parser.layers]:
+        info = parser.layers.get(name) or {
+            "name": name, "color": 7, "is_on": True, "is_frozen": False, "status": "ON"
+        }
+        layers[name] = {**info, **totals.stats(name)}
+    return layers
+
+
+# ==================== 二進位 DXF（ezdxf） ====================
+
+def _scan_document(parser: DXFParser, totals: LayerTotals):
+    if not parser.doc and not parser.load():
+        raise ValueError("無法解析 DXF 檔案")
+    parser.extract_layers()
+
+    refs = []
+    for entity in parser.doc.modelspace():
+        layer = entity.dxf.layer
+        totals.add_entities(layer)
+        reader = ENTITY_READERS.get(entity.dxftype())
+        if reader is None:
+            continue
+        try:
+            primitive = reader(entity)
+        except Exception as e:
+            print(f"  [!] 無法讀取 {entity.dxftype()} 實體: {e}")
+            continue
+        if primitive[0] == "INSERT":
+            refs.append(primitive)
+            continue
+        stats = _primitive_stats(primitive)
+        if stats is not None:
+            totals.add_segments(layer, 1, *stats)
+    totals.add_inserts(parser._block_flattener, refs)
+
+
+def _primitive_stats(primitive: tuple) -> Optional[tuple]:
+    """單一幾何基本資料的 (長度, min_x, min_y, max_x, max_y)；不產生線段時為 None"""
+    entity_type = primitive[0]
+    if entity_type in ("ARC", "CIRCLE"):
+        center, radius = primitive[2], primitive[3]
+        if entity_type == "ARC":
+            sweep = math.radians(primitive[5]) - math.radians(primitive[4])
+            if sweep < 0:
+                sweep += 2 * math.pi
+        else:
+            sweep = 2 * math.pi
+        return (radius * sweep, center[0] - radius, center[1] - radius,
+                center[0] + radius, center[1] + radius)
+
+    bulges = None
+    if entity_type == "LINE":
+        points = [primitive[2], primitive[3]]
+    elif entity_type in ("LWPOLYLINE", "POLYLINE"):
+        points, bulges = _polyline_geometry(primitive)
+        if len(points) < 2:
+            return None
+    elif entity_type == "SPLINE":
+        points = primitive[6] if len(primitive[6]) >= 2 else primitive[2]
+        if len(points) < 2:
+            return None
+    else:
+        return None
+
+    length = float(polyline_lengths(points, [0, len(points)], bulges)[0])
+    xs = [p[0] for p in points]
+    ys = [p[1] for p in points]
+    extent = [min(xs), min(ys), max(xs), max(ys)]
+    if bulges:
+        edges = [i for i, bulge in enumerate(bulges[:-1]) if bulge]
+        if edges:
+            bounds = _bulge_bounds(np.asarray(points)[edges], np.asarray(points)[np.add(edges, 1)],
+                                   np.asarray(bulges)[edges])
+            extent = [min(extent[0], bounds[:, 0].min()), min(extent[1], bounds[:, 1].min()),
+                      max(extent[2], bounds[:, 2].max()), max(extent[3], bounds[:, 3].max())]
+    return (length, *map(float, extent))
+
+
+def _bulge_bounds(starts: np.ndarray, ends: np.ndarray, bulges: np.ndarray) -> np.ndarray:
+    """圓弧段的範圍 (K, 4)：與 ARC 相同以完整圓估計"""
+    arcs = bulge_arcs(starts, ends, bulges)
+    center_x, center_y, radius = arcs[:, 0], arcs[:, 1], arcs[:, 2]
+    return np.stack([center_x - radius, center_y - radius,
+                     center_x + radius, center_y + radius], axis=1)
+
+
+# ==================== ASCII DXF（組碼陣列） ====================
+
+def _numbers(values: List[bytes], dtype=np.float64) -> np.ndarray:
+    """原始數值轉為陣列；有無法轉換的值時逐一轉換（無效值為 0）"""
+    convert = int if dtype == np.int64 else float
+    try:
+        return np.array(list(map(convert, values)), dtype=dtype)
+    except ValueError:
+        return np.array([tag_float(value) for value in values]).astype(dtype)
+
+
+def _scan_tags(data: bytes, decode: Callable[[bytes], str], flattener: BlockFlattener,
+               totals: LayerTotals):
+    """
+    統計一段 ENTITIES 內容（須從實體開頭起算，POLYLINE 不可被切開）
+    每個標籤記錄所屬的頂層實體 (owner) 與是否位於實體本身（而非 VERTEX）
+    """
+    # 與 iter_tags 相同，值不含行尾的 \r（AutoCAD 預設以 CRLF 存檔）
+    if b"\r" in data:
+        data = data.replace(b"\r\n", b"\n")
+    lines = data.split(b"\n")
+    if len(lines) % 2:
+        lines.pop()
+    if not lines:
+        return
+    codes = _numbers(lines[0::2], np.int64)
+    values = lines[1::2]
+
+    is_start = codes == 0
+    sub_starts = np.flatnonzero(is_start)
+    if not len(sub_starts):
+        return
+    sub_names = np.array([values[i].strip() for i in sub_starts.tolist()])
+    sub_top = ~np.isin(sub_names, list(_CONTINUATION_TYPES))
+    # 區段開頭不是實體時（不應發生）略過之前的標籤
+    tag_sub = np.cumsum(is_start) - 1
+    tag_sub[:sub_starts[0]] = 0
+    owner = (np.cumsum(sub_top) - 1)[tag_sub]
+    in_header = sub_top[tag_sub]
+    in_vertex = (sub_names == b"VERTEX")[tag_sub]
+    names = sub_names[sub_top]
+    count = len(names)
+
+    def tags(code: int, wanted: np.ndarray, header: bool = True) -> np.ndarray:
+        """實體本身（header=False 時為其 VERTEX）指定組碼的標籤位置"""
+        mask = (codes == code) & wanted[owner]
+        mask &= in_header if header else in_vertex
+        return np.flatnonzero(mask)
+
+    def first_value(code: int, wanted: np.ndarray, default: float) -> np.ndarray:
+        """每個實體第一個指定組碼的數值 (count,)"""
+        result = np.full(count, default)
+        index = tags(code, wanted)
+        if len(index):
+            owners, first = np.unique(owner[index], return_index=True)
+            result[owners] = _numbers([values[i] for i in index[first].tolist()])
+        return result
+
+    # 圖紙空間實體不列入
+    model = ~(first_value(67, np.ones(count, dtype=bool), 0) == 1)
+
+    # 圖層：第一個組碼 8（缺少時為 "0"）
+    layer_names: List[str] = ["0"]
+    layer_codes: Dict[bytes, int] = {}
+    layer_of = np.zeros(count, dtype=np.int64)
+    index = tags(8, np.ones(count, dtype=bool))
+    if len(index):
+        owners, first = np.unique(owner[index], return_index=True)
+        codes_found = []
+        for value in (values[i] for i in index[first].tolist()):
+            code = layer_codes.get(value)
+            if code is None:
+                code = layer_codes[value] = len(layer_names)
+                layer_names.append(decode(value))
+            codes_found.append(code)
+        layer_of[owners] = codes_found
+
+    entity_counts = np.bincount(layer_of[model], minlength=len(layer_names))
+    for code, entity_count in enumerate(entity_counts.tolist()):
+        if entity_count:
+            totals.add_entities(layer_names[code], entity_count)
+
+    # 每個實體的長度與範圍（不產生線段者為 NaN）
+    length = np.full(count, np.nan)
+    bbox = np.full((count, 4), np.nan)
+
+    wanted = model & (names == b"LINE")
+    if wanted.any():
+        x0, y0 = first_value(10, wanted, 0.0), first_value(20, wanted, 0.0)
+        x1, y1 = first_value(11, wanted, 0.0), first_value(21, wanted, 0.0)
+        length[wanted] = np.hypot(x1 - x0, y1 - y0)[wanted]
+        bbox[wanted] = np.stack([np.minimum(x0, x1), np.minimum(y0, y1),
+                                 np.maximum(x0, x1), np.maximum(y0, y1)], axis=1)[wanted]
+
+    arcs = model & (names == b"ARC")
+    circles = model & (names == b"CIRCLE")
+    wanted = arcs | circles
+    if wanted.any():
+        center_x, center_y = first_value(10, wanted, 0.0), first_value(20, wanted, 0.0)
+        radius = first_value(40, wanted, 1.0)
+        sweep = np.radians(first_value(51, arcs, 360.0)) - np.radians(first_value(50, arcs, 0.0))
+        sweep = np.where(sweep < 0, sweep + 2 * math.pi, sweep)
+        sweep[circles] = 2 * math.pi
+        length[wanted] = (radius * sweep)[wanted]
+        bbox[wanted] = np.stack([center_x - radius, center_y - radius,
+                                 center_x + radius, center_y + radius], axis=1)[wanted]
+
+    # 多段線：LWPOLYLINE 的頂點在實體本身，POLYLINE 的頂點在 VERTEX
+    lw = model & (names == b"LWPOLYLINE")
+    old = model & (names == b"POLYLINE")
+    if (lw | old).any():
+        x_index = np.union1d(tags(10, lw), tags(10, old, header=False))
+        y_index = np.union1d(tags(20, lw), tags(20, old, header=False))
+        bulge_index = np.union1d(tags(42, lw), tags(42, old, header=False))
+        closed = (first_value(70, lw | old, 0).astype(np.int64) & 1).astype(bool)
+        _point_rows(x_index, y_index, bulge_index, closed, owner, values, length, bbox)
+
+    # SPLINE：擬合點（少於 2 個時為控制點）折線
+    wanted = model & (names == b"SPLINE")
+    if wanted.any():
+        fit_x, fit_y = tags(11, wanted), tags(21, wanted)
+        use_fit = np.bincount(owner[fit_x], minlength=count) >= 2
+        control = wanted & ~use_fit
+        x_index = np.union1d(fit_x[use_fit[owner[fit_x]]], tags(10, control))
+        y_index = np.union1d(fit_y[use_fit[owner[fit_y]]], tags(20, control))
+        _point_rows(x_index, y_index, None, np.zeros(count, dtype=bool), owner, values,
+                    length, bbox)
+
+    geometry = ~np.isnan(length)
+    if geometry.any():
+        codes_used = layer_of[geometry]
+        segment_counts = np.bincount(codes_used, minlength=len(layer_names))
+        lengths = np.bincount(codes_used, weights=length[geometry], minlength=len(layer_names))
+        layer_bbox = np.full((len(layer_names), 4), np.nan)
+        for column, reduce in ((0, np.fmin), (1, np.fmin), (2, np.fmax), (3, np.fmax)):
+            reduce.at(layer_bbox[:, column], codes_used, bbox[geometry, column])
+        for code in np.flatnonzero(segment_counts).tolist():
+            totals.add_segments(layer_names[code], int(segment_counts[code]),
+                                float(lengths[code]), *layer_bbox[code].tolist())
+
+    # 圖塊引用
+    wanted = model & (names == b"INSERT")
+    if wanted.any():
+        inserts = np.flatnonzero(wanted)
+        index = tags(2, wanted)
+        block_owners, first = np.unique(owner[index], return_index=True)
+        block_names = dict(zip(block_owners.tolist(),
+                               (decode(values[i]) for i in index[first].tolist())))
+        columns = [first_value(code, wanted, default)[inserts].tolist() for code, default in (
+            (10, 0.0), (20, 0.0), (41, 1.0), (42, 1.0), (50, 0.0),
+            (70, 1), (71, 1), (44, 0.0), (45, 0.0))]
+        refs = [("INSERT", layer_names[layer_of[i]], block_names[i], (x, y), sx, sy, rotation,
+                 int(cols), int(rows), col_spacing, row_spacing)
+                for i, x, y, sx, sy, rotation, cols, rows, col_spacing, row_spacing
+                in zip(inserts.tolist(), *columns) if i in block_names]
+        totals.add_inserts(flattener, refs)
+
+
+def _point_rows(x_index: np.ndarray, y_index: np.ndarray, bulge_index: Optional[np.ndarray],
+                closed: np.ndarray, owner: np.ndarray, values: List[bytes],
+                length: np.ndarray, bbox: np.ndarray):
+    """
+    由頂點標籤計算折線長度與範圍，寫入 length / bbox（頂點少於 2 個的實體不變）
+    凸度套用到其前一個頂點；closed 的實體加上閉合邊
+    """
+    if len(x_index) != len(y_index) or not np.array_equal(owner[x_index], owner[y_index]):
+        raise ValueError("頂點座標不成對")
+    if not len(x_index):
+        return
+    points = np.stack([_numbers([values[i] for i in x_index.tolist()]),
+                       _numbers([values[i] for i in y_index.tolist()])], axis=1)
+    point_owner = owner[x_index]
+
+    bulges = None
+    if bulge_index is not None and len(bulge_index):
+        vertex = np.searchsorted(x_index, bulge_index) - 1
+        valid = vertex >= 0
+        valid[valid] = point_owner[vertex[valid]] == owner[bulge_index[valid]]
+        bulges = np.zeros(len(points))
+        bulges[vertex[valid]] = _numbers([values[i] for i in bulge_index[valid].tolist()])
+
+    counts = np.bincount(point_owner, minlength=len(length))
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    rows = np.flatnonzero(counts >= 2)
+    row_lengths = polyline_lengths(points, offsets, bulges)[rows]
+
+    # 閉合邊：最後一個頂點回到第一個頂點（凸度為最後一個頂點的凸度）
+    is_closed = closed[rows]
+    if is_closed.any():
+        first = offsets[rows[is_closed]]
+        last = offsets[rows[is_closed] + 1] - 1
+        chord = np.hypot(*(points[first] - points[last]).T)
+        if bulges is not None:
+            chord = chord * bulge_length_factors(bulges[last])
+        row_lengths[is_closed] += chord
+
+    length[rows] = row_lengths
+    # reduceat 依所有非空實體的起點分段，再取出頂點數 ≥ 2 者
+    nonempty = np.flatnonzero(counts)
+    starts = offsets[nonempty]
+    keep = counts[nonempty] >= 2
+    bbox[rows, 0] = np.minimum.reduceat(points[:, 0], starts)[keep]
+    bbox[rows, 1] = np.minimum.reduceat(points[:, 1], starts)[keep]
+    bbox[rows, 2] = np.maximum.reduceat(points[:, 0], starts)[keep]
+    bbox[rows, 3] = np.maximum.reduceat(points[:, 1], starts)[keep]
+
+    if bulges is None:
+        return
+    # 圓弧段：凸度所在頂點到下一個頂點（最後一個頂點只在封閉時接回第一個頂點）
+    edge = np.flatnonzero(bulges)
+    edge_owner = point_owner[edge]
+    following = edge + 1
+    wraps = following == offsets[edge_owner + 1]
+    following[wraps] = offsets[edge_owner[wraps]]
+    valid = (~wraps | closed[edge_owner]) & (counts[edge_owner] >= 2)
+    if not valid.any():
+        return
+    edge, edge_owner, following = edge[valid], edge_owner[valid], following[valid]
+    bounds = _bulge_bounds(points[edge], points[following], bulges[edge])
+    for column, reduce in enumerate((np.minimum, np.minimum, np.maximum, np.maximum)):
+        reduce.at(bbox[:, column], edge_owner, bounds[:, column])
@@ -0,0 +1,262 @@
+"""
+Spline Evaluation for Wall Quantity Calculator
+樣條曲線（SPLINE / NURBS）的展平與弧長計算
+
+SPLINE 的頂點與長度由 B-spline 定義計算，不再使用控制點多邊形：
+    - 頂點：每個節點區間依區域控制點的二階差分估計線段數（弦高誤差 ≤ tolerance），
+      以 de Boor 演算法求值
+    - 長度：每個節點區間依展平線段數細分後以 Gauss–Legendre 積分 |C'(t)|
+只有擬合點的 SPLINE 先以 ezdxf 換算為控制點（與 AutoCAD 相同的插值方式）。
+SplineBatch 收集一批 SPLINE 後，相同次數的曲線一起以 NumPy 向量化求值；
+相同定義的曲線只計算一次（結果快取）。
+
+SPLINE 幾何基本資料：
+    ("SPLINE", layer, control_points, degree, knots, weights, fit_points, tangents)
+    tangents 為擬合點的 (起點切線, 終點切線)，未指定時為 None
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 每個節點區間最多的展平線段數
+MAX_SPAN_SEGMENTS = 256
+
+# 弧長積分時每個細分區間涵蓋的展平線段數
+LENGTH_PIECE_SEGMENTS = 4
+
+# 每個細分區間的 Gauss–Legendre 積分點
+GAUSS_NODES, GAUSS_WEIGHTS = np.polynomial.legendre.leggauss(5)
+
+
+class SplineDefinition:
+    """檢查過的 NURBS 定義（控制點為齊次座標 (x·w, y·w, w)）"""
+    __slots__ = ("degree", "points", "knots")
+
+    def __init__(self, degree: int, points: np.ndarray, knots: np.ndarray):
+        self.degree = degree
+        self.points = points
+        self.knots = knots
+
+
+def spline_key(primitive: tuple) -> tuple:
+    """曲線定義的快取鍵（不含圖層）"""
+    return tuple(tuple(item) if isinstance(item, list) else item for item in primitive[2:])
+
+
+def _fallback_points(primitive: tuple) -> List[Tuple[float, float]]:
+    """無法建立 NURBS 定義時使用控制點（或擬合點）多邊形"""
+    return list(primitive[2]) or list(primitive[6])
+
+
+def spline_definition(primitive: tuple) -> Optional[SplineDefinition]:
+    """由 SPLINE 幾何基本資料建立 NURBS 定義；資料不完整時回傳 None"""
+    _, _, control_points, degree, knots, weights, fit_points, tangents = primitive
+
+    if not control_points and len(fit_points) >= 2:
+        # 只有擬合點：換算為控制點
+        from ezdxf.math import fit_points_to_cad_cv
+        try:
+            bspline = fit_points_to_cad_cv(
+                [(x, y, 0.0) for x, y in fit_points],
+                tangents=[(*tangent, 0.0) for tangent in tangents] if tangents else None
+            )
+        except Exception:
+            return None
+        control_points = [(p.x, p.y) for p in bspline.control_points]
+        degree = bspline.degree
+        knots = list(bspline.knots())
+        weights = list(bspline.weights())
+
+    count = len(control_points)
+    if degree < 1 or count < degree + 1 or len(knots) != count + degree + 1:
+        return None
+    if weights and (len(weights) != count or min(weights) <= 0):
+        return None
+
+    knots = np.asarray(knots, dtype=float)
+    if np.any(np.diff(knots) < 0) or not knots[count] > knots[degree]:
+        return None
+
+    points = np.ones((count, 3))
+    points[:, :2] = control_points
+    if weights:
+        points[:, 2] = weights
+        points[:, :2] *= points[:, 2:]
+    return SplineDefinition(degree, points, knots)
+
+
+def _de_boor(degree: int, points: np.ndarray, knots: np.ndarray, t: np.ndarray):
+    """
+    向量化 de Boor 求值（每列一個求值點）
+
+    Args:
+        points: 各求值點所在節點區間的 degree+1 個齊次控制點 (R, degree+1, 3)
+        knots: 對應的 2·degree 個節點 u[k-p+1] ~ u[k+p] (R, 2·degree)
+        t: 參數值 (R,)
+
+    Returns:
+        (齊次座標點 (R, 3), 齊次座標導數 (R, 3))
+    """
+    d = points.copy()
+    derivative = None
+    for r in range(1, degree + 1):
+        if r == degree:
+            # 最後一層之前的兩點差即為導數方向
+            span = knots[:, degree] - knots[:, degree - 1]
+            derivative = degree * (d[:, degree] - d[:, degree - 1]) / span[:, None]
+        for j in range(degree, r - 1, -1):
+            left = knots[:, j - 1]
+            right = knots[:, j + degree - r]
+            denom = right - left
+            alpha = np.divide(t - left, denom, out=np.zeros_like(t), where=denom > 0)
+            d[:, j] = (1.0 - alpha)[:, None] * d[:, j - 1] + alpha[:, None] * d[:, j]
+    return d[:, degree], derivative
+
+
+def _evaluate_degree(degree: int, definitions: List[SplineDefinition], tolerance: float):
+    """
+    同一次數的多條曲線一起展平並計算長度
+    回傳 [(頂點列表, 長度)]，順序與 definitions 相同
+    """
+    p = degree
+    counts = np.array([len(d.points) for d in definitions])
+    point_starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    knot_starts = point_starts + np.arange(len(definitions)) * (p + 1)
+    all_points = np.concatenate([d.points for d in definitions])
+    all_knots = np.concatenate([d.knots for d in definitions])
+
+    # 所有節點區間 k = p ~ n-1，只保留非空區間
+    span_counts = counts - p
+    owner = np.repeat(np.arange(len(definitions)), span_counts)
+    k = np.arange(span_counts.sum()) - np.repeat(np.cumsum(span_counts) - span_counts, span_counts) + p
+    lower = all_knots[knot_starts[owner] + k]
+    upper = all_knots[knot_starts[owner] + k + 1]
+    keep = upper > lower
+    owner, k, lower, upper = owner[keep], k[keep], lower[keep], upper[keep]
+
+    span_points = all_points[(point_starts[owner] + k - p)[:, None] + np.arange(p + 1)]
+    span_knots = all_knots[(knot_starts[owner] + k - p + 1)[:, None] + np.arange(2 * p)]
+
+    # 線段數估計：貝茲曲線展平誤差 ≤ p(p-1)/8 · max|P[i+2] - 2P[i+1] + P[i]| / n²
+    cartesian = span_points[:, :, :2] / span_points[:, :, 2:]
+    if p >= 2:
+        second = np.diff(cartesian, n=2, axis=1)
+        bound = p * (p - 1) / 8 * np.sqrt((second ** 2).sum(axis=2)).max(axis=1)
+        segments = np.ceil(np.sqrt(bound / max(tolerance, 1e-12)))
+    else:
+        segments = np.ones(len(owner))
+    segments = np.clip(segments, 1, MAX_SPAN_SEGMENTS).astype(np.int64)
+
+    # 展平點：每個區間 segments 個起始點，每條曲線最後一個區間多加終點
+    last_span = np.append(owner[1:] != owner[:-1], True)
+    rows = segments + last_span
+    row_span = np.repeat(np.arange(len(owner)), rows)
+    step = np.arange(rows.sum()) - np.repeat(np.cumsum(rows) - rows, rows)
+    t = lower[row_span] + (upper - lower)[row_span] * step / segments[row_span]
+    homogeneous, _ = _de_boor(p, span_points[row_span], span_knots[row_span], t)
+    flat = homogeneous[:, :2] / homogeneous[:, 2:]
+
+    # 弧長：每個細分區間取 Gauss–Legendre 積分點
+    nodes = len(GAUSS_NODES)
+    pieces = (segments + LENGTH_PIECE_SEGMENTS - 1) // LENGTH_PIECE_SEGMENTS
+    gauss_rows = pieces * nodes
+    gauss_span = np.repeat(np.arange(len(owner)), gauss_rows)
+    local = np.arange(gauss_rows.sum()) - np.repeat(np.cumsum(gauss_rows) - gauss_rows, gauss_rows)
+    width = (upper - lower)[gauss_span] / pieces[gauss_span]
+    t = (lower[gauss_span] + width * (local // nodes)
+         + width * (GAUSS_NODES[local % nodes] + 1) / 2)
+    homogeneous, derivative = _de_boor(p, span_points[gauss_span], span_knots[gauss_span], t)
+    weight = homogeneous[:, 2:]
+    velocity = (derivative[:, :2] - derivative[:, 2:] * homogeneous[:, :2] / weight) / weight
+    speed = np.sqrt((velocity ** 2).sum(axis=1)) * width * GAUSS_WEIGHTS[local % nodes] / 2
+    lengths = np.bincount(owner[gauss_span], weights=speed, minlength=len(definitions))
+
+    vertex_counts = np.bincount(owner[row_span], minlength=len(definitions))
+    offsets = np.concatenate(([0], np.cumsum(vertex_counts))).tolist()
+    flat = list(map(tuple, flat.tolist()))
+    return [(flat[offsets[i]:offsets[i + 1]], length)
+            for i, length in enumerate(lengths.tolist())]
+
+
+def evaluate_splines(primitives: List[tuple], tolerance: float) -> List[Optional[tuple]]:
+    """
+    計算多條 SPLINE 的 (頂點, 長度)
+    無法建立 NURBS 定義者以控制點（或擬合點）多邊形代替；頂點不足 2 個時為 None
+    """
+    results: List[Optional[tuple]] = [None] * len(primitives)
+    by_degree: Dict[int, List[int]] = {}
+    definitions: Dict[int, SplineDefinition] = {}
+
+    for index, primitive in enumerate(primitives):
+        definition = spline_definition(primitive)
+        if definition is None:
+            points = _fallback_points(primitive)
+            if len(points) >= 2:
+                length = sum(math.dist(a, b) for a, b in zip(points, points[1:]))
+                results[index] = (points, length)
+            continue
+        definitions[index] = definition
+        by_degree.setdefault(definition.degree, []).append(index)
+
+    for degree, indices in by_degree.items():
+        evaluated = _evaluate_degree(degree, [definitions[i] for i in indices], tolerance)
+        for index, result in zip(indices, evaluated):
+            results[index] = result
+    return results
+
+
+class SplineBatch:
+    """
+    收集 SPLINE 並批次計算（與 InsertExpander 相同的用法）
+    handle() 可直接作為 SPLINE 的處理函式；flush() 依原始順序將線段記錄寫入 out
+    """
+
+    # 累積的曲線數達到此值時自動計算，限制記憶體用量（串流模式）
+    BATCH_SIZE = 8192
+
+    def __init__(self, out, tolerance: float, cache: Dict[tuple, Optional[tuple]]):
+        self.out = out
+        self.tolerance = tolerance
+        self.cache = cache  # 曲線定義 → (頂點, 長度)，由 parser 持有，跨批次共用
+        self._pending: List[tuple] = []
+
+    def handle(self, primitive: tuple, out=None, layer_filter=None):
+        self._pending.append(primitive)
+        if len(self._pending) >= self.BATCH_SIZE:
+            self.flush()
+
+    def _evaluate_one(self, primitive: tuple) -> Optional[tuple]:
+        try:
+            return evaluate_splines([primitive], self.tolerance)[0]
+        except Exception as e:
+            print(f"  [!] 無法處理 SPLINE 實體: {e}")
+            return None
+
+    def flush(self):
+        pending = self._pending
+        if not pending:
+            return
+        self._pending = []
+
+        # 相同定義只計算一次
+        keys = [spline_key(primitive) + (self.tolerance,) for primitive in pending]
+        missing: Dict[tuple, tuple] = {}
+        for key, primitive in zip(keys, pending):
+            if key not in self.cache and key not in missing:
+                missing[key] = primitive
+        if missing:
+            try:
+                results = evaluate_splines(list(missing.values()), self.tolerance)
+            except Exception:
+                # 批次中有無法處理的曲線：逐一計算，只略過該曲線
+                results = [self._evaluate_one(primitive) for primitive in missing.values()]
+            self.cache.update(zip(missing, results))
+
+        append = self.out.append
+        for key, primitive in zip(keys, pending):
+            result = self.cache[key]
+            if result is None:
+                continue
+            vertices, length = result
+            append((primitive[1], "SPLINE", vertices[0], vertices[-1], length, vertices))
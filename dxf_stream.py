@@ -0,0 +1,651 @@
+"""
+Streaming DXF Reader for Wall Quantity Calculator
+直接讀取 DXF 組碼串流，不建立完整的 ezdxf 文件
+
+只保留解析牆線段所需的資訊：
+- HEADER: $ACADVER, $DWGCODEPAGE, $DIMSCALE, $INSUNITS
+- TABLES: 圖層表 (LAYER)
+- BLOCKS: 圖塊定義（轉為幾何基本資料）
+- ENTITIES: 模型空間實體，逐一產生幾何基本資料，不保留在記憶體中
+
+幾何基本資料 (primitive) 的格式與 dxf_parser.ENTITY_READERS 相同
+"""
+import io
+import mmap
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Any, Optional, Iterator, BinaryIO, Callable
+
+from ezdxf.tools.codepage import toencoding
+
+from dxf_group_codes import DXF_GROUP_CODES, GroupCodeCategory
+
+Tag = Tuple[int, bytes]
+
+BINARY_DXF_SENTINEL = b"AutoCAD Binary DXF"
+
+# 預檢時取樣的位元組數（HEADER 之後，涵蓋圖層表與部分實體）
+PROBE_SAMPLE_SIZE = 1024 * 1024
+
+# 宣告的編碼不可靠時，依序檢查的多位元組候選編碼
+PROBE_FALLBACK_ENCODINGS = ("utf-8", "cp950", "gbk")
+
+# 依組碼資料庫建立數值轉換表；資料庫未收錄的組碼保留原始位元組
+_FLOAT_CATEGORIES = (GroupCodeCategory.FLOAT, GroupCodeCategory.COORDINATE)
+_INT_CATEGORIES = (GroupCodeCategory.INTEGER, GroupCodeCategory.BOOLEAN)
+FLOAT_CODES = frozenset(code for code, info in DXF_GROUP_CODES.items()
+                        if info.category in _FLOAT_CATEGORIES)
+INT_CODES = frozenset(code for code, info in DXF_GROUP_CODES.items()
+                      if info.category in _INT_CATEGORIES)
+
+# 分割 ENTITIES 區段用：組碼 0 的標籤行與其後的實體類型行
+# （前瞻比對，允許與前一個不符合的比對結果重疊）
+_ENTITY_START = re.compile(rb"\n(?=[ \t]*0\r?\n([^\r\n]*)\r?\n)")
+_SECTION_END = re.compile(rb"\n[ \t]*0\r?\nENDSEC\r?\n")
+
+# 附屬於前一個實體的類型，不能作為分割點
+_CONTINUATION_TYPES = frozenset((b"VERTEX", b"SEQEND", b"ATTRIB"))
+
+# 會出現在牆線段解析中的實體類型
+STREAM_ENTITY_TYPES = frozenset(("LINE", "LWPOLYLINE", "POLYLINE", "ARC",
+                                 "CIRCLE", "SPLINE", "INSERT"))
+
+
+def iter_tags(fp: BinaryIO) -> Iterator[Tag]:
+    """
+    從二進位檔案物件逐一讀取 (組碼, 原始值) 配對
+    值保留為 bytes，只有在需要時才解碼，避免為不使用的標籤付出解碼成本
+    """
+    readline = fp.readline
+    while True:
+        code = readline()
+        if not code:
+            return
+        value = readline()
+        if not value:
+            return
+        try:
+            group_code = int(code)
+        except ValueError:
+            raise IOError(f"無效的組碼: {code!r}")
+        if group_code == 999:  # 註解
+            continue
+        yield group_code, value.rstrip(b"\r\n")
+
+
+def tag_float(value: bytes, default: float = 0.0) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+def tag_int(value: bytes, default: int = 0) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        try:
+            return int(float(value))
+        except ValueError:
+            return default
+
+
+def is_binary_dxf(filepath: str) -> bool:
+    """檢查是否為二進位 DXF（串流模式只支援 ASCII DXF）"""
+    with open(filepath, "rb") as fp:
+        return fp.read(len(BINARY_DXF_SENTINEL)) == BINARY_DXF_SENTINEL
+
+
+class RawEntity:
+    """
+    串流讀取中的單一實體
+    只記錄原始標籤，由 to_primitive() 轉為幾何基本資料
+    """
+    __slots__ = ("dxftype", "tags", "vertices")
+
+    def __init__(self, dxftype: str):
+        self.dxftype = dxftype
+        self.tags: List[Tag] = []
+        self.vertices: List[List[Tag]] = []  # POLYLINE 的 VERTEX 子實體
+
+    def first(self, code: int) -> Optional[bytes]:
+        """取得第一個指定組碼的值"""
+        for tag_code, value in self.tags:
+            if tag_code == code:
+                return value
+        return None
+
+    def get_float(self, code: int, default: float = 0.0) -> float:
+        value = self.first(code)
+        return default if value is None else tag_float(value, default)
+
+    def get_int(self, code: int, default: int = 0) -> int:
+        value = self.first(code)
+        return default if value is None else tag_int(value, default)
+
+    def points(self, x_code: int = 10, y_code: int = 20) -> List[Tuple[float, float]]:
+        """依序收集 10/20（或指定組碼）組成的點（LWPOLYLINE 頂點、SPLINE 控制點 / 擬合點）"""
+        points = []
+        x = None
+        for code, value in self.tags:
+            if code == x_code:
+                x = tag_float(value)
+            elif code == y_code and x is not None:
+                points.append((x, tag_float(value)))
+                x = None
+        return points
+
+    def bulge_points(self) -> Tuple[List[Tuple[float, float]], List[float]]:
+        """LWPOLYLINE 頂點與各頂點的凸度（組碼 42 跟在所屬頂點之後，省略時為 0）"""
+        points = []
+        bulges = []
+        x = None
+        for code, value in self.tags:
+            if code == 10:
+                x = tag_float(value)
+            elif code == 20 and x is not None:
+                points.append((x, tag_float(value)))
+                bulges.append(0.0)
+                x = None
+            elif code == 42 and bulges:
+                bulges[-1] = tag_float(value)
+        return points, bulges
+
+    def floats(self, code: int) -> List[float]:
+        """收集所有指定組碼的數值（SPLINE 節點、權重）"""
+        return [tag_float(value) for tag_code, value in self.tags if tag_code == code]
+
+
+class DXFStream:
+    """
+    DXF 組碼串流讀取器
+
+    用法:
+        stream = DXFStream(filepath)
+        stream.open()                   # 讀取 HEADER / TABLES / BLOCKS
+        for primitive in stream.iter_entities():
+            ...
+        stream.close()
+
+    open() 之後即可使用 header、layers、blocks；
+    iter_entities() 從 ENTITIES 區段繼續讀取，每次只保留一個實體
+    """
+
+    def __init__(self, filepath: str, encoding: Optional[str] = None):
+        self.filepath = filepath
+        self.encoding = encoding
+        self.header: Dict[str, Any] = {}
+        self.layers: Dict[str, dict] = {}
+        self.blocks: Dict[str, List[tuple]] = {}  # 圖塊名稱（小寫）→ 幾何基本資料
+        self._fp: Optional[BinaryIO] = None
+        self._tags: Optional[Iterator[Tag]] = None
+        self._in_entities = False
+
+    # ==================== 檔案與區段 ====================
+
+    def _open_file(self):
+        if is_binary_dxf(self.filepath):
+            raise IOError("串流模式不支援二進位 DXF")
+
+        self._fp = open(self.filepath, "rb")
+        self._tags = iter_tags(self._fp)
+
+    def read_header(self) -> Dict[str, Any]:
+        """
+        只讀取 HEADER 區段（預檢用）
+        HEADER 必須是第一個區段；讀完後檔案停在 HEADER 之後
+        """
+        self._open_file()
+        for code, value in self._tags:
+            if code == 0 and value == b"SECTION":
+                if self._section_name() == b"HEADER":
+                    self._read_header()
+                break
+        return self.header
+
+    def open(self):
+        """開啟檔案並讀取 ENTITIES 之前的所有區段"""
+        self._open_file()
+
+        for code, value in self._tags:
+            if code != 0:
+                continue
+            if value == b"EOF":
+                break
+            if value != b"SECTION":
+                continue
+
+            name = self._section_name()
+            if name == b"HEADER":
+                self._read_header()
+            elif name == b"TABLES":
+                self._read_tables()
+            elif name == b"BLOCKS":
+                self._read_blocks()
+            elif name == b"ENTITIES":
+                self._in_entities = True
+                return self
+            else:
+                self._skip_section()
+
+        return self
+
+    def close(self):
+        if self._fp:
+            self._fp.close()
+            self._fp = None
+            self._tags = None
+
+    @property
+    def position(self) -> int:
+        """目前讀取位置（位元組），供進度回報使用"""
+        return self._fp.tell() if self._fp else 0
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _section_name(self) -> bytes:
+        for code, value in self._tags:
+            if code == 2:
+                return value
+        return b""
+
+    def _skip_section(self):
+        for code, value in self._tags:
+            if code == 0 and value == b"ENDSEC":
+                return
+
+    def decode(self, value: bytes) -> str:
+        return value.decode(self.encoding or "cp1252", errors="surrogateescape")
+
+    # ==================== HEADER ====================
+
+    def _read_header(self):
+        """讀取標頭變數（只保留簡單的單值變數）"""
+        var_name = None
+        for code, value in self._tags:
+            if code == 0 and value == b"ENDSEC":
+                break
+            if code == 9:
+                var_name = value.decode("ascii", errors="replace")
+            elif var_name and var_name not in self.header:
+                if code in FLOAT_CODES:
+                    self.header[var_name] = tag_float(value)
+                elif code in INT_CODES:
+                    self.header[var_name] = tag_int(value)
+                else:
+                    self.header[var_name] = value.decode("ascii", errors="replace")
+
+        if self.encoding is None:
+            # R2007 (AC1021) 之後固定為 UTF-8，之前的版本依 $DWGCODEPAGE
+            if str(self.header.get("$ACADVER", "")) >= "AC1021":
+                self.encoding = "utf-8"
+            else:
+                self.encoding = toencoding(str(self.header.get("$DWGCODEPAGE", "ANSI_1252")))
+
+    # ==================== TABLES ====================
+
+    def _read_tables(self):
+        """只讀取 LAYER 表，取得圖層名稱、顏色與開關狀態"""
+        current: Optional[RawEntity] = None
+        for code, value in self._tags:
+            if code == 0:
+                if current is not None:
+                    self._add_layer(current)
+                    current = None
+                if value == b"ENDSEC":
+                    break
+                if value == b"LAYER":
+                    current = RawEntity("LAYER")
+            elif current is not None:
+                current.tags.append((code, value))
+
+    def _add_layer(self, raw: RawEntity):
+        name_value = raw.first(2)
+        if name_value is None:
+            return  # LAYER 表頭，不是圖層記錄
+        name = self.decode(name_value)
+        color = raw.get_int(62, 7)
+        flags = raw.get_int(70, 0)
+        is_on = color >= 0
+        is_frozen = bool(flags & 1)
+        self.layers[name] = {
+            "name": name,
+            "color": color,
+            "is_on": is_on,
+            "is_frozen": is_frozen,
+            "status": "ON" if is_on and not is_frozen else "OFF"
+        }
+
+    # ==================== BLOCKS ====================
+
+    def _read_blocks(self):
+        """讀取圖塊定義，每個圖塊轉為幾何基本資料列表"""
+        block_name: Optional[str] = None
+        primitives: List[tuple] = []
+        for raw in self._iter_raw_entities():
+            if raw.dxftype == "BLOCK":
+                name_value = raw.first(2)
+                block_name = self.decode(name_value) if name_value is not None else None
+                primitives = []
+            elif raw.dxftype == "ENDBLK":
+                if block_name is not None:
+                    self.blocks[block_name.lower()] = primitives
+                block_name = None
+            elif block_name is not None and raw.dxftype in STREAM_ENTITY_TYPES:
+                primitive = self.to_primitive(raw)
+                if primitive is not None:
+                    primitives.append(primitive)
+
+    # ==================== ENTITIES ====================
+
+    def iter_entities(self, layer_filter: Optional[Callable[[str], bool]] = None) -> Iterator[tuple]:
+        """
+        逐一產生模型空間實體的幾何基本資料
+        layer_filter 不接受的圖層不轉換幾何
+        """
+        if not self._in_entities:
+            return
+        for raw in self._iter_raw_entities():
+            if raw.dxftype not in STREAM_ENTITY_TYPES:
+                continue
+            if raw.get_int(67, 0) == 1:  # 圖紙空間實體
+                continue
+            if layer_filter is not None:
+                layer_value = raw.first(8)
+                if not layer_filter(self.decode(layer_value) if layer_value is not None else "0"):
+                    continue
+            primitive = self.to_primitive(raw)
+            if primitive is not None:
+                yield primitive
+        self._in_entities = False
+
+    def partition_entities(self, parts: int) -> List[Tuple[int, int]]:
+        """
+        將 ENTITIES 區段切成約略等長的位元組範圍（須在 open() 之後呼叫）
+        每個範圍都從頂層實體開頭起算，POLYLINE 與其 VERTEX 不會被拆開
+        """
+        start = self.position
+        with mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            match = _SECTION_END.search(mm, start - 1)
+            end = match.start() + 1 if match else len(mm)
+
+            bounds = [start]
+            for i in range(1, parts):
+                target = start + (end - start) * i // parts
+                offset = _next_entity_start(mm, max(target, bounds[-1]), end)
+                if offset >= end:
+                    break
+                if offset > bounds[-1]:
+                    bounds.append(offset)
+            bounds.append(end)
+
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def iter_entity_range(self, start: int, end: int,
+                          layer_filter: Optional[Callable[[str], bool]] = None) -> Iterator[tuple]:
+        """
+        只讀取 ENTITIES 區段中 [start, end) 的實體（平行提取用）
+        範圍須來自 partition_entities；編碼需事先指定
+        """
+        with open(self.filepath, "rb") as fp:
+            fp.seek(start)
+            data = fp.read(end - start)
+        self._tags = iter_tags(io.BytesIO(data + b"  0\nENDSEC\n"))
+        self._in_entities = True
+        try:
+            yield from self.iter_entities(layer_filter)
+        finally:
+            self._tags = None
+
+    def _iter_raw_entities(self) -> Iterator[RawEntity]:
+        """
+        將目前區段切分為實體，直到 ENDSEC
+        POLYLINE 後續的 VERTEX 會併入該 POLYLINE，SEQEND 結束
+        """
+        current: Optional[RawEntity] = None
+        polyline: Optional[RawEntity] = None
+        vertex: Optional[List[Tag]] = None
+
+        for code, value in self._tags:
+            if code != 0:
+                if vertex is not None:
+                    vertex.append((code, value))
+                elif current is not None:
+                    current.tags.append((code, value))
+                continue
+
+            # 新實體開始：先結束前一個
+            if polyline is not None:
+                if value == b"VERTEX":
+                    vertex = []
+                    polyline.vertices.append(vertex)
+                    continue
+                if value == b"SEQEND":
+                    vertex = None
+                    current = None
+                    yield polyline
+                    polyline = None
+                    continue
+                # 缺少 SEQEND 的 POLYLINE
+                vertex = None
+                yield polyline
+                polyline = None
+            elif current is not None:
+                yield current
+                current = None
+
+            if value in (b"ENDSEC", b"EOF"):
+                return
+
+            dxftype = value.decode("ascii", errors="replace")
+            current = RawEntity(dxftype)
+            if dxftype == "POLYLINE":
+                polyline = current
+
+    def to_primitive(self, raw: RawEntity) -> Optional[tuple]:
+        """將原始實體轉為幾何基本資料"""
+        layer_value = raw.first(8)
+        layer = self.decode(layer_value) if layer_value is not None else "0"
+        dxftype = raw.dxftype
+
+        if dxftype == "LINE":
+            return ("LINE", layer,
+                    (raw.get_float(10), raw.get_float(20)),
+                    (raw.get_float(11), raw.get_float(21)))
+
+        if dxftype == "LWPOLYLINE":
+            points, bulges = raw.bulge_points()
+            return ("LWPOLYLINE", layer, points, bulges if any(bulges) else None,
+                    bool(raw.get_int(70) & 1))
+
+        if dxftype == "POLYLINE":
+            vertices = []
+            bulges = []
+            for tags in raw.vertices:
+                vertex = RawEntity("VERTEX")
+                vertex.tags = tags
+                vertices.append((vertex.get_float(10), vertex.get_float(20)))
+                bulges.append(vertex.get_float(42))
+            return ("POLYLINE", layer, vertices, bulges if any(bulges) else None,
+                    bool(raw.get_int(70) & 1))
+
+        if dxftype == "ARC":
+            return ("ARC", layer,
+                    (raw.get_float(10), raw.get_float(20)),
+                    raw.get_float(40, 1.0),
+                    raw.get_float(50, 0.0),
+                    raw.get_float(51, 360.0))
+
+        if dxftype == "CIRCLE":
+            return ("CIRCLE", layer,
+                    (raw.get_float(10), raw.get_float(20)),
+                    raw.get_float(40, 1.0))
+
+        if dxftype == "SPLINE":
+            tangents = None
+            if raw.first(12) is not None and raw.first(13) is not None:
+                tangents = ((raw.get_float(12), raw.get_float(22)),
+                            (raw.get_float(13), raw.get_float(23)))
+            return ("SPLINE", layer, raw.points(), raw.get_int(71, 3), raw.floats(40),
+                    raw.floats(41), raw.points(11, 21), tangents)
+
+        if dxftype == "INSERT":
+            name_value = raw.first(2)
+            if name_value is None:
+                return None
+            return ("INSERT", layer, self.decode(name_value),
+                    (raw.get_float(10), raw.get_float(20)),
+                    raw.get_float(41, 1.0),
+                    raw.get_float(42, 1.0),
+                    raw.get_float(50, 0.0),
+                    raw.get_int(70, 1),
+                    raw.get_int(71, 1),
+                    raw.get_float(44, 0.0),
+                    raw.get_float(45, 0.0))
+
+        return None
+
+
+def _next_entity_start(buffer, pos: int, end: int) -> int:
+    """
+    回傳 pos 之後第一個頂層實體的起始位置（組碼 0 那一行的開頭）
+    數值行一定接在組碼行之後，所以「0」後面接著非數字的行必定是實體類型
+    """
+    for match in _ENTITY_START.finditer(buffer, pos - 1, end):
+        name = match.group(1).strip()
+        if not name or name.lstrip(b"-").isdigit():
+            continue  # 數值為 0 的資料行（例如圖層 "0"），下一行是組碼
+        if name in _CONTINUATION_TYPES:
+            continue
+        return match.start() + 1
+    return end
+
+
+# ==================== 預檢 ====================
+
+@dataclass
+class DXFProbe:
+    """DXF 預檢結果：決定要用哪種編碼與載入方式"""
+    version: Optional[str] = None
+    codepage: Optional[str] = None
+    declared_encoding: Optional[str] = None  # 依 $ACADVER / $DWGCODEPAGE 推得的編碼
+    encoding: Optional[str] = None           # 取樣驗證後選定的編碼
+    is_binary: bool = False
+    loader: str = "readfile"                 # "readfile" 或 "recover"
+    conclusive: bool = False                 # False 表示需要逐一嘗試
+    reason: str = ""
+
+
+def _decodes(sample: bytes, encoding: str) -> bool:
+    try:
+        sample.decode(encoding)
+        return True
+    except (UnicodeDecodeError, LookupError):
+        return False
+
+
+def _is_single_byte(encoding: str) -> bool:
+    """單位元組編碼（如 cp1252）幾乎能解碼任何位元組，不能單憑解碼成功判斷"""
+    try:
+        return len(bytes(range(128, 256)).decode(encoding, errors="replace")) == 128
+    except LookupError:
+        return False
+
+
+def _high_byte_run_ratio(sample: bytes) -> float:
+    """
+    非 ASCII 位元組中，位於連續兩個以上高位元組之中的比例
+    Big5/GBK 中文通常連續出現高位元組；拉丁重音字母則多半單獨出現
+    """
+    runs = re.findall(rb"[\x80-\xff]+", sample)
+    total = sum(len(run) for run in runs)
+    if not total:
+        return 0.0
+    return sum(len(run) for run in runs if len(run) >= 2) / total
+
+
+def _cjk_ratio(text: str) -> float:
+    """非 ASCII 字元中屬於中日韓文字、標點或全形字元的比例"""
+    non_ascii = [ch for ch in text if ord(ch) > 127]
+    if not non_ascii:
+        return 0.0
+    cjk = sum(1 for ch in non_ascii
+              if "\u4e00" <= ch <= "\u9fff" or "\u3000" <= ch <= "\u303f"
+              or "\uff00" <= ch <= "\uffef")
+    return cjk / len(non_ascii)
+
+
+def probe_dxf(filepath: str, sample_size: int = PROBE_SAMPLE_SIZE) -> DXFProbe:
+    """
+    載入前的預檢
+    只讀取 HEADER 區段 ($ACADVER, $DWGCODEPAGE) 與一段位元組取樣，
+    事先判斷正確的編碼與載入方式，避免整份檔案被重複解析
+    """
+    probe = DXFProbe()
+
+    if is_binary_dxf(filepath):
+        probe.is_binary = True
+        probe.conclusive = True
+        probe.reason = "二進位 DXF"
+        return probe
+
+    stream = DXFStream(filepath)
+    try:
+        header = stream.read_header()
+        sample = stream._fp.read(sample_size)
+    except (IOError, ValueError) as e:
+        # 組碼結構損毀：直接使用修復模式
+        probe.loader = "recover"
+        probe.conclusive = True
+        probe.reason = f"結構錯誤 ({e})"
+        return probe
+    finally:
+        stream.close()
+
+    if "$ACADVER" not in header:
+        probe.reason = "找不到 HEADER 區段"
+        return probe
+
+    probe.version = str(header["$ACADVER"])
+    probe.codepage = header.get("$DWGCODEPAGE")
+    probe.declared_encoding = stream.encoding
+
+    # 取樣截斷在最後一個換行，避免切斷多位元組字元
+    sample = sample[:sample.rfind(b"\n") + 1]
+
+    if sample.isascii():
+        probe.encoding = probe.declared_encoding
+        probe.conclusive = True
+        probe.reason = "取樣為純 ASCII"
+        return probe
+
+    declared = probe.declared_encoding
+    if not _is_single_byte(declared) and _decodes(sample, declared):
+        probe.encoding = declared
+        probe.conclusive = True
+        probe.reason = f"取樣符合宣告的編碼 {declared}"
+        return probe
+
+    # 宣告為單位元組編碼（或宣告的編碼無法解碼）時，檢查是否其實是多位元組編碼
+    for encoding in PROBE_FALLBACK_ENCODINGS:
+        if encoding == declared or not _decodes(sample, encoding):
+            continue
+        if encoding == "utf-8" or (_cjk_ratio(sample.decode(encoding)) >= 0.9
+                                   and _high_byte_run_ratio(sample) >= 0.5):
+            probe.encoding = encoding
+            probe.conclusive = True
+            probe.reason = f"宣告為 {declared}，取樣實際為 {encoding}"
+            return probe
+
+    if _decodes(sample, declared):
+        probe.encoding = declared
+        probe.conclusive = True
+        probe.reason = f"取樣符合宣告的編碼 {declared}"
+        return probe
+
+    probe.reason = "取樣無法以任何候選編碼解碼"
+    return probe
@@ -3,9 +3,11 @@ Geometry Utilities for Wall Quantity Calculator
 提供平行線偵測、垂直距離計算、重疊區域分析等幾何計算功能
 """
 import math
-from typing import Tuple, Optional, List
+from typing import Dict, Tuple, Optional, List, NamedTuple
 from dataclasses import dataclass
 
+import numpy as np
+
 
 @dataclass
 class Vector2D:
@@ -353,6 +355,655 @@ def find_parallel_pair(seg1: dict, seg2: dict,
     )
 
 
+# ==================== 平行牆對候選（空間索引） ====================
+
+# 候選範圍的浮點誤差餘裕（寧可多比對，不可漏掉）
+_CANDIDATE_SLACK_REL = 1e-9
+_CANDIDATE_SLACK_ABS = 1e-6
+# 角度餘裕（弧度）：cos 接近 1 時點積的解析度約 1e-8 弧度
+_CANDIDATE_SLACK_ANGLE = 1e-6
+
+# 候選對分段產生，避免共線線段很多時一次建立過大的陣列
+_CANDIDATE_CHUNK = 1_000_000
+
+
+def parallel_pair_candidates(starts: np.ndarray, ends: np.ndarray,
+                             wall_thickness,
+                             tolerance=1.0,
+                             angle_tolerance: float = 1.0) -> np.ndarray:
+    """
+    找出可能構成平行牆對的線段索引對 (i, j)，i < j，依字典順序排列
+
+    逐對呼叫 find_parallel_pair 是 O(n²)；這裡先篩選候選，保證不漏掉任何一對：
+        1. 方向角（mod 180°）以寬度 ≥ angle_tolerance 的區間分桶，只比對同桶與相鄰桶
+        2. 在桶的座標系中，將線段投影到法向（垂直偏移）與方向上，只比對兩個投影區間
+           都相交的線段（區間依長度向外擴張，見下方說明）
+
+    find_parallel_pair 成立時，seg2 兩端點到 seg1 直線的平均距離 ≤ T = 牆厚 + 容許誤差，
+    且 seg2 有一點 q 投影落在 seg1 範圍內。q 到 seg1 的距離不超過兩端點距離的較大值，
+    即 ≤ T + min(T, L2·sin(角度誤差)/2)，因此 q 與 seg1 上某點在任何方向的投影差都不超過此值。
+    每條線段的區間擴張 T/2 + min(T, L·sin(角度誤差)/2)，兩者相加即涵蓋上述距離。
+
+    Args:
+        starts, ends: (N, 2) 起點 / 終點座標
+        wall_thickness, tolerance, angle_tolerance: 與 find_parallel_pair 相同；
+            牆厚與容許誤差可為多組（陣列），此時 T 取各組牆厚 + 容許誤差的最大值
+
+    Returns:
+        (K, 2) int64 陣列
+    """
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+    reaches = np.asarray(wall_thickness, dtype=np.float64) + np.asarray(tolerance, dtype=np.float64)
+    empty = np.empty((0, 2), dtype=np.int64)
+    if len(starts) < 2 or reaches.size == 0 or reaches.max() < 0:
+        return empty
+    reach = float(reaches.max())
+
+    deltas = ends - starts
+    lengths = np.sqrt(deltas[:, 0] * deltas[:, 0] + deltas[:, 1] * deltas[:, 1])
+    valid = np.flatnonzero(lengths >= 1e-10)  # 零長度線段不會被判斷為平行
+    if len(valid) < 2:
+        return empty
+    starts, ends, lengths = starts[valid], ends[valid], lengths[valid]
+    angles = np.arctan2(deltas[valid, 1], deltas[valid, 0]) % np.pi
+
+    # 方向分桶：桶寬略大於角度誤差，平行的兩條線一定在同桶或相鄰桶（180° 處循環）
+    tol_rad = min(math.radians(abs(angle_tolerance)) + _CANDIDATE_SLACK_ANGLE, math.pi / 2)
+    bin_count = int(math.pi // tol_rad)
+    if bin_count < 3:
+        bin_count = 1
+    bin_width = math.pi / bin_count
+    bins = np.minimum((angles / bin_width).astype(np.int64), bin_count - 1)
+
+    expand = reach / 2 + np.minimum(reach, lengths * math.sin(tol_rad) / 2)
+    expand = expand * (1 + _CANDIDATE_SLACK_REL) + _CANDIDATE_SLACK_ABS
+
+    found = []
+    members = {b: np.flatnonzero(bins == b) for b in np.unique(bins).tolist()}
+    for b, own in members.items():
+        if bin_count == 1:
+            group, phi = own, 0.0
+        else:
+            # 本桶與下一桶一起處理（同桶對 + 跨桶對），座標系取兩桶交界的方向
+            following = members.get((b + 1) % bin_count, own[:0])
+            group, phi = np.concatenate([own, following]), (b + 1) * bin_width
+        if len(group) < 2:
+            continue
+        found.append(_overlapping_pairs(starts[group], ends[group], expand[group],
+                                        phi, own_count=len(own), group=group))
+
+    found = [pairs for pairs in found if len(pairs)]
+    if not found:
+        return empty
+    return _sorted_pairs(valid[np.concatenate(found)], int(valid[-1]) + 1)
+
+
+def _overlapping_pairs(starts: np.ndarray, ends: np.ndarray, expand: np.ndarray,
+                       phi: float, own_count: int, group: np.ndarray) -> np.ndarray:
+    """
+    在角度 phi 的座標系中，法向與方向投影區間（向外擴張 expand）都相交的線段對
+    group 的前 own_count 筆屬於本桶，兩筆都屬於下一桶的對留給下一桶處理
+    回傳 group 中的索引對
+
+    垂直偏移分成等寬的帶，每條線段放進偏移區間涵蓋的所有帶；同一帶內沿方向掃描，
+    只產生方向區間相交的對（同一道牆面被門洞切成多段時，不會兩兩比對整條線上的所有線段）。
+    一對線段只在兩者偏移區間下界較大者所在的帶回報，不重複。
+    """
+    direction = np.array([math.cos(phi), math.sin(phi)])
+    normal = np.array([-direction[1], direction[0]])
+    along_s, along_e = starts @ direction, ends @ direction
+    offset_s, offset_e = starts @ normal, ends @ normal
+    u_lo = np.minimum(along_s, along_e) - expand
+    u_hi = np.maximum(along_s, along_e) + expand
+    n_lo = np.minimum(offset_s, offset_e) - expand
+    n_hi = np.maximum(offset_s, offset_e) + expand
+
+    # 偏移帶寬取偏移區間寬度中位數的兩倍：多數線段只落在一、兩個帶
+    band = max(float(np.median(n_hi - n_lo)) * 2, 1e-6)
+    band_lo = np.floor(n_lo / band).astype(np.int64)
+    band_hi = np.floor(n_hi / band).astype(np.int64)
+    copies = band_hi - band_lo + 1
+    entry = np.repeat(np.arange(len(group)), copies)
+    entry_band = band_lo[entry] + (np.arange(len(entry)) - np.repeat(np.cumsum(copies) - copies, copies))
+
+    # 依 (帶, 方向下界) 排序後，每筆只需和同帶中方向下界 ≤ 自己上界的後續各筆比對
+    order = np.lexsort((u_lo[entry], entry_band))
+    entry, entry_band = entry[order], entry_band[order]
+    band_end = np.searchsorted(entry_band, entry_band, side="right")
+    stop = _segmented_search(u_lo[entry], u_hi[entry], np.arange(1, len(entry) + 1), band_end)
+
+    result = []
+    for first, second in _range_pairs(stop):
+        a, b = entry[first], entry[second]
+        keep = (n_lo[a] <= n_hi[b]) & (n_lo[b] <= n_hi[a])
+        keep &= np.floor(np.maximum(n_lo[a], n_lo[b]) / band).astype(np.int64) == entry_band[first]
+        keep &= (a < own_count) | (b < own_count)
+        if keep.any():
+            result.append(np.stack([group[a[keep]], group[b[keep]]], axis=1))
+
+    if not result:
+        return np.empty((0, 2), dtype=np.int64)
+    return np.concatenate(result)
+
+
+def _segmented_search(values: np.ndarray, queries: np.ndarray,
+                      begin: np.ndarray, end: np.ndarray) -> np.ndarray:
+    """
+    向量化的分段二分搜尋：對每個 k，在 values[begin[k]:end[k]]（已排序）中
+    找第一個 > queries[k] 的位置，找不到時為 end[k]
+    """
+    lo, hi = begin.copy(), end.copy()
+    active = np.flatnonzero(lo < hi)
+    while len(active):
+        mid = (lo[active] + hi[active]) // 2
+        greater = values[mid] > queries[active]
+        hi[active[greater]] = mid[greater]
+        lo[active[~greater]] = mid[~greater] + 1
+        active = active[lo[active] < hi[active]]
+    return lo
+
+
+def _range_pairs(stop: np.ndarray):
+    """
+    產生所有 (i, j)，i < j < stop[i]；分段產生，每段最多約 _CANDIDATE_CHUNK 對
+    """
+    counts = np.maximum(stop - np.arange(len(stop)) - 1, 0)
+    cumulative = np.cumsum(counts)
+    begin = 0
+    while begin < len(stop):
+        base = cumulative[begin - 1] if begin else 0
+        end = max(int(np.searchsorted(cumulative, base + _CANDIDATE_CHUNK, side="right")), begin + 1)
+        chunk_counts = counts[begin:end]
+        total = int(chunk_counts.sum())
+        if total:
+            first = np.repeat(np.arange(begin, end), chunk_counts)
+            run_start = np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+            yield first, first + 1 + (np.arange(total) - run_start)
+        begin = end
+
+
+def _sorted_pairs(pairs: np.ndarray, count: int) -> np.ndarray:
+    """索引對改為 i < j 並依字典順序排列（以 i * count + j 單一整數鍵排序，比 lexsort 快）"""
+    low = np.minimum(pairs[:, 0], pairs[:, 1])
+    keys = low * count + (pairs[:, 0] + pairs[:, 1] - low)
+    keys.sort()
+    return np.stack([keys // count, keys % count], axis=1)
+
+
+# parallel_pair_batch 的結果欄位（對應 ParallelPair；線段以索引表示）
+PARALLEL_PAIR_DTYPE = np.dtype([
+    ("first", np.int64),            # 候選對的第一條（find_parallel_pair 的 seg1）
+    ("second", np.int64),           # 候選對的第二條（seg2）
+    ("primary", np.int64),          # 主要線段（較長者）
+    ("secondary", np.int64),        # 次要線段（較短者）
+    ("distance", np.float64),       # 平均垂直距離
+    ("overlap_length", np.float64),
+    ("t_start", np.float64),        # 重疊區間在 seg1 上的參數值
+    ("t_end", np.float64),
+    ("overlap_start", np.float64, (2,)),
+    ("overlap_end", np.float64, (2,)),
+    ("thickness", np.int64),        # 符合的牆厚在牆厚表中的索引
+])
+
+# 批次核心每次處理的候選對數（限制暫存陣列的記憶體）
+PAIR_BATCH_SIZE = 1_000_000
+
+
+class ThicknessTable(NamedTuple):
+    """
+    多組牆厚的查詢表（build_thickness_table 建立）
+
+    距離軸以所有範圍端點與任兩個牆厚的中點切成多段，每段內「包含此距離且牆厚最接近」的一組固定；
+    slots[2k] 為 edges[k-1] ~ edges[k] 之間（不含端點）的結果，slots[2k+1] 為恰好等於 edges[k] 的結果
+    """
+    thicknesses: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    edges: np.ndarray
+    slots: np.ndarray
+
+
+def build_thickness_table(thicknesses, tolerances=1.0) -> ThicknessTable:
+    """
+    建立牆厚查詢表；距離落在多組範圍 [牆厚 - 容許誤差, 牆厚 + 容許誤差] 內時，
+    取牆厚最接近者，再相同時取索引較小者
+
+    Args:
+        thicknesses: (C,) 牆厚
+        tolerances: (C,) 或單一值，容許誤差
+    """
+    thicknesses = np.atleast_1d(np.asarray(thicknesses, dtype=np.float64))
+    tolerances = np.broadcast_to(np.asarray(tolerances, dtype=np.float64), thicknesses.shape)
+    lower, upper = thicknesses - tolerances, thicknesses + tolerances
+    midpoints = (thicknesses[:, None] + thicknesses[None, :]) / 2
+    edges = np.unique(np.concatenate([lower, upper, midpoints.ravel()]))
+
+    # 每段取一個代表值：端點本身或兩端點中間
+    inside = np.concatenate([[edges[0] - 1.0], (edges[:-1] + edges[1:]) / 2, [edges[-1] + 1.0]])
+    samples = np.empty(2 * len(edges) + 1)
+    samples[0::2], samples[1::2] = inside, edges
+    contains = (lower <= samples[:, None]) & (samples[:, None] <= upper)
+    gap = np.where(contains, np.abs(samples[:, None] - thicknesses), np.inf)
+    slots = np.where(contains.any(axis=1), np.argmin(gap, axis=1), -1)  # argmin 相同時取索引較小者
+    return ThicknessTable(thicknesses, lower, upper, edges, slots)
+
+
+def match_thickness(table: ThicknessTable, distances: np.ndarray) -> np.ndarray:
+    """二分搜尋距離所屬的牆厚；回傳牆厚表中的索引，不符合任何一組為 -1"""
+    distances = np.asarray(distances, dtype=np.float64)
+    k = np.searchsorted(table.edges, distances)
+    exact = table.edges[np.minimum(k, len(table.edges) - 1)] == distances
+    slot = np.where(np.isnan(distances), 0, 2 * k + exact)
+    return table.slots[slot]
+
+
+def parallel_pair_batch(starts: np.ndarray, ends: np.ndarray, lengths: np.ndarray,
+                        first: np.ndarray, second: np.ndarray,
+                        wall_thickness,
+                        tolerance=1.0,
+                        angle_tolerance: float = 1.0,
+                        min_overlap: float = 10.0) -> np.ndarray:
+    """
+    批次版 find_parallel_pair：一次判斷所有候選對 (first[k], second[k])
+
+    平行判斷、平均垂直距離、牆厚範圍、重疊區間的計算步驟與逐對版本相同（相同的浮點運算順序），
+    結果逐位元一致；不建立 LineSegment / Vector2D / dict
+
+    Args:
+        starts, ends: (N, 2) 線段起點 / 終點
+        lengths: (N,) 線段長度（決定主要 / 次要線段，同 find_parallel_pair 的 seg['length']）
+        first, second: 候選對的線段索引
+        wall_thickness, tolerance: 單一牆厚，或多組牆厚（陣列）一次比對，
+            結果的 thickness 欄位為符合的一組（見 build_thickness_table）
+        其餘參數同 find_parallel_pair
+
+    Returns:
+        PARALLEL_PAIR_DTYPE 結構陣列，只含構成平行牆對的候選，順序與輸入相同
+    """
+    starts = np.asarray(starts, dtype=np.float64).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=np.float64).reshape(-1, 2)
+    lengths = np.asarray(lengths, dtype=np.float64)
+    first = np.asarray(first, dtype=np.int64)
+    second = np.asarray(second, dtype=np.int64)
+    table = build_thickness_table(wall_thickness, tolerance)
+
+    results = [
+        _parallel_pair_kernel(starts, ends, lengths, first[lo:lo + PAIR_BATCH_SIZE],
+                              second[lo:lo + PAIR_BATCH_SIZE], table,
+                              angle_tolerance, min_overlap)
+        for lo in range(0, len(first), PAIR_BATCH_SIZE)
+    ]
+    if not results:
+        return np.empty(0, dtype=PARALLEL_PAIR_DTYPE)
+    return np.concatenate(results)
+
+
+def _parallel_pair_kernel(starts, ends, lengths, first, second,
+                          table, angle_tolerance, min_overlap):
+    ax, ay = starts[first, 0], starts[first, 1]
+    bx, by = ends[first, 0], ends[first, 1]
+    px, py = starts[second, 0], starts[second, 1]
+    qx, qy = ends[second, 0], ends[second, 1]
+
+    # 步驟 1: 平行判斷（are_lines_parallel）
+    v1x, v1y = bx - ax, by - ay
+    v2x, v2y = qx - px, qy - py
+    len1 = np.sqrt(v1x * v1x + v1y * v1y)
+    len2 = np.sqrt(v2x * v2x + v2y * v2y)
+    keep = (len1 >= 1e-10) & (len2 >= 1e-10)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        n1x, n1y = v1x / len1, v1y / len1
+        n2x, n2y = v2x / len2, v2y / len2
+        keep &= np.abs(n1x * n2x + n1y * n2y) >= math.cos(math.radians(angle_tolerance))
+
+        # 步驟 2、3: 平均垂直距離與牆厚範圍（perpendicular_distance_averaged）
+        dist1 = np.abs(v1x * (ay - py) - v1y * (ax - px)) / len1
+        dist2 = np.abs(v1x * (ay - qy) - v1y * (ax - qx)) / len1
+        dist = (dist1 + dist2) / 2
+        thickness = match_thickness(table, dist)
+        keep &= thickness >= 0
+
+        # 步驟 4: 重疊區間（calculate_overlap_region）
+        t_p = (px - ax) * n1x + (py - ay) * n1y
+        t_q = (qx - ax) * n1x + (qy - ay) * n1y
+        t_start = np.maximum(0.0, np.minimum(t_p, t_q))
+        t_end = np.minimum(len1, np.maximum(t_p, t_q))
+        overlap = t_end - t_start
+        keep &= (t_start < t_end) & (overlap >= min_overlap)
+
+    index = np.flatnonzero(keep)
+    out = np.empty(len(index), dtype=PARALLEL_PAIR_DTYPE)
+    i, j = first[index], second[index]
+    out["first"], out["second"] = i, j
+    # 步驟 6: 主要線段為較長者（等長時取 seg1）
+    first_longer = lengths[i] >= lengths[j]
+    out["primary"] = np.where(first_longer, i, j)
+    out["secondary"] = np.where(first_longer, j, i)
+    out["distance"] = dist[index]
+    out["thickness"] = thickness[index]
+    out["overlap_length"] = overlap[index]
+    out["t_start"], out["t_end"] = t_start[index], t_end[index]
+    ax, ay, n1x, n1y = ax[index], ay[index], n1x[index], n1y[index]
+    out["overlap_start"] = np.stack([ax + out["t_start"] * n1x, ay + out["t_start"] * n1y], axis=1)
+    out["overlap_end"] = np.stack([ax + out["t_end"] * n1x, ay + out["t_end"] * n1y], axis=1)
+    return out
+
+
+def batch_to_parallel_pairs(batch: np.ndarray, segments: List[dict]) -> List[ParallelPair]:
+    """parallel_pair_batch 的結果 → ParallelPair 列表（索引換成線段 id）"""
+    pairs = []
+    columns = (batch["primary"].tolist(), batch["secondary"].tolist(), batch["distance"].tolist(),
+               batch["overlap_length"].tolist(), batch["t_start"].tolist(), batch["t_end"].tolist(),
+               map(tuple, batch["overlap_start"].tolist()), map(tuple, batch["overlap_end"].tolist()))
+    for primary, secondary, distance, overlap_length, t_start, t_end, start, end in zip(*columns):
+        pairs.append(ParallelPair(
+            primary_id=segments[primary]['id'],
+            secondary_id=segments[secondary]['id'],
+            distance=distance,
+            overlap_length=overlap_length,
+            overlap_region={
+                'start': start,
+                'end': end,
+                'length': overlap_length,
+                't_start': t_start,
+                't_end': t_end
+            }
+        ))
+    return pairs
+
+
+def find_parallel_pairs(segments: List[dict],
+                        wall_thickness: float,
+                        tolerance: float = 1.0,
+                        angle_tolerance: float = 1.0,
+                        min_overlap: float = 10.0) -> List[ParallelPair]:
+    """
+    找出線段集合中所有平行牆對
+
+    結果與依序對每一對 (i < j) 呼叫 find_parallel_pair(segments[i], segments[j]) 完全相同，
+    但只比對 parallel_pair_candidates 篩選出的候選對，並以 parallel_pair_batch 批次判斷
+
+    Args:
+        segments: 線段資料 dict 列表，格式同 find_parallel_pair
+        其餘參數同 find_parallel_pair
+    """
+    if len(segments) < 2:
+        return []
+    batch = _detect_pairs(segments, wall_thickness, tolerance, angle_tolerance, min_overlap)
+    return batch_to_parallel_pairs(batch, segments)
+
+
+def find_parallel_pairs_by_category(segments: List[dict],
+                                    thicknesses: Dict[int, Tuple[float, float]],
+                                    angle_tolerance: float = 1.0,
+                                    min_overlap: float = 10.0) -> Dict[int, List[ParallelPair]]:
+    """
+    一次偵測所有牆類型的平行牆對
+
+    只掃描一次線段：候選範圍取所有牆厚中最大者，每對的平均垂直距離再以二分搜尋比對牆厚表，
+    歸入牆厚最接近的類型（見 build_thickness_table）。線段本身的類型不影響比對。
+
+    Args:
+        segments: 線段資料 dict 列表，格式同 find_parallel_pair
+        thicknesses: {類型 ID: (牆厚, 容許誤差)}
+        angle_tolerance, min_overlap: 同 find_parallel_pair
+
+    Returns:
+        {類型 ID: ParallelPair 列表}，只含有找到平行牆對的類型；各類型內的順序同 find_parallel_pairs
+    """
+    if len(segments) < 2 or not thicknesses:
+        return {}
+    keys = list(thicknesses)
+    wall_thickness = [thicknesses[key][0] for key in keys]
+    tolerance = [thicknesses[key][1] for key in keys]
+    batch = _detect_pairs(segments, wall_thickness, tolerance, angle_tolerance, min_overlap)
+
+    result = {}
+    for index in np.unique(batch["thickness"]).tolist():
+        result[keys[index]] = batch_to_parallel_pairs(batch[batch["thickness"] == index], segments)
+    return result
+
+
+def _detect_pairs(segments, wall_thickness, tolerance, angle_tolerance, min_overlap):
+    starts = np.array([(seg['start_x'], seg['start_y']) for seg in segments], dtype=np.float64)
+    ends = np.array([(seg['end_x'], seg['end_y']) for seg in segments], dtype=np.float64)
+    lengths = np.array([seg['length'] for seg in segments], dtype=np.float64)
+    candidates = parallel_pair_candidates(starts, ends, wall_thickness, tolerance, angle_tolerance)
+    return parallel_pair_batch(starts, ends, lengths, candidates[:, 0], candidates[:, 1],
+                               wall_thickness, tolerance, angle_tolerance, min_overlap)
+
+
+# ==================== 批次長度計算 ====================
+
+def line_lengths(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """
+    一次計算多條直線的長度
+
+    Args:
+        starts, ends: 起點、終點 (N, 2)
+
+    Returns:
+        長度 (N,)，與 point_distance 逐筆計算的結果相同
+    """
+    delta = np.asarray(ends, dtype=float) - np.asarray(starts, dtype=float)
+    dx = delta[:, 0]
+    dy = delta[:, 1]
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def polyline_lengths(points: np.ndarray, offsets: np.ndarray,
+                     bulges: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    一次計算多條多段線的長度（頂點以 CSR 方式連續存放）
+
+    Args:
+        points: 所有多段線的頂點 (M, 2)
+        offsets: 第 i 條多段線的頂點為 points[offsets[i]:offsets[i+1]]，形狀 (N+1,)
+        bulges: 各頂點的凸度 (M,)，套用於該頂點到下一頂點的線段；None 表示全為直線
+
+    Returns:
+        長度 (N,)；頂點少於 2 個的多段線長度為 0
+    """
+    points = np.asarray(points, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    count = len(offsets) - 1
+    if count <= 0:
+        return np.zeros(0)
+    if len(points) < 2:
+        return np.zeros(count)
+
+    # 相鄰頂點的距離；跨越兩條多段線的那一段設為 0
+    pair_lengths = line_lengths(points[:-1], points[1:])
+    boundaries = offsets[1:-1] - 1
+    if bulges is not None:
+        pair_lengths *= bulge_length_factors(np.asarray(bulges, dtype=float)[:-1])
+    pair_lengths[boundaries[(boundaries >= 0) & (boundaries < len(pair_lengths))]] = 0.0
+
+    # 每條多段線的線段為 pair_lengths[offsets[i]:offsets[i+1]-1]
+    starts = offsets[:-1]
+    has_pairs = offsets[1:] - starts >= 2
+    lengths = np.zeros(count)
+    if has_pairs.any():
+        # reduceat 加總到下一個起點為止；多出的跨界段已設為 0
+        lengths[has_pairs] = np.add.reduceat(pair_lengths, starts[has_pairs])
+    return lengths
+
+
+# ==================== 弧線離散化 ====================
+
+# 弧線 / 圓離散化的預設弦高誤差（繪圖單位）
+DEFAULT_ARC_TOLERANCE = 2.0
+
+# 每條弧線的線段數上限
+ARC_MAX_SEGMENTS = 4096
+
+
+class ArcParams(NamedTuple):
+    """參數式弧線（角度為弧度，sweep 為逆時針掃過的角度；圓為 0 ~ 2π）"""
+    center_x: float
+    center_y: float
+    radius: float
+    start_angle: float
+    sweep: float
+
+
+def arc_segment_counts(radii: np.ndarray, sweeps: np.ndarray,
+                       tolerance: float = DEFAULT_ARC_TOLERANCE) -> np.ndarray:
+    """
+    依弦高誤差計算每條弧線所需的線段數
+
+    每段弦的弦高 r(1 - cos(θ/2)) 不超過 tolerance，
+    且每段不超過 45°（圓至少 8 段），最多 ARC_MAX_SEGMENTS 段
+    """
+    radii = np.abs(np.asarray(radii, dtype=float))
+    sweeps = np.abs(np.asarray(sweeps, dtype=float))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.clip(1.0 - tolerance / radii, -1.0, 1.0)
+        step = 2.0 * np.arccos(ratio)
+        counts = np.where(step > 0, np.ceil(sweeps / step), ARC_MAX_SEGMENTS)
+    minimum = np.ceil(sweeps / (math.pi / 4))
+    counts = np.nan_to_num(np.maximum(counts, minimum), nan=1.0)
+    return np.clip(counts, 1, ARC_MAX_SEGMENTS).astype(np.int64)
+
+
+def tessellate_arcs(params: np.ndarray, tolerance: float = DEFAULT_ARC_TOLERANCE):
+    """
+    一次離散化多條弧線
+
+    Args:
+        params: ArcParams 欄位組成的陣列 (N, 5)
+        tolerance: 弦高誤差上限
+
+    Returns:
+        (頂點 (M, 2), 偏移量 (N+1,))：第 i 條弧線的頂點為 points[offsets[i]:offsets[i+1]]
+        頂點含起點與終點（圓的首尾為同一點）
+    """
+    params = np.asarray(params, dtype=float).reshape(-1, 5)
+    center_x, center_y, radius, start, sweep = params.T
+    counts = arc_segment_counts(radius, sweep, tolerance)
+    point_counts = counts + 1
+    offsets = np.concatenate(([0], np.cumsum(point_counts)))
+
+    owner = np.repeat(np.arange(len(params)), point_counts)
+    step = np.arange(offsets[-1]) - np.repeat(offsets[:-1], point_counts)
+    angles = start[owner] + sweep[owner] * step / counts[owner]
+    points = np.empty((offsets[-1], 2))
+    points[:, 0] = center_x[owner] + radius[owner] * np.cos(angles)
+    points[:, 1] = center_y[owner] + radius[owner] * np.sin(angles)
+    return points, offsets
+
+
+def arc_points(arc: ArcParams,
+               tolerance: float = DEFAULT_ARC_TOLERANCE) -> List[Tuple[float, float]]:
+    """單一弧線的離散化頂點"""
+    points, _ = tessellate_arcs(np.array(arc, dtype=float), tolerance)
+    return list(map(tuple, points.tolist()))
+
+
+# ==================== 凸度多段線 ====================
+# LWPOLYLINE / POLYLINE 頂點的凸度 b = tan(θ/4)，θ 為該頂點到下一頂點的圓弧圓心角
+# （正值為逆時針）；b = 0 為直線段
+
+
+class BulgePolyline(NamedTuple):
+    """含圓弧段的多段線（頂點與凸度一一對應，最後一個凸度不使用）"""
+    points: List[Tuple[float, float]]
+    bulges: List[float]
+
+
+def bulge_length_factors(bulges: np.ndarray) -> np.ndarray:
+    """
+    圓弧段長度 / 弦長 = θ / (2 sin(θ/2))，θ = 4 atan|b|
+    直線段（b = 0）為 1
+    """
+    theta = 4.0 * np.arctan(np.abs(np.asarray(bulges, dtype=float)))
+    half = np.sin(theta / 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        factors = np.where(half > 0, theta / (2 * half), 1.0)
+    return factors
+
+
+def bulge_arcs(starts: np.ndarray, ends: np.ndarray, bulges: np.ndarray) -> np.ndarray:
+    """
+    圓弧段轉為 ArcParams 欄位 (K, 5)（sweep 帶正負號，順時針為負）
+    bulges 不可為 0
+    """
+    starts = np.asarray(starts, dtype=float).reshape(-1, 2)
+    ends = np.asarray(ends, dtype=float).reshape(-1, 2)
+    bulges = np.asarray(bulges, dtype=float)
+    delta = ends - starts
+    chord = np.hypot(delta[:, 0], delta[:, 1])
+    # 圓心在弦中點沿左法線方向 c(1 - b²) / (4b) 處
+    offset = (1.0 - bulges * bulges) / (4.0 * bulges)
+    center_x = (starts[:, 0] + ends[:, 0]) / 2 - delta[:, 1] * offset
+    center_y = (starts[:, 1] + ends[:, 1]) / 2 + delta[:, 0] * offset
+    params = np.empty((len(bulges), 5))
+    params[:, 0] = center_x
+    params[:, 1] = center_y
+    params[:, 2] = chord * (1.0 + bulges * bulges) / (4.0 * np.abs(bulges))
+    params[:, 3] = np.arctan2(starts[:, 1] - center_y, starts[:, 0] - center_x)
+    params[:, 4] = 4.0 * np.arctan(bulges)
+    return params
+
+
+def tessellate_bulges(points: np.ndarray, bulges: np.ndarray, offsets: np.ndarray,
+                      tolerance: float = DEFAULT_ARC_TOLERANCE):
+    """
+    一次離散化多條凸度多段線（圓弧段依弦高誤差細分，直線段不變）
+
+    Args:
+        points: 所有多段線的頂點 (M, 2)
+        bulges: 各頂點的凸度 (M,)
+        offsets: 第 i 條多段線的頂點為 points[offsets[i]:offsets[i+1]]，形狀 (N+1,)
+
+    Returns:
+        (頂點 (K, 2), 偏移量 (N+1,))；原有頂點保持原座標
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    bulges = np.asarray(bulges, dtype=float)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    counts = np.diff(offsets)
+    owner = np.repeat(np.arange(len(counts)), counts)
+
+    # 第 k 個頂點到第 k+1 個頂點屬於同一條多段線且凸度不為 0 時為圓弧段
+    curved = np.zeros(len(points), dtype=bool)
+    curved[:-1] = (owner[:-1] == owner[1:]) & (bulges[:-1] != 0)
+    curved_index = np.flatnonzero(curved)
+    arc_vertices, arc_offsets = tessellate_arcs(
+        bulge_arcs(points[curved_index], points[curved_index + 1], bulges[curved_index]),
+        tolerance)
+    # 每段圓弧不含終點（終點即下一個頂點）
+    arc_counts = np.diff(arc_offsets) - 1
+
+    pieces = np.ones(len(points), dtype=np.int64)
+    pieces[curved_index] = arc_counts
+    starts = np.concatenate(([0], np.cumsum(pieces)))
+    result = np.empty((starts[-1], 2))
+    keep = np.ones(len(arc_vertices), dtype=bool)
+    keep[arc_offsets[1:] - 1] = False
+    arc_owner = np.repeat(curved_index, arc_counts)
+    local = np.arange(len(arc_owner)) - np.repeat(arc_offsets[:-1] - np.arange(len(arc_counts)),
+                                                  arc_counts)
+    result[starts[arc_owner] + local] = arc_vertices[keep]
+    result[starts[:-1]] = points
+    return result, starts[offsets]
+
+
+def bulge_points(polyline: BulgePolyline,
+                 tolerance: float = DEFAULT_ARC_TOLERANCE) -> List[Tuple[float, float]]:
+    """單一凸度多段線的離散化頂點"""
+    points, _ = tessellate_bulges(polyline.points, polyline.bulges,
+                                  [0, len(polyline.points)], tolerance)
+    return list(map(tuple, points.tolist()))
+
+
+def bulge_polyline_length(polyline: BulgePolyline) -> float:
+    """單一凸度多段線的精確長度"""
+    return float(polyline_lengths(polyline.points, [0, len(polyline.points)],
+                                  polyline.bulges)[0])
+
+
 # ==================== 測試函式 ====================
 
 def test_geometry():
@@ -0,0 +1,281 @@
+"""
+Parse Cache for Wall Quantity Calculator
+以 DXF 檔案內容雜湊為鍵的解析結果快取（磁碟儲存）
+
+同一份圖面重複上傳時，直接讀取快取的圖層、標頭變數與線段，
+不必重新執行 DXFParser.load / extract_layers / extract_wall_entities。
+
+快取檔格式（zlib 壓縮）:
+    MAGIC | uint32 中繼資料長度 | 中繼資料 JSON | 各欄位陣列（little-endian）
+"""
+import array
+import hashlib
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Union
+
+from dxf_parser import PARSER_VERSION
+from segment_store import SegmentStore, WallSegment
+
+CACHE_MAGIC = b"WQCACHE3"
+CACHE_SUFFIX = ".wqc"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_content_hash(filepath: str) -> str:
+    """計算檔案內容的 SHA-256（分段讀取，不整份載入記憶體）"""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as fp:
+        for chunk in iter(lambda: fp.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class CachedParse:
+    """快取的解析結果"""
+    key: str
+    layers: Dict[str, dict]
+    dimscale: float
+    insunits: int
+    segments: SegmentStore
+
+
+def _pack_array(typecode: str, values) -> bytes:
+    arr = array.array(typecode, values)
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr.tobytes()
+
+
+def _unpack_array(typecode: str, data: memoryview, offset: int, count: int):
+    arr = array.array(typecode)
+    size = arr.itemsize * count
+    arr.frombytes(data[offset:offset + size])
+    if sys.byteorder != "little":
+        arr.byteswap()
+    return arr, offset + size
+
+
+def encode_segments(segments, meta: dict) -> bytes:
+    """
+    將線段編碼為欄位式二進位資料（直接寫出 SegmentStore 的陣列欄位）
+    圖層與實體類型以代碼表儲存，頂點以 CSR 方式（偏移量 + 連續座標）儲存，
+    參數式弧線與凸度多段線另存列索引與參數（讀回後仍可延後離散化）
+    """
+    store = SegmentStore.from_segments(segments)
+
+    meta = dict(meta)
+    meta.update({
+        "parser_version": PARSER_VERSION,
+        "count": len(store),
+        "layer_names": store.layers.names,
+        "entity_types": store.types.names,
+        "vertex_count": store.vertex_offsets[-1],
+        "curve_count": len(store.curve_rows),
+        "bulge_count": len(store.bulge_rows),
+        "bulge_vertex_count": store.bulge_offsets[-1],
+        "arc_tolerance": store.arc_tolerance,
+    })
+    meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+
+    payload = b"".join((
+        struct.pack("<I", len(meta_bytes)),
+        meta_bytes,
+        _pack_array("I", store.layer_col),
+        _pack_array("B", store.type_col),
+        _pack_array("B", store.has_vertices),
+        _pack_array("d", store.coords),
+        _pack_array("Q", store.vertex_offsets),
+        _pack_array("d", store.vertex_coords),
+        _pack_array("Q", store.curve_rows),
+        _pack_array("d", store.curve_params),
+        _pack_array("Q", store.bulge_rows),
+        _pack_array("Q", store.bulge_offsets),
+        _pack_array("d", store.bulge_coords),
+    ))
+    return CACHE_MAGIC + zlib.compress(payload, 1)
+
+
+def decode_segments(blob: bytes):
+    """解碼 encode_segments 的輸出，回傳 (中繼資料, SegmentStore)"""
+    if not blob.startswith(CACHE_MAGIC):
+        raise ValueError("不是有效的快取檔")
+    data = memoryview(zlib.decompress(blob[len(CACHE_MAGIC):]))
+
+    (meta_len,) = struct.unpack_from("<I", data, 0)
+    offset = 4 + meta_len
+    meta = json.loads(bytes(data[4:offset]).decode("utf-8"))
+
+    count = meta["count"]
+    layer_col, offset = _unpack_array("I", data, offset, count)
+    type_col, offset = _unpack_array("B", data, offset, count)
+    has_vertices, offset = _unpack_array("B", data, offset, count)
+    coords, offset = _unpack_array("d", data, offset, count * 5)
+    vertex_offsets, offset = _unpack_array("Q", data, offset, count + 1)
+    vertex_coords, offset = _unpack_array("d", data, offset, meta["vertex_count"] * 2)
+    curve_rows, offset = _unpack_array("Q", data, offset, meta["curve_count"])
+    curve_params, offset = _unpack_array("d", data, offset, meta["curve_count"] * 5)
+    bulge_rows, offset = _unpack_array("Q", data, offset, meta["bulge_count"])
+    bulge_offsets, offset = _unpack_array("Q", data, offset, meta["bulge_count"] + 1)
+    bulge_coords, offset = _unpack_array("d", data, offset, meta["bulge_vertex_count"] * 3)
+    if len(bulge_coords) != meta["bulge_vertex_count"] * 3:
+        raise ValueError("快取檔資料不完整")
+
+    store = SegmentStore.from_columns(
+        meta["layer_names"], meta["entity_types"], layer_col, type_col, coords,
+        has_vertices, vertex_offsets, vertex_coords, curve_rows, curve_params,
+        bulge_rows, bulge_offsets, bulge_coords, meta["arc_tolerance"]
+    )
+    return meta, store
+
+
+class ParseCache:
+    """
+    磁碟上的解析結果快取
+    - 鍵：檔案內容 SHA-256 + 解析器版本 + 提取變體
+    - 容量：超過 max_bytes 時依最近使用時間 (LRU) 淘汰
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(file_hash: str, variant: str = "all") -> str:
+        return f"{file_hash}-v{PARSER_VERSION}-{variant}"
+
+    @staticmethod
+    def layers_variant(layers: Optional[Iterable[str]]) -> str:
+        """只提取部分圖層時的提取變體（圖層名稱排序後的雜湊）；未指定時為 all"""
+        if layers is None:
+            return "all"
+        digest = hashlib.sha1("\n".join(sorted(set(layers))).encode("utf-8")).hexdigest()
+        return f"layers-{digest[:16]}"
+
+    def _path(self, key: str) -> str:
+        # 鍵只允許十六進位與簡單符號，避免路徑穿越
+        safe = "".join(ch for ch in key if ch.isalnum() or ch in "-_.")
+        return os.path.join(self.cache_dir, safe + CACHE_SUFFIX)
+
+    def get(self, key: str) -> Optional[CachedParse]:
+        """讀取快取；不存在或已損毀時回傳 None"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fp:
+                blob = fp.read()
+            meta, segments = decode_segments(blob)
+        except FileNotFoundError:
+            return None
+        except (ValueError, zlib.error, struct.error, KeyError) as e:
+            print(f"  [!] 快取檔損毀，已移除: {key} ({e})")
+            self.invalidate(key)
+            return None
+
+        if meta.get("parser_version") != PARSER_VERSION:
+            self.invalidate(key)
+            return None
+
+        # 更新存取時間供 LRU 淘汰使用
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        return CachedParse(
+            key=key,
+            layers=meta.get("layers", {}),
+            dimscale=meta.get("dimscale", 1.0),
+            insunits=meta.get("insunits", 0),
+            segments=segments
+        )
+
+    def put(self, key: str, layers: Dict[str, dict], dimscale: float, insunits: int,
+            segments: Union[SegmentStore, List[WallSegment]]) -> int:
+        """寫入快取，回傳快取檔大小（位元組）"""
+        blob = encode_segments(segments, {
+            "layers": layers,
+            "dimscale": dimscale,
+            "insunits": insunits,
+        })
+
+        # 先寫入暫存檔再置換，避免其他執行緒讀到寫一半的檔案
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(blob)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        self._evict()
+        return len(blob)
+
+    def invalidate(self, key: Optional[str] = None) -> int:
+        """
+        移除快取
+        key 為 None 時清除全部；key 可為完整鍵或檔案雜湊（移除該檔案的所有版本）
+        回傳移除的檔案數
+        """
+        removed = 0
+        with self._lock:
+            for name in os.listdir(self.cache_dir):
+                if not name.endswith(CACHE_SUFFIX):
+                    continue
+                if key is not None and not (name == os.path.basename(self._path(key))
+                                            or name.startswith(key + "-")):
+                    continue
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "total_bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+    def _entries(self):
+        """回傳 [(路徑, 大小, 最後存取時間)]"""
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(CACHE_SUFFIX):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, st.st_size, st.st_mtime))
+        return entries
+
+    def _evict(self):
+        """總大小超過上限時，從最久未使用的快取開始移除"""
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes:
+                return
+            for path, size, _ in sorted(entries, key=lambda e: e[2]):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
@@ -0,0 +1,143 @@
+"""
+Parse Job Manager for Wall Quantity Calculator
+背景解析工作：POST /api/parse 立即回傳工作 ID，解析在背景執行緒池中進行，
+前端以狀態端點輪詢目前階段與進度
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+# 工作階段與其在整體進度中所佔的百分比範圍
+JOB_PHASES = {
+    "queued": (0.0, 0.0),
+    "load": (0.0, 30.0),
+    "layers": (30.0, 35.0),
+    "entities": (35.0, 85.0),
+    "import": (85.0, 100.0),
+}
+
+
+@dataclass
+class ParseJob:
+    """一個背景解析工作"""
+    job_id: str
+    filepath: str
+    project_name: str
+    status: str = "queued"      # queued / running / done / failed
+    phase: str = "queued"       # load / layers / entities / import
+    processed: int = 0          # 目前階段已處理數量
+    total: int = 0              # 目前階段總數量
+    percent: float = 0.0        # 整體進度 (0 ~ 100)
+    error: Optional[str] = None
+    result: Optional[dict] = None
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+    def update(self, phase: str, processed: int, total: int):
+        """回報進度（由解析器與資料庫匯入的進度回呼呼叫）"""
+        low, high = JOB_PHASES.get(phase, (self.percent, self.percent))
+        fraction = min(processed / total, 1.0) if total else 0.0
+        self.phase = phase
+        self.processed = processed
+        self.total = total
+        # 進度只增不減（串流模式的圖層階段可能在實體階段之後才回報）
+        self.percent = max(self.percent, round(low + (high - low) * fraction, 1))
+
+    def to_dict(self, include_result: bool = False) -> dict:
+        data = {
+            "job_id": self.job_id,
+            "project_name": self.project_name,
+            "status": self.status,
+            "phase": self.phase,
+            "processed": self.processed,
+            "total": self.total,
+            "percent": self.percent,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.started_at:
+            data["elapsed"] = round((self.finished_at or time.time()) - self.started_at, 3)
+        if include_result and self.result is not None:
+            data["result"] = self.result
+        return data
+
+
+class ParseJobManager:
+    """
+    背景解析工作管理器
+    worker(job, **params) 執行實際的解析並回傳結果 dict；
+    例外視為失敗，訊息記錄在 job.error
+    """
+
+    def __init__(self, worker: Callable[..., dict], max_workers: int = 2,
+                 max_finished: int = 50):
+        self.worker = worker
+        self.max_finished = max_finished  # 最多保留的已結束工作數（連同結果）
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="parse-job")
+        self._jobs: Dict[str, ParseJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, filepath: str, project_name: str, **params: Any) -> ParseJob:
+        """建立工作並排入執行緒池，立即回傳"""
+        job = ParseJob(job_id=uuid.uuid4().hex, filepath=filepath, project_name=project_name)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+        self._executor.submit(self._run, job, params)
+        return job
+
+    def get(self, job_id: str) -> Optional[ParseJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self) -> List[ParseJob]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created_at)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[ParseJob]:
+        """等待工作結束（測試與同步呼叫用）"""
+        deadline = None if timeout is None else time.time() + timeout
+        job = self.get(job_id)
+        while job and job.status in ("queued", "running"):
+            if deadline is not None and time.time() > deadline:
+                break
+            time.sleep(0.05)
+        return job
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: ParseJob, params: Dict[str, Any]):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            result = self.worker(job, **params)
+        except Exception as e:
+            job.error = str(e)
+            job.finished_at = time.time()
+            job.status = "failed"
+            print(f"[X] 解析工作失敗 {job.job_id}: {e}")
+            return
+
+        # 狀態最後才設定，輪詢端看到 done 時結果必定已就緒
+        job.result = result
+        job.phase = "done"
+        job.percent = 100.0
+        job.finished_at = time.time()
+        job.status = "done"
+
+    def _prune(self):
+        """移除最舊的已結束工作，避免結果無限累積於記憶體"""
+        finished = [job for job in self._jobs.values() if job.finished_at]
+        if len(finished) <= self.max_finished:
+            return
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[:len(finished) - self.max_finished]:
+            del self._jobs[job.job_id]
@@ -0,0 +1,542 @@
+"""
+Segment Store for Wall Quantity Calculator
+欄位式線段儲存（structure of arrays）
+
+線段不再各自是一個 WallSegment 物件，而是存成幾個連續陣列：
+    - 圖層 / 實體類型：名稱表 + 代碼欄位
+    - 起點、終點、長度：float64
+    - 頂點：CSR 方式（偏移量 + 連續座標）
+線段 ID 由位置產生（第 i 筆為 seg_{i+1:05d}），不另外儲存。
+存取單筆時才建立 WallSegment（惰性檢視），既有呼叫端可照常迭代、索引。
+
+弧線 / 圓可以參數式儲存（圓心、半徑、角度），需要顯示用頂點時才依弦高誤差
+arc_tolerance 離散化：tessellate() 批次處理，單筆存取時即時計算。
+含圓弧段（凸度）的多段線同樣保存原始頂點與凸度，長度以圓弧段精確計算，
+顯示用頂點同樣由 tessellate() 產生。
+"""
+import bisect
+import math
+from array import array
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from geometry_utils import (
+    ArcParams, BulgePolyline, DEFAULT_ARC_TOLERANCE, arc_points, bulge_points, line_lengths,
+    polyline_lengths, tessellate_arcs, tessellate_bulges
+)
+
+
+@dataclass
+class WallSegment:
+    """代表一條牆線段"""
+    id: str
+    layer: str
+    entity_type: str
+    start_point: Tuple[float, float]
+    end_point: Tuple[float, float]
+    length: float
+    vertices: List[Tuple[float, float]] = None  # For polylines
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "layer": self.layer,
+            "entity_type": self.entity_type,
+            "start_point": self.start_point,
+            "end_point": self.end_point,
+            "length": self.length,
+            "vertices": None if self.vertices is None else list(self.vertices),
+        }
+
+
+def segment_id(index: int) -> str:
+    """第 index 筆線段（從 0 起算）的 ID"""
+    return f"seg_{index + 1:05d}"
+
+
+class _Names:
+    """名稱表：字串 ↔ 代碼"""
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = list(names)
+        self._codes: Dict[str, int] = {name: i for i, name in enumerate(self.names)}
+
+    def code(self, name: str) -> int:
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def __getstate__(self):
+        # 對照表可由 names 重建，不需序列化
+        return self.names
+
+    def __setstate__(self, names):
+        self.__init__(names)
+
+
+class SegmentStore(Sequence):
+    """
+    欄位式線段集合
+    append(record) 接受處理函式產生的記錄 (圖層, 類型, 起點, 終點, 長度, 頂點)，
+    可直接作為處理函式的輸出；也可跨行程傳送（只序列化幾個陣列）
+    長度為 None 的記錄暫存為 NaN，由 fill_lengths() 一次向量化計算；
+    頂點為 ArcParams 的記錄為參數式弧線、BulgePolyline 為凸度多段線，
+    皆由 tessellate() 批次離散化
+    """
+
+    def __init__(self):
+        self.layers = _Names()
+        self.types = _Names()
+        self.layer_col = array("I")
+        self.type_col = array("B")
+        self.coords = array("d")            # 每筆 5 個值：起點 x, y、終點 x, y、長度
+        self.has_vertices = array("B")
+        self.vertex_offsets = array("Q", [0])  # 第 i 筆的頂點為 offsets[i] ~ offsets[i+1]
+        self.vertex_coords = array("d")
+        self.curve_rows = array("Q")        # 參數式弧線所在的列（遞增）
+        self.curve_params = array("d")      # 每條 5 個值，見 ArcParams
+        self.bulge_rows = array("Q")        # 凸度多段線所在的列（遞增）
+        self.bulge_offsets = array("Q", [0])  # 第 k 條凸度多段線的頂點為 offsets[k] ~ offsets[k+1]
+        self.bulge_coords = array("d")      # 每個頂點 3 個值：x, y, 凸度
+        self.arc_tolerance = DEFAULT_ARC_TOLERANCE  # 離散化的弦高誤差（繪圖單位）
+        self._arrays: Optional[Dict[str, np.ndarray]] = None  # NumPy 欄位快取
+
+    # ---------- 寫入 ----------
+
+    def append(self, record: tuple):
+        layer, entity_type, start, end, length, vertices = record
+        self.layer_col.append(self.layers.code(layer))
+        self.type_col.append(self.types.code(entity_type))
+        self.coords.extend((start[0], start[1], end[0], end[1],
+                            math.nan if length is None else length))
+        self.has_vertices.append(vertices is not None)
+        if isinstance(vertices, ArcParams):
+            # 頂點待離散化，先不佔用頂點緩衝區
+            self.curve_rows.append(len(self.layer_col) - 1)
+            self.curve_params.extend(vertices)
+        elif isinstance(vertices, BulgePolyline):
+            self.bulge_rows.append(len(self.layer_col) - 1)
+            for (x, y), bulge in zip(vertices.points, vertices.bulges):
+                self.bulge_coords.extend((x, y, bulge))
+            self.bulge_offsets.append(len(self.bulge_coords) // 3)
+        elif vertices:
+            for x, y in vertices:
+                self.vertex_coords.append(x)
+                self.vertex_coords.append(y)
+        self.vertex_offsets.append(len(self.vertex_coords) // 2)
+        self._arrays = None
+
+    def extend(self, records: Iterable):
+        """加入記錄；也接受另一個 SegmentStore（直接串接陣列）"""
+        if isinstance(records, SegmentStore):
+            self._extend_store(records)
+            return
+        for record in records:
+            self.append(record)
+
+    def _extend_store(self, other: 'SegmentStore'):
+        if not len(other):
+            return
+        layer_map = [self.layers.code(name) for name in other.layers.names]
+        type_map = [self.types.code(name) for name in other.types.names]
+        self.layer_col.extend(layer_map[code] for code in other.layer_col)
+        self.type_col.extend(type_map[code] for code in other.type_col)
+        self.coords.extend(other.coords)
+        self.has_vertices.extend(other.has_vertices)
+        row_base = len(self.vertex_offsets) - 1
+        base = self.vertex_offsets[-1]
+        self.vertex_offsets.extend(base + offset for offset in other.vertex_offsets[1:])
+        self.vertex_coords.extend(other.vertex_coords)
+        self.curve_rows.extend(row_base + row for row in other.curve_rows)
+        self.curve_params.extend(other.curve_params)
+        self.bulge_rows.extend(row_base + row for row in other.bulge_rows)
+        base = self.bulge_offsets[-1]
+        self.bulge_offsets.extend(base + offset for offset in other.bulge_offsets[1:])
+        self.bulge_coords.extend(other.bulge_coords)
+        self._arrays = None
+
+    @classmethod
+    def from_segments(cls, segments: Iterable) -> 'SegmentStore':
+        """由 WallSegment（或 SegmentStore）建立；線段 ID 依位置重新產生"""
+        if isinstance(segments, SegmentStore):
+            return segments
+        store = cls()
+        for seg in segments:
+            store.append((seg.layer, seg.entity_type, seg.start_point, seg.end_point,
+                          seg.length, seg.vertices))
+        return store
+
+    @classmethod
+    def from_columns(cls, layer_names: List[str], type_names: List[str], layer_col: array,
+                     type_col: array, coords: array, has_vertices: array,
+                     vertex_offsets: array, vertex_coords: array,
+                     curve_rows: Optional[array] = None, curve_params: Optional[array] = None,
+                     bulge_rows: Optional[array] = None, bulge_offsets: Optional[array] = None,
+                     bulge_coords: Optional[array] = None,
+                     arc_tolerance: float = DEFAULT_ARC_TOLERANCE) -> 'SegmentStore':
+        """由既有的陣列欄位建立（解析快取讀取用），陣列直接沿用不複製"""
+        store = cls()
+        store.layers = _Names(layer_names)
+        store.types = _Names(type_names)
+        store.layer_col = layer_col
+        store.type_col = type_col
+        store.coords = coords
+        store.has_vertices = has_vertices
+        store.vertex_offsets = vertex_offsets
+        store.vertex_coords = vertex_coords
+        if curve_rows is not None:
+            store.curve_rows = curve_rows
+            store.curve_params = curve_params
+        if bulge_rows is not None:
+            store.bulge_rows = bulge_rows
+            store.bulge_offsets = bulge_offsets
+            store.bulge_coords = bulge_coords
+        store.arc_tolerance = arc_tolerance
+        return store
+
+    # ---------- 讀取（惰性檢視） ----------
+
+    def __len__(self) -> int:
+        return len(self.layer_col)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._segment(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+        return self._segment(index)
+
+    def __iter__(self) -> Iterator[WallSegment]:
+        for i in range(len(self)):
+            yield self._segment(i)
+
+    def __eq__(self, other):
+        if isinstance(other, (SegmentStore, list, tuple)):
+            return len(self) == len(other) and list(self) == list(other)
+        return NotImplemented
+
+    def _vertices(self, index: int) -> Optional[List[Tuple[float, float]]]:
+        if not self.has_vertices[index]:
+            return None
+        lo, hi = self.vertex_offsets[index] * 2, self.vertex_offsets[index + 1] * 2
+        if lo == hi:
+            arc = self.arc(index)
+            if arc is not None:
+                return arc_points(arc, self.arc_tolerance)
+            polyline = self.bulge_polyline(index)
+            if polyline is not None:
+                return bulge_points(polyline, self.arc_tolerance)
+        return list(zip(self.vertex_coords[lo:hi:2], self.vertex_coords[lo + 1:hi:2]))
+
+    def arc(self, index: int) -> Optional[ArcParams]:
+        """第 index 筆線段的弧線參數；不是參數式弧線時回傳 None"""
+        position = bisect.bisect_left(self.curve_rows, index)
+        if position == len(self.curve_rows) or self.curve_rows[position] != index:
+            return None
+        return ArcParams(*self.curve_params[position * 5:position * 5 + 5])
+
+    def bulge_polyline(self, index: int) -> Optional[BulgePolyline]:
+        """第 index 筆線段的原始頂點與凸度；不是凸度多段線時回傳 None"""
+        position = bisect.bisect_left(self.bulge_rows, index)
+        if position == len(self.bulge_rows) or self.bulge_rows[position] != index:
+            return None
+        lo, hi = self.bulge_offsets[position] * 3, self.bulge_offsets[position + 1] * 3
+        data = self.bulge_coords
+        return BulgePolyline(list(zip(data[lo:hi:3], data[lo + 1:hi:3])), data[lo + 2:hi:3].tolist())
+
+    def _segment(self, index: int) -> WallSegment:
+        c = index * 5
+        coords = self.coords
+        return WallSegment(
+            id=segment_id(index),
+            layer=self.layers.names[self.layer_col[index]],
+            entity_type=self.types.names[self.type_col[index]],
+            start_point=(coords[c], coords[c + 1]),
+            end_point=(coords[c + 2], coords[c + 3]),
+            length=coords[c + 4],
+            vertices=self._vertices(index)
+        )
+
+    def iter_records(self) -> Iterator[tuple]:
+        """依序產生記錄 (圖層, 類型, 起點, 終點, 長度, 頂點)"""
+        layer_names = self.layers.names
+        type_names = self.types.names
+        coords = self.coords
+        for i in range(len(self)):
+            c = i * 5
+            yield (layer_names[self.layer_col[i]], type_names[self.type_col[i]],
+                   (coords[c], coords[c + 1]), (coords[c + 2], coords[c + 3]),
+                   coords[c + 4], self._vertices(i))
+
+    def to_dicts(self, parametric: bool = False) -> List[dict]:
+        """
+        所有線段轉為 dict（與 WallSegment.to_dict 相同），不經過 WallSegment
+        parametric=True 時參數式弧線不輸出頂點，改附 "arc"（圓心、半徑、起訖角度）；
+        凸度多段線改附 "bulges"（原始頂點與凸度）；
+        否則先將尚未離散化的弧線與凸度多段線批次離散化
+        """
+        if not parametric:
+            self.tessellate()
+        arcs = self._arc_dicts() if parametric else {}
+        bulges = self._bulge_dicts() if parametric else {}
+
+        layer_names = self.layers.names
+        type_names = self.types.names
+        layers = [layer_names[code] for code in self.layer_col]
+        types = [type_names[code] for code in self.type_col]
+        coords = self.coords
+        xs0, ys0 = coords[0::5].tolist(), coords[1::5].tolist()
+        xs1, ys1 = coords[2::5].tolist(), coords[3::5].tolist()
+        lengths = coords[4::5].tolist()
+        offsets = self.vertex_offsets.tolist()
+        vertex_coords = self.vertex_coords.tolist()
+        has_vertices = self.has_vertices
+
+        dicts = []
+        for i in range(len(layers)):
+            vertices = None
+            if has_vertices[i] and i not in arcs and i not in bulges:
+                lo, hi = offsets[i] * 2, offsets[i + 1] * 2
+                vertices = list(zip(vertex_coords[lo:hi:2], vertex_coords[lo + 1:hi:2]))
+            data = {
+                "id": segment_id(i),
+                "layer": layers[i],
+                "entity_type": types[i],
+                "start_point": (xs0[i], ys0[i]),
+                "end_point": (xs1[i], ys1[i]),
+                "length": lengths[i],
+                "vertices": vertices,
+            }
+            if i in arcs:
+                data["arc"] = arcs[i]
+            elif i in bulges:
+                data["bulges"] = bulges[i]
+            dicts.append(data)
+        return dicts
+
+    def _arc_dicts(self) -> Dict[int, dict]:
+        """列 → 弧線參數 dict（角度為度，與 DXF 相同）"""
+        params = self.curve_params.tolist()
+        arcs = {}
+        for position, row in enumerate(self.curve_rows):
+            center_x, center_y, radius, start, sweep = params[position * 5:position * 5 + 5]
+            arcs[row] = {
+                "center": (center_x, center_y),
+                "radius": radius,
+                "start_angle": math.degrees(start),
+                "end_angle": math.degrees(start + sweep),
+            }
+        return arcs
+
+    def _bulge_dicts(self) -> Dict[int, dict]:
+        """列 → 凸度多段線 dict（原始頂點與凸度）"""
+        return {row: {"points": polyline.points, "bulges": polyline.bulges}
+                for row, polyline in ((row, self.bulge_polyline(row)) for row in self.bulge_rows)}
+
+    def _bulge_arrays(self, pending: Optional[np.ndarray] = None):
+        """凸度多段線的 (頂點 (M, 2), 凸度 (M,), 偏移量)；pending 為要取出的遮罩"""
+        data = np.array(self.bulge_coords, dtype=np.float64).reshape(-1, 3)
+        offsets = np.array(self.bulge_offsets, dtype=np.int64)
+        if pending is not None and not pending.all():
+            counts = np.diff(offsets)[pending]
+            take = np.repeat(offsets[:-1][pending], counts)
+            take += np.arange(len(take)) - np.repeat(np.cumsum(counts) - counts, counts)
+            data = data[take]
+            offsets = np.concatenate(([0], np.cumsum(counts)))
+        return data[:, :2], data[:, 2], offsets
+
+    def tessellate(self, tolerance: Optional[float] = None) -> int:
+        """
+        將尚未離散化的參數式弧線與凸度多段線批次轉為頂點（原始參數仍保留）
+        tolerance 為弦高誤差（繪圖單位），未指定時使用 arc_tolerance；回傳處理的筆數
+        """
+        if tolerance is not None:
+            self.arc_tolerance = tolerance
+        if not self.curve_rows and not self.bulge_rows:
+            return 0
+
+        old_offsets = np.array(self.vertex_offsets, dtype=np.int64)
+        # 各來源（弧線、凸度多段線）待離散化的列與產生的頂點
+        fills = []
+        curve_rows = np.array(self.curve_rows, dtype=np.int64)
+        pending = old_offsets[curve_rows + 1] == old_offsets[curve_rows]
+        if pending.any():
+            params = np.array(self.curve_params, dtype=np.float64).reshape(-1, 5)[pending]
+            fills.append((curve_rows[pending], *tessellate_arcs(params, self.arc_tolerance)))
+        bulge_rows = np.array(self.bulge_rows, dtype=np.int64)
+        pending = old_offsets[bulge_rows + 1] == old_offsets[bulge_rows]
+        if pending.any():
+            points, bulges, offsets = self._bulge_arrays(pending)
+            fills.append((bulge_rows[pending],
+                          *tessellate_bulges(points, bulges, offsets, self.arc_tolerance)))
+        if not fills:
+            return 0
+
+        # 重新配置頂點緩衝區：原有頂點搬到新位置，新頂點填入各自的列
+        counts = np.diff(old_offsets)
+        new_counts = counts.copy()
+        for rows, _, fill_offsets in fills:
+            new_counts[rows] = np.diff(fill_offsets)
+        new_offsets = np.concatenate(([0], np.cumsum(new_counts)))
+        buffer = np.empty((new_offsets[-1], 2))
+
+        old_vertices = np.array(self.vertex_coords, dtype=np.float64).reshape(-1, 2)
+        if len(old_vertices):
+            owner = np.repeat(np.arange(len(counts)), counts)
+            local = np.arange(len(old_vertices)) - old_offsets[owner]
+            buffer[new_offsets[owner] + local] = old_vertices
+        for rows, fill_vertices, fill_offsets in fills:
+            fill_counts = np.diff(fill_offsets)
+            owner = np.repeat(rows, fill_counts)
+            local = np.arange(len(fill_vertices)) - np.repeat(fill_offsets[:-1], fill_counts)
+            buffer[new_offsets[owner] + local] = fill_vertices
+
+        self.vertex_offsets = array("Q")
+        self.vertex_offsets.frombytes(new_offsets.astype(np.uint64).tobytes())
+        self.vertex_coords = array("d")
+        self.vertex_coords.frombytes(buffer.tobytes())
+        self._arrays = None
+        return sum(len(rows) for rows, _, _ in fills)
+
+    def fill_lengths(self) -> int:
+        """
+        計算長度待定（NaN）的線段：有頂點者為多段線長度（凸度多段線含圓弧段的精確長度），
+        其餘為起點到終點的距離；回傳計算的筆數
+        """
+        coords = self._numpy()["coords"]
+        pending = np.isnan(coords[:, 4])
+        if not pending.any():
+            return 0
+
+        has_vertices = np.array(self.has_vertices, dtype=bool)
+        lines = pending & ~has_vertices
+        polylines = pending & has_vertices
+        lengths = coords[:, 4].copy()
+        if lines.any():
+            lengths[lines] = line_lengths(coords[lines, 0:2], coords[lines, 2:4])
+        if polylines.any():
+            lengths[polylines] = polyline_lengths(self.vertex_buffer,
+                                                  self.vertex_offsets_array)[polylines]
+        if self.bulge_rows:
+            rows = np.array(self.bulge_rows, dtype=np.int64)
+            wanted = pending[rows]
+            if wanted.any():
+                points, bulges, offsets = self._bulge_arrays(wanted)
+                lengths[rows[wanted]] = polyline_lengths(points, offsets, bulges)
+
+        coords = coords.copy()
+        coords[:, 4] = lengths
+        self.coords = array("d")
+        self.coords.frombytes(coords.tobytes())
+        self._arrays = None
+        return int(pending.sum())
+
+    # ---------- NumPy 欄位 ----------
+
+    def _numpy(self) -> Dict[str, np.ndarray]:
+        """陣列欄位的 NumPy 複本（寫入後重新建立）"""
+        if self._arrays is None:
+            coords = np.array(self.coords, dtype=np.float64).reshape(-1, 5)
+            self._arrays = {
+                "coords": coords,
+                "layer_codes": np.array(self.layer_col, dtype=np.uint32),
+                "type_codes": np.array(self.type_col, dtype=np.uint8),
+                "start": coords[:, 0:2],
+                "end": coords[:, 2:4],
+                "length": coords[:, 4],
+                "vertex_offsets": np.array(self.vertex_offsets, dtype=np.int64),
+                "vertex_buffer": np.array(self.vertex_coords, dtype=np.float64).reshape(-1, 2),
+            }
+        return self._arrays
+
+    @property
+    def start(self) -> np.ndarray:
+        """起點 (N, 2)"""
+        return self._numpy()["start"]
+
+    @property
+    def end(self) -> np.ndarray:
+        """終點 (N, 2)"""
+        return self._numpy()["end"]
+
+    @property
+    def length(self) -> np.ndarray:
+        """長度 (N,)"""
+        return self._numpy()["length"]
+
+    @property
+    def layer_codes(self) -> np.ndarray:
+        """圖層代碼 (N,)，對應 layers.names"""
+        return self._numpy()["layer_codes"]
+
+    @property
+    def type_codes(self) -> np.ndarray:
+        """實體類型代碼 (N,)，對應 types.names"""
+        return self._numpy()["type_codes"]
+
+    @property
+    def vertex_offsets_array(self) -> np.ndarray:
+        """頂點偏移量 (N+1,)；無頂點的線段前後偏移量相同"""
+        return self._numpy()["vertex_offsets"]
+
+    @property
+    def vertex_buffer(self) -> np.ndarray:
+        """所有線段的頂點 (M, 2)"""
+        return self._numpy()["vertex_buffer"]
+
+    @property
+    def nbytes(self) -> int:
+        """陣列欄位佔用的位元組數"""
+        return sum(col.itemsize * len(col) for col in (
+            self.layer_col, self.type_col, self.coords, self.has_vertices,
+            self.vertex_offsets, self.vertex_coords, self.curve_rows, self.curve_params,
+            self.bulge_rows, self.bulge_offsets, self.bulge_coords))
+
+    def layer_mask(self, layers: Iterable[str]) -> np.ndarray:
+        """屬於指定圖層的線段遮罩 (N,)"""
+        wanted = set(layers)
+        codes = [code for code, name in enumerate(self.layers.names) if name in wanted]
+        return np.isin(self.layer_codes, codes)
+
+    # ---------- 統計 ----------
+
+    def summarize_by_layer(self) -> Dict[str, dict]:
+        """按圖層統計線段數與總長度（與 DXFParser.summarize_by_layer 相同格式）"""
+        layer_names = self.layers.names
+        summary: Dict[str, dict] = {}
+        for i, code in enumerate(self.layer_col):
+            layer = layer_names[code]
+            if layer not in summary:
+                summary[layer] = {
+                    "layer": layer,
+                    "count": 0,
+                    "total_length": 0.0,
+                    "segments": []
+                }
+            summary[layer]["segments"].append(segment_id(i))
+
+        codes = self.layer_codes
+        counts = np.bincount(codes, minlength=len(layer_names))
+        totals = np.bincount(codes, weights=self.length, minlength=len(layer_names))
+        for code, layer in enumerate(layer_names):
+            if layer in summary:
+                summary[layer]["count"] = int(counts[code])
+                summary[layer]["total_length"] = float(totals[code])
+        return summary
+
+    # ---------- 序列化 ----------
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_arrays"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
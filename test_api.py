@@ -36,7 +36,8 @@ print("\n步驟 2: 解析 DXF 檔案...")
 parse_data = {
     "filepath": filepath,
     "project_name": "白鷺安居測試專案",
-    "selected_layers": None  # 不篩選，提取所有圖層
+    "selected_layers": None,  # 不篩選，提取所有圖層
+    "wait": True  # 等待背景解析完成後直接回傳結果
 }
 
 response = requests.post(f"{API_BASE}/parse", json=parse_data)
@@ -0,0 +1,188 @@
+"""
+線段批次匯入測試
+"""
+import math
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+import numpy as np
+import pytest
+
+import database
+from database import DatabaseManager
+from geometry_utils import ArcParams, BulgePolyline
+from segment_store import SegmentStore
+
+COLUMNS = ("segment_uid, dxf_layer, category_id, entity_type, start_x, start_y, "
+           "end_x, end_y, length, vertices")
+
+
+def _store():
+    store = SegmentStore()
+    store.append(("A-WALL", "LINE", (0.0, 0.0), (3000.0, 0.0), None, None))
+    store.append(("A-WALL-RC", "LWPOLYLINE", (0.0, 0.0), (300.0, 400.0), None,
+                  [(0.0, 0.0), (300.0, 0.0), (300.0, 400.0)]))
+    store.append(("A-WALL", "ARC", (1000.0, 0.0), (0.0, 1000.0), 500 * math.pi,
+                  ArcParams(0.0, 0.0, 1000.0, 0.0, math.pi / 2)))
+    store.append(("A-WALL-RC", "LWPOLYLINE", (0.0, 0.0), (0.0, 0.0), None,
+                  BulgePolyline([(0.0, 0.0), (1000.0, 0.0), (0.0, 0.0)], [1.0, 0.0, 0.0])))
+    store.fill_lengths()
+    return store
+
+
+def _rows(db, project_id):
+    cursor = db.conn.execute(
+        f"SELECT {COLUMNS} FROM wall_segments WHERE project_id = ? ORDER BY id", (project_id,))
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+@pytest.fixture
+def db(tmp_path):
+    manager = DatabaseManager(str(tmp_path / 'import.db'))
+    yield manager
+    manager.close()
+
+
+def test_store_import_matches_dict_import(db, monkeypatch):
+    """直接匯入 SegmentStore 與先轉 dict 再匯入的結果相同（含弧線離散化與圖層對應）"""
+    monkeypatch.setattr(database, 'IMPORT_BATCH_SIZE', 3)
+    rows = {}
+    for source in ("dicts", "store"):
+        project_id = db.create_project(source)
+        category_id = db.add_wall_category(project_id, "RC", "RC牆")
+        db.set_layer_mapping(project_id, "A-WALL-RC", category_id)
+        segments = _store().to_dicts() if source == "dicts" else _store()
+        progress = []
+        assert db.import_segments(project_id, segments,
+                                  progress_callback=lambda *p: progress.append(p)) == 4
+        assert progress == [(3, 4), (4, 4)]
+        rows[source] = [(row[0], row[1], row[2] is not None) + row[3:] for row in _rows(db, project_id)]
+
+    assert rows["store"] == rows["dicts"]
+    assert [row[2] for row in rows["store"]] == [False, True, False, True]
+    assert len(database.decode_vertices(rows["store"][2][-1])) > 2  # 弧線已離散化
+
+
+def test_duplicates_skipped_and_settings_restored(db):
+    project_id = db.create_project("dup")
+    synchronous = db.conn.execute("PRAGMA synchronous").fetchone()[0]
+    journal_mode = db.conn.execute("PRAGMA journal_mode").fetchone()[0]
+
+    assert db.import_segments(project_id, _store()) == 4
+    assert db.import_segments(project_id, _store()) == 0  # 線段 UID 重複，全部略過
+    assert len(_rows(db, project_id)) == 4
+
+    assert db.conn.execute("PRAGMA synchronous").fetchone()[0] == synchronous
+    assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == journal_mode
+
+
+def test_failed_import_rolls_back(db):
+    """匯入中途失敗時整批復原"""
+    project_id = db.create_project("broken")
+    segments = _store().to_dicts()
+    del segments[-1]["layer"]
+    with pytest.raises(KeyError):
+        db.import_segments(project_id, segments)
+    assert _rows(db, project_id) == []
+    assert not db.conn.in_transaction
+
+
+def test_reads_not_blocked_by_running_import(db, monkeypatch):
+    """匯入交易進行中時，其他執行緒仍可讀取最後一次提交的統計"""
+    project_id = db.create_project("concurrent")
+    db.add_wall_category(project_id, "RC", "RC牆")
+    assert db.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    started, release = threading.Event(), threading.Event()
+
+    def hold_transaction(done, total):
+        started.set()
+        assert release.wait(10)
+
+    importer = threading.Thread(target=db.import_segments, args=(project_id, _store()),
+                                kwargs={"progress_callback": hold_transaction})
+    monkeypatch.setattr(database, 'IMPORT_BATCH_SIZE', 2)
+    try:
+        importer.start()
+        assert started.wait(10)
+        t0 = time.perf_counter()
+        assert [p["name"] for p in db.list_projects()] == ["concurrent"]
+        assert db.get_summary(project_id)[0]["segment_count"] == 0
+        assert db.get_uncategorized_summary(project_id) == []  # 尚未提交的線段看不到
+        assert time.perf_counter() - t0 < 1.0
+    finally:
+        release.set()
+        importer.join()
+
+    assert sum(row["segment_count"] for row in db.get_uncategorized_summary(project_id)) == 4
+
+
+def test_reader_is_read_only(db):
+    with pytest.raises(sqlite3.OperationalError):
+        db.reader.execute("INSERT INTO projects (name) VALUES ('x')")
+    assert db.reader is not db.conn
+
+
+def test_vertex_blob_round_trip():
+    points = np.cumsum(np.random.default_rng(0).uniform(-500, 500, (200, 2)), axis=0) + 150000.0
+    plain = database.encode_vertices(points[:5])
+    decoded = database.decode_vertices(plain)
+    assert np.array_equal(decoded, points[:5])
+    assert not decoded.flags.owndata and not decoded.flags.writeable  # 直接引用 BLOB
+
+    packed = database.encode_vertices(points)  # 點數多，delta + zlib
+    assert len(packed) < points.nbytes
+    assert np.array_equal(database.decode_vertices(packed), points)  # 無損
+
+    single = database.decode_vertices(database.encode_vertices(points, float32=True))
+    assert single.dtype == np.float32 and np.allclose(single, points, atol=0.02)
+    assert database.encode_vertices([]) is None and database.decode_vertices(None) is None
+
+
+def test_get_segments_decodes_vertices(db):
+    project_id = db.create_project("vertices")
+    store = _store()
+    db.import_segments(project_id, store)
+    segments = {seg["segment_uid"]: seg for seg in db.get_segments(project_id)}
+    assert segments["seg_00001"]["vertices"] is None
+    assert segments["seg_00002"]["vertices"] == [[0.0, 0.0], [300.0, 0.0], [300.0, 400.0]]
+
+    arrays = db.get_segments(project_id, vertices_as_arrays=True)
+    assert all(seg["vertices"] is None or seg["vertices"].shape[1] == 2 for seg in arrays)
+
+
+def test_migrates_vertices_json(tmp_path):
+    """舊版資料庫的 vertices_json 文字欄位轉為 BLOB"""
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE projects (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL,
+            source_file TEXT, created_at TIMESTAMP, updated_at TIMESTAMP, notes TEXT);
+        CREATE TABLE wall_segments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, project_id INTEGER NOT NULL, floor_id INTEGER,
+            segment_uid TEXT NOT NULL, dxf_layer TEXT NOT NULL, category_id INTEGER,
+            entity_type TEXT NOT NULL, start_x REAL NOT NULL, start_y REAL NOT NULL,
+            end_x REAL NOT NULL, end_y REAL NOT NULL, length REAL NOT NULL, vertices_json TEXT,
+            is_modified INTEGER DEFAULT 0, notes TEXT, UNIQUE(project_id, segment_uid));
+        INSERT INTO projects (name) VALUES ('legacy');
+        INSERT INTO wall_segments (project_id, segment_uid, dxf_layer, entity_type,
+            start_x, start_y, end_x, end_y, length, vertices_json) VALUES
+            (1, 'seg_00001', 'A-WALL', 'LINE', 0, 0, 10, 0, 10, NULL),
+            (1, 'seg_00002', 'A-WALL', 'LWPOLYLINE', 0, 0, 10, 10, 20, '[[0, 0], [10, 0], [10, 10]]');
+    """)
+    conn.close()
+
+    db = DatabaseManager(path)
+    try:
+        segments = db.get_segments(1)
+        assert [seg["vertices"] for seg in segments] == [None, [[0.0, 0.0], [10.0, 0.0], [10.0, 10.0]]]
+        assert db.conn.execute(
+            "SELECT COUNT(*) FROM wall_segments WHERE vertices_json IS NOT NULL").fetchone()[0] == 0
+    finally:
+        db.close()
@@ -0,0 +1,131 @@
+"""
+查詢計畫回歸測試：DatabaseManager 的每個查詢在大量線段的資料庫上都不得全表掃描線段表
+"""
+import os
+import re
+import sys
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+import pytest
+
+from database import DatabaseManager
+from segment_store import SegmentStore
+
+# 預設 2 萬筆（缺少索引的查詢在此規模仍會全表掃描，可被偵測）；
+# 完整規模的檢查可設定環境變數，例如 WALL_PLAN_TEST_SEGMENTS=1000000
+SEGMENT_COUNT = int(os.environ.get("WALL_PLAN_TEST_SEGMENTS", 20_000))
+LAYERS = ("A-WALL", "A-WALL-RC", "A-WALL-EXT", "A-WALL-INT", "S-COL")
+
+# 大型資料表與查詢中使用的別名
+_FULL_SCAN = re.compile(r"^SCAN (wall_segments|segment_summary|ws|s)\b")
+
+
+@pytest.fixture(scope="module")
+def seeded(tmp_path_factory):
+    """大型專案（只用於查詢計畫）+ 小型專案（實際呼叫各方法，收集 SQL）"""
+    path = str(tmp_path_factory.mktemp("plans") / "plans.db")
+    db = DatabaseManager(path)
+
+    big = db.create_project("big")
+    categories = [db.add_wall_category(big, code, code) for code in ("RC", "BRICK", "EXT")]
+    buildings = [db.add_building(big, code, code) for code in ("A", "B")]
+    floors = [db.add_floor(building, f"{level}F", f"{level}F")
+              for building in buildings for level in range(1, 11)]
+    db.conn.execute("""
+        WITH RECURSIVE n(i) AS (SELECT 0 UNION ALL SELECT i + 1 FROM n WHERE i + 1 < ?)
+        INSERT INTO wall_segments (project_id, floor_id, segment_uid, dxf_layer, category_id,
+                                   entity_type, start_x, start_y, end_x, end_y, length, is_merged)
+        SELECT ?, ? + i % ?, 'seg_' || i, 'L' || (i % 5),
+               CASE WHEN i % 4 = 3 THEN NULL ELSE ? + i % 3 END,
+               'LINE', i, 0, i + 100, 0, 100, i % 10 = 0
+        FROM n
+    """, (SEGMENT_COUNT, big, floors[0], len(floors), categories[0]))
+    db.conn.commit()
+
+    small = db.create_project("small")
+    category = db.add_wall_category(small, "RC", "RC")
+    db.update_category(category, wall_thickness=1.0)
+    db.set_layer_mapping(small, "A-WALL-RC", category)
+    building = db.add_building(small, "A", "A")
+    floor = db.add_floor(building, "1F", "1F")
+    store = SegmentStore()
+    for i, layer in enumerate(LAYERS):
+        store.append((layer, "LINE", (0.0, float(i)), (100.0, float(i)), None, None))
+    store.fill_lengths()
+    db.import_segments(small, store, floor_id=floor)
+
+    yield db, dict(project=small, category=category, building=building, floor=floor)
+    db.close()
+
+
+def _capture(db, ids):
+    """呼叫所有查詢方法，回傳實際執行的 SQL（參數已代入）"""
+    statements = []
+    for conn in (db.conn, db.reader):
+        conn.set_trace_callback(statements.append)
+    try:
+        project, category = ids["project"], ids["category"]
+        db.get_project(project)
+        db.get_buildings(project)
+        db.get_floors(ids["building"])
+        db.get_all_floors_by_project(project)
+        db.get_categories(project)
+        db.get_layer_mappings(project)
+        db.get_segments(project)
+        db.get_segments(project, category)
+        db.get_summary(project)
+        db.get_summary(project, include_merged=True)
+        db.get_uncategorized_summary(project)
+        db.get_summary_by_floor(project, ids["floor"])
+        db.get_summary_by_building(project, ids["building"])
+        db.get_full_hierarchy_summary(project)
+        segment = db.get_segments(project)[0]
+        db.update_segment_category(segment["id"], category)
+        db.update_segment_category(segment["id"], segment["category_id"])
+        store = SegmentStore()
+        store.append(("A-WALL", "LINE", (0.0, 0.0), (1.0, 0.0), None, None))
+        store.fill_lengths()
+        db.import_segments(project, store, floor_id=ids["floor"])
+        # 平行牆對索引：建立、增量更新、讀取
+        db.refresh_parallel_pairs(project)
+        db.conn.execute("UPDATE wall_segments SET start_x = start_x + 1 WHERE id = ?", (segment["id"],))
+        db.conn.commit()
+        db.refresh_parallel_pairs(project)
+        db.get_parallel_pairs(project)
+    finally:
+        for conn in (db.conn, db.reader):
+            conn.set_trace_callback(None)
+    # 觸發器內的語句也會出現在追蹤中，去除重複
+    return [sql for sql in dict.fromkeys(statements)
+            if re.match(r"\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", sql, re.IGNORECASE)]
+
+
+def _full_scans(db, statements):
+    problems = []
+    for sql in statements:
+        for row in db.conn.execute(f"EXPLAIN QUERY PLAN {sql}"):
+            if _FULL_SCAN.match(row["detail"]):
+                problems.append((row["detail"], " ".join(sql.split())))
+    return problems
+
+
+def test_queries_use_indexes(seeded):
+    db, ids = seeded
+    statements = _capture(db, ids)
+    assert len(statements) > 15
+    assert _full_scans(db, statements) == []
+
+
+def test_queries_use_indexes_after_analyze(seeded):
+    """ANALYZE 取得實際統計後，查詢計畫仍使用索引"""
+    db, ids = seeded
+    db.conn.execute("ANALYZE")
+    db.conn.commit()
+    try:
+        assert _full_scans(db, _capture(db, ids)) == []
+    finally:
+        db.conn.execute("DELETE FROM sqlite_stat1")
+        db.conn.commit()
@@ -0,0 +1,210 @@
+"""
+統計彙總表（segment_summary）測試：彙總結果與直接掃描 wall_segments 相同
+"""
+import math
+import sys
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+import pytest
+
+from database import DatabaseManager
+from segment_store import SegmentStore
+
+LAYERS = ("A-WALL", "A-WALL-RC", "A-WALL-EXT")
+
+
+def _store(count, offset=0):
+    store = SegmentStore()
+    for i in range(count):
+        length = 100.0 * (i + offset + 1) + 0.1
+        store.append((LAYERS[i % len(LAYERS)], "LINE", (0.0, float(i)), (length, float(i)), None, None))
+    store.fill_lengths()
+    return store
+
+
+def _scan(db, project_id):
+    """直接以 GROUP BY 掃描線段表計算的統計（彙總表的預期值）"""
+    rows = db.conn.execute("""
+        SELECT ws.floor_id, ws.category_id, COALESCE(ws.is_merged, 0) != 0, f.building_id,
+               COUNT(*), SUM(ws.length)
+        FROM wall_segments ws LEFT JOIN floors f ON ws.floor_id = f.id
+        WHERE ws.project_id = ?
+        GROUP BY 1, 2, 3, 4
+    """, (project_id,)).fetchall()
+    return [tuple(row) for row in rows]
+
+
+ANY = object()
+
+
+def _expected(scan, floor=ANY, building=ANY, category=ANY, merged=ANY):
+    count, length = 0, 0.0
+    for floor_id, category_id, is_merged, building_id, n, total in scan:
+        if all(want is ANY or want == value for want, value in
+               ((floor, floor_id), (building, building_id), (category, category_id), (merged, is_merged))):
+            count += n
+            length += total
+    return count, length
+
+
+def _check(db, project_id, floors, buildings):
+    scan = _scan(db, project_id)
+    for include_merged in (False, True):
+        for row in db.get_summary(project_id, include_merged=include_merged):
+            count, length = _expected(scan, category=row["category_id"],
+                                      merged=ANY if include_merged else 0)
+            assert row["segment_count"] == count
+            assert math.isclose(row["total_length"], length, abs_tol=1e-6)
+
+    for floor_id in floors:
+        for row in db.get_summary_by_floor(project_id, floor_id):
+            count, length = _expected(scan, floor=floor_id, category=row["category_id"])
+            assert (row["segment_count"], pytest.approx(row["total_length"])) == (count, length)
+
+    for building_id in buildings:
+        rows = db.get_summary_by_building(project_id, building_id)
+        expected = {row[1] for row in scan if row[3] == building_id and row[1] is not None}
+        assert {row["category_id"] for row in rows} == expected
+        for row in rows:
+            count, length = _expected(scan, building=building_id, category=row["category_id"])
+            assert (row["segment_count"], pytest.approx(row["total_length"])) == (count, length)
+
+    for row in db.get_full_hierarchy_summary(project_id):
+        if row["floor_id"] is None:
+            continue
+        count, length = _expected(scan, floor=row["floor_id"], category=row["category_id"])
+        assert row["segment_count"] == count
+        assert math.isclose(row["total_length"], length, abs_tol=1e-6)
+
+
+@pytest.fixture
+def db(tmp_path):
+    manager = DatabaseManager(str(tmp_path / 'summary.db'))
+    yield manager
+    manager.close()
+
+
+def test_summary_tracks_all_write_paths(db):
+    project_id = db.create_project("summary")
+    categories = [db.add_wall_category(project_id, code, code) for code in ("RC", "BRICK", "EXT")]
+    db.set_layer_mapping(project_id, "A-WALL-RC", categories[0])
+    db.set_layer_mapping(project_id, "A-WALL", categories[1])
+    buildings = [db.add_building(project_id, code, code) for code in ("A", "B")]
+    floors = [db.add_floor(buildings[0], "1F", "1F"), db.add_floor(buildings[0], "2F", "2F"),
+              db.add_floor(buildings[1], "1F", "1F")]
+
+    # 匯入：各樓層各匯入一批（segment_uid 需不同）
+    for i, floor_id in enumerate(floors):
+        store = _store(30, offset=i * 30)
+        db.conn.execute("UPDATE wall_segments SET segment_uid = 'old_' || segment_uid")
+        db.conn.commit()
+        db.import_segments(project_id, store, floor_id=floor_id)
+    db.import_segments(project_id, _store(5, offset=200))  # 未指定樓層
+    _check(db, project_id, floors, buildings)
+
+    # 重新分類
+    segment_ids = [row[0] for row in db.conn.execute("SELECT id FROM wall_segments ORDER BY id")]
+    for seg_id in segment_ids[::7]:
+        db.update_segment_category(seg_id, categories[2])
+    db.update_segment_category(segment_ids[1], None)
+    _check(db, project_id, floors, buildings)
+
+    # 合併（直接更新 is_merged，與合併流程相同的寫入方式）
+    db.conn.execute("UPDATE wall_segments SET is_merged = 1 WHERE id % 5 = 0")
+    db.conn.commit()
+    _check(db, project_id, floors, buildings)
+
+    # 刪除與改樓層
+    db.conn.execute("DELETE FROM wall_segments WHERE id % 11 = 0")
+    db.conn.execute("UPDATE wall_segments SET floor_id = ? WHERE id % 13 = 0", (floors[2],))
+    db.conn.commit()
+    _check(db, project_id, floors, buildings)
+
+
+def test_failed_import_leaves_summary_unchanged(db):
+    project_id = db.create_project("rollback")
+    db.import_segments(project_id, _store(10))
+    before = db.conn.execute("SELECT * FROM segment_summary").fetchall()
+
+    segments = _store(10, offset=10).to_dicts()
+    for i, seg in enumerate(segments):
+        seg["id"] = f"new_{i}"
+    del segments[-1]["layer"]
+    with pytest.raises(KeyError):
+        db.import_segments(project_id, segments)
+
+    assert db.conn.execute("SELECT * FROM segment_summary").fetchall() == before
+    # 匯入旗標已隨交易復原：之後的逐列寫入照常更新彙總表
+    db.conn.execute("""
+        INSERT INTO wall_segments (project_id, segment_uid, dxf_layer, entity_type,
+                                   start_x, start_y, end_x, end_y, length)
+        VALUES (?, 'manual', 'A-WALL', 'LINE', 0, 0, 1, 0, 1)
+    """, (project_id,))
+    db.conn.commit()
+    assert db.get_uncategorized_summary(project_id)
+    assert sum(row[4] for row in _scan(db, project_id)) == \
+        db.conn.execute("SELECT SUM(segment_count) FROM segment_summary").fetchone()[0] == 11
+
+
+def test_import_keeps_schema(db):
+    """匯入不變更資料庫結構（觸發器固定，其他連線不需重新準備語句）"""
+    project_id = db.create_project("schema")
+    schema_version = db.conn.execute("PRAGMA schema_version").fetchone()[0]
+    db.import_segments(project_id, _store(10))
+    assert db.conn.execute("PRAGMA schema_version").fetchone()[0] == schema_version
+    assert db.conn.execute("SELECT COUNT(*) FROM bulk_import_flag").fetchone()[0] == 0
+
+
+def test_changed_trigger_recreated(tmp_path):
+    """舊版定義的觸發器在開啟時重新建立；定義相同時不變更資料庫結構"""
+    path = str(tmp_path / 'triggers.db')
+    db = DatabaseManager(path)
+    db.conn.execute("DROP TRIGGER trg_segment_summary_insert")
+    db.conn.execute("""
+        CREATE TRIGGER trg_segment_summary_insert AFTER INSERT ON wall_segments
+        BEGIN SELECT 1; END
+    """)
+    db.conn.commit()
+    db.close()
+
+    db = DatabaseManager(path)
+    project_id = db.create_project("triggers")
+    db.import_segments(project_id, _store(5))
+    db.conn.execute("""
+        INSERT INTO wall_segments (project_id, segment_uid, dxf_layer, entity_type,
+                                   start_x, start_y, end_x, end_y, length)
+        VALUES (?, 'manual', 'A-WALL', 'LINE', 0, 0, 1, 0, 1)
+    """, (project_id,))
+    db.conn.commit()
+    assert db.conn.execute("SELECT SUM(segment_count) FROM segment_summary").fetchone()[0] == 6
+    schema_version = db.conn.execute("PRAGMA schema_version").fetchone()[0]
+    db.close()
+
+    db = DatabaseManager(path)
+    assert db.conn.execute("PRAGMA schema_version").fetchone()[0] == schema_version
+    db.close()
+
+
+def test_rebuild_and_backfill(tmp_path):
+    path = str(tmp_path / 'backfill.db')
+    db = DatabaseManager(path)
+    project_id = db.create_project("backfill")
+    db.import_segments(project_id, _store(20))
+    expected = db.get_summary(project_id, include_merged=True)
+    uncategorized = db.conn.execute("SELECT segment_count, total_length FROM segment_summary").fetchall()
+
+    # 舊版資料庫沒有彙總表：開啟時自動建立
+    db.conn.execute("DROP TABLE segment_summary")
+    db.conn.commit()
+    db.close()
+    db = DatabaseManager(path)
+    try:
+        assert db.conn.execute(
+            "SELECT segment_count, total_length FROM segment_summary").fetchall() == uncategorized
+        db.rebuild_summaries()
+        assert db.get_summary(project_id, include_merged=True) == expected
+    finally:
+        db.close()
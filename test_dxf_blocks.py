@@ -0,0 +1,155 @@
+"""
+圖塊展開測試
+巢狀 INSERT、循環引用與仿射轉換
+"""
+import math
+import sys
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+import ezdxf
+
+from dxf_parser import DXFParser
+
+
+def _parse(path, prefix=None):
+    parser = DXFParser(path)
+    assert parser.load()
+    return parser.extract_wall_entities(wall_layer_prefix=prefix)
+
+
+def _streamed(path, prefix=None):
+    return [seg.to_dict() for seg in DXFParser(path).iter_wall_entities_streaming(prefix)]
+
+
+def test_nested_insert(tmp_path):
+    """巢狀圖塊中的牆線段應展開，圖層 "0" 依序繼承外層 INSERT 的圖層"""
+    doc = ezdxf.new('R2000')
+    wall = doc.blocks.new('WALL')
+    wall.add_line((0, 0), (1000, 0))                              # 圖層 0 → 繼承
+    wall.add_line((0, 0), (0, 500), dxfattribs={'layer': 'A-WALL-RC'})
+    unit = doc.blocks.new('UNIT')
+    unit.add_blockref('WALL', (0, 0))                             # 圖層 0 → 繼承外層
+    unit.add_blockref('WALL', (0, 2000), dxfattribs={'rotation': 90})
+    msp = doc.modelspace()
+    msp.add_blockref('UNIT', (10000, 0), dxfattribs={'layer': 'A-WALL-EXT', 'xscale': 2, 'yscale': 2})
+    path = str(tmp_path / 'nested.dxf')
+    doc.saveas(path)
+
+    segments = _parse(path)
+    assert [(seg.layer, seg.entity_type) for seg in segments] == [
+        ('A-WALL-EXT', 'LINE'), ('A-WALL-RC', 'LINE'),
+        ('A-WALL-EXT', 'LINE'), ('A-WALL-RC', 'LINE'),
+    ]
+    # 外層縮放 2 倍
+    assert math.isclose(segments[0].length, 2000)
+    assert math.isclose(segments[1].length, 1000)
+    # 第二個 WALL 旋轉 90 度、位於 (0, 2000) → 世界座標 (10000, 4000) 起往 +y
+    assert segments[2].start_point == (10000.0, 4000.0)
+    assert math.isclose(segments[2].end_point[0], 10000.0, abs_tol=1e-9)
+    assert math.isclose(segments[2].end_point[1], 6000.0)
+
+    assert _streamed(path) == [seg.to_dict() for seg in segments]
+
+
+def test_cyclic_blocks(tmp_path):
+    """循環引用的圖塊不應無限遞迴，其餘幾何照常展開"""
+    doc = ezdxf.new('R2000')
+    a = doc.blocks.new('A')
+    b = doc.blocks.new('B')
+    a.add_line((0, 0), (100, 0))
+    a.add_blockref('B', (0, 0))
+    b.add_line((0, 0), (0, 100))
+    b.add_blockref('A', (0, 0))
+    doc.modelspace().add_blockref('A', (0, 0), dxfattribs={'layer': 'A-WALL'})
+    path = str(tmp_path / 'cycle.dxf')
+    doc.saveas(path)
+
+    segments = _parse(path)
+    assert [seg.end_point for seg in segments] == [(100.0, 0.0), (0.0, 100.0)]
+
+
+def test_mirrored_arc(tmp_path):
+    """鏡射的圖塊：弧線頂點應隨之鏡射，長度不變"""
+    doc = ezdxf.new('R2000')
+    door = doc.blocks.new('DOOR')
+    door.add_arc((0, 0), 900, 0, 90)
+    msp = doc.modelspace()
+    msp.add_blockref('DOOR', (0, 0), dxfattribs={'layer': 'A-WALL'})
+    msp.add_blockref('DOOR', (0, 0), dxfattribs={'layer': 'A-WALL', 'xscale': -1})
+    path = str(tmp_path / 'mirror.dxf')
+    doc.saveas(path)
+
+    arc, mirrored = _parse(path)
+    assert math.isclose(mirrored.length, arc.length)
+    for (x, y), (mx, my) in zip(arc.vertices, mirrored.vertices):
+        assert math.isclose(mx, -x, abs_tol=1e-9) and math.isclose(my, y, abs_tol=1e-9)
+
+
+def test_minsert_grid(tmp_path):
+    """MINSERT 陣列的每個格點都應展開，位置與 ezdxf multi_insert 相同"""
+    doc = ezdxf.new('R2000')
+    column = doc.blocks.new('COL')
+    column.add_lwpolyline([(0, 0), (600, 0), (600, 600), (0, 600), (0, 0)])
+    msp = doc.modelspace()
+    minsert = msp.add_blockref('COL', (1000, 2000), dxfattribs={'layer': 'A-WALL', 'rotation': 30})
+    minsert.grid(size=(3, 4), spacing=(8000, 6000))  # 3 列 x 4 行
+    msp.add_blockref('COL', (0, 0), dxfattribs={'layer': 'A-WALL'})
+    path = str(tmp_path / 'minsert.dxf')
+    doc.saveas(path)
+
+    segments = _parse(path)
+    assert len(segments) == 3 * 4 + 1
+
+    expected = [virtual.dxf.insert for virtual in minsert.multi_insert()]
+    for segment, insert in zip(segments, expected):
+        assert math.isclose(segment.start_point[0], insert.x, abs_tol=1e-6)
+        assert math.isclose(segment.start_point[1], insert.y, abs_tol=1e-6)
+        assert math.isclose(segment.length, 2400)
+    assert segments[-1].start_point == (0.0, 0.0)
+
+    assert _streamed(path) == [seg.to_dict() for seg in segments]
+
+
+def test_nested_minsert(tmp_path):
+    """圖塊中的 MINSERT 也要展開"""
+    doc = ezdxf.new('R2000')
+    stud = doc.blocks.new('STUD')
+    stud.add_line((0, 0), (0, 100))
+    frame = doc.blocks.new('FRAME')
+    frame.add_blockref('STUD', (0, 0)).grid(size=(1, 5), spacing=(0, 400))
+    doc.modelspace().add_blockref('FRAME', (0, 0), dxfattribs={'layer': 'A-WALL'})
+    path = str(tmp_path / 'nested_minsert.dxf')
+    doc.saveas(path)
+
+    segments = _parse(path)
+    assert [seg.start_point for seg in segments] == [(x * 400.0, 0.0) for x in range(5)]
+
+
+def test_layer_selection_filters_inserts_on_own_layer(tmp_path):
+    """INSERT 依本身的圖層篩選：其他圖層的 INSERT 即使圖塊內有 A-WALL-RC 項目也不展開；圖層 0 的項目跟隨 INSERT"""
+    doc = ezdxf.new('R2000')
+    column = doc.blocks.new('COLUMN')
+    column.add_line((0, 0), (600, 0))
+    column.add_line((0, 0), (0, 600), dxfattribs={'layer': 'A-WALL-RC'})
+    msp = doc.modelspace()
+    msp.add_blockref('COLUMN', (0, 0), dxfattribs={'layer': 'S-COL'})
+    msp.add_blockref('COLUMN', (5000, 0), dxfattribs={'layer': 'A-WALL-RC'})
+    msp.add_line((0, 0), (100, 0), dxfattribs={'layer': 'S-COL'})
+    path = str(tmp_path / 'columns.dxf')
+    doc.saveas(path)
+
+    parser = DXFParser(path)
+    assert parser.load()
+    segments = parser.extract_wall_entities(None, layers={'A-WALL-RC'})
+    assert [(seg.layer, seg.start_point, seg.end_point) for seg in segments] == [
+        ('A-WALL-RC', (5000.0, 0.0), (5600.0, 0.0)),
+        ('A-WALL-RC', (5000.0, 0.0), (5000.0, 600.0)),
+    ]
+    streamed = [seg.to_dict() for seg in DXFParser(path).iter_wall_entities_streaming(None, {'A-WALL-RC'})]
+    assert streamed == [seg.to_dict() for seg in segments]
+
+    # 以前綴篩選時相同（A-WALL 圖塊放在非牆圖層不計入）
+    assert [seg.start_point for seg in _parse(path, prefix='A-WALL')] == [(5000.0, 0.0), (5000.0, 0.0)]
@@ -0,0 +1,116 @@
+"""
+平行提取測試
+比對平行提取與完整載入模式的解析結果
+"""
+import sys
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+import ezdxf
+
+import dxf_parallel
+from dxf_parser import DXFParser
+from dxf_stream import DXFStream
+
+SAMPLE_DXF = str(project_dir / 'test_sample.dxf')
+
+
+def _write_mixed(path):
+    """含舊版 POLYLINE（VERTEX/SEQEND）、圖塊與圖層 "0" 的測試檔"""
+    doc = ezdxf.new('R2000')
+    door = doc.blocks.new('DOOR')
+    door.add_line((0, 0), (900, 0))
+    door.add_arc((0, 0), 900, 0, 90)
+    msp = doc.modelspace()
+    for i in range(200):
+        layer = 'A-WALL' if i % 3 else '0'
+        msp.add_line((i, 0), (i, 100), dxfattribs={'layer': layer})
+        msp.add_polyline2d([(i, 0), (i + 5, 0), (i + 5, 5)], dxfattribs={'layer': layer})
+        msp.add_blockref('DOOR', (i * 10, 0), dxfattribs={'layer': 'A-WALL', 'rotation': 90})
+    doc.saveas(path)
+
+
+def _full_parse(path, prefix):
+    parser = DXFParser(path)
+    assert parser.load()
+    return [seg.to_dict() for seg in parser.extract_wall_entities(wall_layer_prefix=prefix)]
+
+
+def test_partition_bounds(tmp_path):
+    """每個範圍都從頂層實體開頭起算，且範圍首尾相接"""
+    path = str(tmp_path / 'mixed.dxf')
+    _write_mixed(path)
+
+    with DXFStream(path) as stream:
+        ranges = stream.partition_entities(16)
+
+    assert len(ranges) > 1
+    with open(path, 'rb') as fp:
+        data = fp.read()
+    for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+        assert end == next_start
+    for start, _ in ranges[1:]:
+        code, name = data[start:start + 40].split(b'\n')[:2]
+        assert code.strip() == b'0'
+        assert name.strip() not in (b'VERTEX', b'SEQEND')
+
+
+def test_parallel_matches_full_parse(tmp_path, monkeypatch):
+    """平行提取的線段（含 ID 順序）應與完整載入完全相同"""
+    path = str(tmp_path / 'mixed.dxf')
+    _write_mixed(path)
+    monkeypatch.setattr(dxf_parallel, 'CHUNKS_PER_WORKER', 7)
+
+    for source in (SAMPLE_DXF, path):
+        for prefix in ('A-WALL', None):
+            expected = _full_parse(source, prefix)
+            for workers in (1, 2):
+                parser = DXFParser(source)
+                segments = parser.extract_wall_entities_parallel(prefix, workers=workers)
+                assert [seg.to_dict() for seg in segments] == expected
+
+
+
+def _is_wall_layer(layer):
+    return layer.startswith('A-WALL')
+
+
+def test_layer_selection_matches_filtered_full_parse(tmp_path):
+    """圖層集合、萬用字元與判斷函式：三種提取方式的結果等於完整解析後再篩選（ID 重新編號）"""
+    path = str(tmp_path / 'mixed.dxf')
+    _write_mixed(path)
+
+    def without_ids(dicts):
+        return [{k: v for k, v in d.items() if k != 'id'} for d in dicts]
+
+    everything = _full_parse(path, None)
+    for layers, wanted in ((['0'], {'0'}), ({'A-WALL*'}, {'A-WALL'}), (_is_wall_layer, {'A-WALL'})):
+        expected = without_ids(d for d in everything if d['layer'] in wanted)
+        assert expected
+
+        parser = DXFParser(path)
+        assert parser.load()
+        full = [seg.to_dict() for seg in parser.extract_wall_entities(None, layers=layers)]
+        assert without_ids(full) == expected
+        assert full[0]['id'] == 'seg_00001'
+
+        streamed = [seg.to_dict() for seg in DXFParser(path).iter_wall_entities_streaming(None, layers)]
+        assert streamed == full
+        for workers in (1, 2):
+            segments = DXFParser(path).extract_wall_entities_parallel(None, workers=workers,
+                                                                      layers=layers)
+            assert [seg.to_dict() for seg in segments] == full
+
+
+def test_unreadable_binary_returns_empty_store(tmp_path):
+    """二進位 DXF 載入失敗時仍回傳 SegmentStore（與其他路徑相同）"""
+    from dxf_stream import BINARY_DXF_SENTINEL
+    from segment_store import SegmentStore
+
+    path = tmp_path / 'broken.dxf'
+    path.write_bytes(BINARY_DXF_SENTINEL + b'\x00garbage')
+    segments = DXFParser(str(path)).extract_wall_entities_parallel(wall_layer_prefix=None)
+    assert isinstance(segments, SegmentStore) and len(segments) == 0
+    assert segments.fill_lengths() == 0
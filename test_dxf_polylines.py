@@ -0,0 +1,95 @@
+"""
+多段線凸度（圓弧段）與封閉邊測試
+"""
+import math
+import sys
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+import ezdxf
+
+from dxf_parser import DXFParser
+from parse_cache import decode_segments, encode_segments
+
+# 1000 x 1000 的房間：底邊為向下凸出的半圓，封閉
+ROOM = [(0, 0, 1.0), (1000, 0, 0), (1000, 1000, 0), (0, 1000, 0)]
+ROOM_LENGTH = 500 * math.pi + 3000
+
+
+def _write_polylines(path):
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    msp.add_lwpolyline(ROOM, format='xyb', close=True, dxfattribs={'layer': 'A-WALL'})
+    # 開放、順時針四分之一圓弧接直線
+    msp.add_lwpolyline([(0, 0, -math.tan(math.pi / 8)), (1000, 1000, 0), (2000, 1000, 0)],
+                       format='xyb', dxfattribs={'layer': 'A-WALL'})
+    # 封閉、無凸度的舊版多段線
+    msp.add_polyline2d([(0, 0), (300, 0), (300, 400)], close=True, dxfattribs={'layer': 'A-WALL'})
+
+    block = doc.blocks.new('ROOM')
+    block.add_lwpolyline(ROOM, format='xyb', close=True)
+    msp.add_blockref('ROOM', (5000, 0), dxfattribs={'layer': 'A-WALL', 'xscale': 2, 'yscale': 2})
+    doc.saveas(path)
+
+
+def _full_parse(path, parametric=False):
+    parser = DXFParser(path)
+    assert parser.load()
+    parser.parametric_arcs = parametric
+    return parser, parser.extract_wall_entities()
+
+
+def test_bulge_lengths_and_closing_edge(tmp_path):
+    """圓弧段長度為精確弧長；封閉多段線包含閉合邊"""
+    path = str(tmp_path / 'polylines.dxf')
+    _write_polylines(path)
+    parser, segments = _full_parse(path)
+
+    room, quarter, triangle, block_room = segments
+    assert math.isclose(room.length, ROOM_LENGTH, rel_tol=1e-12)
+    assert room.end_point == room.start_point == (0.0, 0.0)
+    assert math.isclose(quarter.length, 1000 * math.pi / 2 + 1000, rel_tol=1e-12)
+    assert triangle.entity_type == "POLYLINE"
+    assert math.isclose(triangle.length, 1200.0)
+    assert math.isclose(block_room.length, 2 * ROOM_LENGTH, rel_tol=1e-12)
+
+    # 顯示頂點：原有頂點保留，圓弧段的頂點在圓上且位於弦的下方（逆時針）
+    assert room.vertices[0] == (0.0, 0.0) and (1000.0, 0.0) in room.vertices
+    arc = room.vertices[:room.vertices.index((1000.0, 0.0))]
+    assert len(arc) > 2
+    for x, y in arc:
+        assert math.isclose(math.hypot(x - 500, y), 500, rel_tol=1e-9)
+        assert y <= 1e-9
+    for x, y in quarter.vertices[:-1]:
+        assert math.isclose(math.hypot(x - 1000, y), 1000, rel_tol=1e-9)
+        assert y >= x - 1e-9  # 順時針：圓弧在弦的左上方
+
+
+def test_streaming_matches_full_parse(tmp_path):
+    path = str(tmp_path / 'polylines.dxf')
+    _write_polylines(path)
+    _, segments = _full_parse(path)
+
+    streamed = list(DXFParser(path).iter_wall_entities_streaming())
+    assert [seg.to_dict() for seg in streamed] == segments.to_dicts()
+
+
+def test_parametric_bulges_roundtrip(tmp_path):
+    """parametric 模式保留原始頂點與凸度，快取讀回後離散化結果相同"""
+    path = str(tmp_path / 'polylines.dxf')
+    _write_polylines(path)
+    _, expected = _full_parse(path)
+    _, segments = _full_parse(path, parametric=True)
+
+    dicts = segments.to_dicts(parametric=True)
+    assert dicts[0]["vertices"] is None
+    assert dicts[0]["bulges"]["bulges"] == [1.0, 0.0, 0.0, 0.0, 0.0]
+    assert dicts[0]["bulges"]["points"][-1] == (0.0, 0.0)
+    assert "bulges" not in dicts[2]
+
+    _, restored = decode_segments(encode_segments(segments, {}))
+    assert restored.bulge_polyline(1) == segments.bulge_polyline(1)
+    assert restored.tessellate() == 2
+    assert restored.to_dicts() == expected.to_dicts()
@@ -0,0 +1,121 @@
+"""
+圖層預覽（單次掃描統計）測試
+"""
+import math
+import sys
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+import ezdxf
+
+from dxf_parser import DXFParser
+
+
+def _build_document():
+    doc = ezdxf.new()
+    doc.layers.add('A-WALL', color=2)
+    doc.layers.add('A-WALL-RC', color=3)
+    doc.layers.add('EMPTY', color=5)
+    msp = doc.modelspace()
+
+    msp.add_line((0, 0), (3000, 0), dxfattribs={'layer': 'A-WALL'})
+    msp.add_line((0, 0), (0, 4000), dxfattribs={'layer': 'A-WALL'})
+    msp.add_lwpolyline([(0, 0, 1.0), (1000, 0, 0), (1000, 1000, 0), (0, 1000, 0)],
+                       format='xyb', close=True, dxfattribs={'layer': 'A-WALL'})
+    msp.add_polyline2d([(0, 0), (300, 0), (300, 400)], close=True,
+                       dxfattribs={'layer': 'A-WALL-RC'})
+    msp.add_arc((500, 500), 200, 30, 300, dxfattribs={'layer': 'A-WALL-RC'})
+    msp.add_circle((-800, -800), 150, dxfattribs={'layer': 'A-ARC'})
+    msp.add_text('ROOM', dxfattribs={'layer': 'A-TEXT'})
+    # 圖紙空間的實體不計入
+    doc.layout('Layout1').add_line((0, 0), (99, 0), dxfattribs={'layer': 'A-WALL'})
+
+    block = doc.blocks.new('COLUMN')
+    block.add_lwpolyline([(0, 0), (600, 0), (600, 600), (0, 600)], close=True)  # 圖層 0：跟隨 INSERT
+    block.add_line((0, 0), (600, 600), dxfattribs={'layer': 'A-WALL-RC'})
+    msp.add_blockref('COLUMN', (5000, 5000), dxfattribs={'layer': 'A-COLS', 'rotation': 30})
+    msp.add_blockref('COLUMN', (8000, 0), dxfattribs={'layer': 'A-WALL', 'xscale': 2}).grid(
+        size=(2, 3), spacing=(1000, 1500))
+    return doc
+
+
+def _preview(path):
+    return DXFParser(str(path)).preview_layers()
+
+
+def test_preview_matches_full_parse(tmp_path):
+    """線段數、總長度與範圍與完整解析的結果相同"""
+    path = tmp_path / 'preview.dxf'
+    _build_document().saveas(path)
+
+    layers = _preview(path)
+    parser = DXFParser(str(path))
+    assert parser.load()
+    segments = parser.extract_wall_entities(wall_layer_prefix=None)
+    summary = segments.summarize_by_layer()
+
+    for name, info in summary.items():
+        assert layers[name]["segment_count"] == info["count"]
+        assert math.isclose(layers[name]["total_length"], info["total_length"], rel_tol=1e-9)
+
+    for name in summary:
+        points = [p for seg in segments if seg.layer == name
+                  for p in seg.vertices or (seg.start_point, seg.end_point)]
+        xs, ys = zip(*points)
+        min_x, min_y, max_x, max_y = layers[name]["bbox"]
+        # 弧線的預覽範圍以圓弧計算，展平頂點都在範圍內
+        assert min_x <= min(xs) + 1e-6 and max_x >= max(xs) - 1e-6
+        assert min_y <= min(ys) + 1e-6 and max_y >= max(ys) - 1e-6
+
+    assert layers["A-WALL"]["entity_count"] == 4
+    assert layers["A-COLS"]["entity_count"] == 1
+    assert layers["A-COLS"]["segment_count"] == 1  # 圖層 0 的多段線跟隨 INSERT 圖層
+    assert layers["A-TEXT"] == {**layers["A-TEXT"], "entity_count": 1, "segment_count": 0, "bbox": None}
+
+
+def test_layer_table_and_empty_layers(tmp_path):
+    path = tmp_path / 'preview.dxf'
+    _build_document().saveas(path)
+
+    layers = _preview(path)
+    assert layers["A-WALL"]["color"] == 2
+    assert layers["EMPTY"]["entity_count"] == 0 and layers["EMPTY"]["bbox"] is None
+    # 圖層表中沒有定義的圖層也會列出
+    assert layers["A-COLS"]["color"] == 7
+
+
+def test_binary_dxf_matches_ascii(tmp_path):
+    """二進位 DXF 以 ezdxf 讀取，結果與 ASCII 掃描相同"""
+    doc = _build_document()
+    doc.saveas(tmp_path / 'preview.dxf')
+    doc.saveas(tmp_path / 'preview_bin.dxf', fmt='bin')
+
+    ascii_layers = _preview(tmp_path / 'preview.dxf')
+    binary_layers = _preview(tmp_path / 'preview_bin.dxf')
+    assert ascii_layers.keys() == binary_layers.keys()
+    for name, info in ascii_layers.items():
+        other = binary_layers[name]
+        assert info["entity_count"] == other["entity_count"]
+        assert info["segment_count"] == other["segment_count"]
+        assert math.isclose(info["total_length"], other["total_length"], rel_tol=1e-9)
+        if info["bbox"] is None:
+            assert other["bbox"] is None
+        else:
+            assert all(math.isclose(a, b, abs_tol=1e-6) for a, b in zip(info["bbox"], other["bbox"]))
+
+
+def test_crlf_matches_lf(tmp_path):
+    """CRLF 行尾（AutoCAD 預設）與 LF 的結果相同，圖層與圖塊名稱不含 \\r"""
+    path = tmp_path / 'preview.dxf'
+    _build_document().saveas(path)
+    data = path.read_bytes().replace(b"\r\n", b"\n")
+    path.write_bytes(data)
+    crlf_path = tmp_path / 'preview_crlf.dxf'
+    crlf_path.write_bytes(data.replace(b"\n", b"\r\n"))
+
+    layers = _preview(crlf_path)
+    assert layers == _preview(path)
+    assert not any("\r" in name for name in layers)
+    assert layers["A-COLS"]["segment_count"] == 1
@@ -0,0 +1,113 @@
+"""
+SPLINE 展平與弧長測試
+"""
+import math
+import sys
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+import ezdxf
+
+from dxf_parser import DXFParser
+
+# 有理二次 NURBS 表示的四分之一圓（半徑 1000）
+QUARTER_CIRCLE = dict(
+    control_points=[(1000, 0), (1000, 1000), (0, 1000)],
+    knots=[0, 0, 0, 1, 1, 1],
+    weights=[1, math.sqrt(0.5), 1],
+)
+
+
+def _write_splines(path):
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    msp.add_rational_spline(QUARTER_CIRCLE["control_points"], QUARTER_CIRCLE["weights"],
+                            degree=2, knots=QUARTER_CIRCLE["knots"],
+                            dxfattribs={'layer': 'A-WALL'})
+    msp.add_spline(fit_points=[(0, 0), (2000, 1500), (4000, -500), (6000, 1000)],
+                   dxfattribs={'layer': 'A-WALL'})
+    msp.add_open_spline([(0, 0), (1000, 3000), (3000, 3000), (4000, 0), (6000, -2000)],
+                        degree=3, dxfattribs={'layer': 'A-WALL'})
+    doc.saveas(path)
+    return doc
+
+
+def _full_parse(path):
+    parser = DXFParser(path)
+    assert parser.load()
+    return parser, parser.extract_wall_entities()
+
+
+def test_rational_spline_is_exact_arc(tmp_path):
+    """有理 NURBS 圓弧：長度為 πr/2，展平頂點都在圓上且弦高不超過容許值"""
+    path = str(tmp_path / 'splines.dxf')
+    _write_splines(path)
+    parser, segments = _full_parse(path)
+
+    arc = segments[0]
+    assert arc.entity_type == "SPLINE"
+    assert math.isclose(arc.length, 500 * math.pi, rel_tol=1e-9)
+    assert arc.start_point == (1000.0, 0.0) and arc.end_point == (0.0, 1000.0)
+    for x, y in arc.vertices:
+        assert math.isclose(math.hypot(x, y), 1000.0, rel_tol=1e-9)
+    for a, b in zip(arc.vertices, arc.vertices[1:]):
+        chord = math.dist(a, b)
+        assert 1000 - math.sqrt(1000 ** 2 - (chord / 2) ** 2) <= parser.arc_tolerance
+
+
+def test_lengths_match_ezdxf(tmp_path):
+    """擬合點與控制點 SPLINE 的長度與 ezdxf 細密展平的長度相同"""
+    path = str(tmp_path / 'splines.dxf')
+    doc = _write_splines(path)
+    _, segments = _full_parse(path)
+
+    assert len(segments) == 3
+    for entity, segment in zip(doc.modelspace(), segments):
+        points = [(p.x, p.y) for p in entity.construction_tool().flattening(0.001)]
+        expected = sum(math.dist(a, b) for a, b in zip(points, points[1:]))
+        assert math.isclose(segment.length, expected, rel_tol=1e-6)
+        assert math.dist(segment.start_point, points[0]) < 1e-6
+        assert math.dist(segment.end_point, points[-1]) < 1e-6
+        # 展平頂點的折線長度不超過曲線長度
+        chords = sum(math.dist(a, b) for a, b in zip(segment.vertices, segment.vertices[1:]))
+        assert chords <= segment.length + 1e-6
+
+
+def test_streaming_matches_full_parse(tmp_path):
+    path = str(tmp_path / 'splines.dxf')
+    _write_splines(path)
+    _, segments = _full_parse(path)
+
+    streamed = list(DXFParser(path).iter_wall_entities_streaming())
+    assert [seg.to_dict() for seg in streamed] == segments.to_dicts()
+
+
+def test_identical_splines_evaluated_once(tmp_path):
+    """相同定義的 SPLINE 只計算一次，圖層不同也共用結果"""
+    doc = ezdxf.new()
+    msp = doc.modelspace()
+    for layer in ("A-WALL", "A-WALL-RC", "A-WALL"):
+        msp.add_spline(fit_points=[(0, 0), (1000, 800), (2500, 0)], dxfattribs={'layer': layer})
+    path = str(tmp_path / 'repeat.dxf')
+    doc.saveas(path)
+
+    parser, segments = _full_parse(path)
+    assert len(parser._spline_cache) == 1
+    assert [seg.layer for seg in segments] == ["A-WALL", "A-WALL-RC", "A-WALL"]
+    assert segments[0].vertices == segments[2].vertices
+
+
+def test_degenerate_spline_skips_only_itself(tmp_path):
+    """無法計算的 SPLINE（控制點含 NaN）只略過該曲線，同批的其他曲線照常計算"""
+    doc = _write_splines(str(tmp_path / 'splines.dxf'))
+    doc.modelspace().add_open_spline([(0, 0), (1000, math.nan), (3000, 3000), (4000, 0)],
+                                     degree=3, dxfattribs={'layer': 'A-WALL'})
+    path = str(tmp_path / 'degenerate.dxf')
+    doc.saveas(path)
+
+    _, expected = _full_parse(str(tmp_path / 'splines.dxf'))
+    parser, segments = _full_parse(path)
+    assert [seg.length for seg in segments] == [seg.length for seg in expected]
+    assert sum(result is None for result in parser._spline_cache.values()) == 1
@@ -0,0 +1,111 @@
+"""
+串流模式 DXF 解析測試
+比對串流模式與完整載入模式的解析結果
+"""
+import sys
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+import ezdxf
+
+from dxf_parser import DXFParser
+from dxf_stream import DXFStream, iter_tags, probe_dxf
+
+SAMPLE_DXF = str(project_dir / 'test_sample.dxf')
+
+
+def _full_parse(prefix):
+    parser = DXFParser(SAMPLE_DXF)
+    assert parser.load()
+    parser.extract_layers()
+    segments = parser.extract_wall_entities(wall_layer_prefix=prefix)
+    return parser, [seg.to_dict() for seg in segments]
+
+
+def test_tag_reader():
+    """組碼讀取器應產生 (int, bytes) 配對"""
+    with open(SAMPLE_DXF, 'rb') as fp:
+        tags = iter_tags(fp)
+        assert next(tags) == (0, b'SECTION')
+        assert next(tags) == (2, b'HEADER')
+
+
+def test_stream_header_and_layers():
+    """串流讀取的標頭與圖層資訊應與 ezdxf 相同"""
+    parser, _ = _full_parse(None)
+
+    with DXFStream(SAMPLE_DXF) as stream:
+        assert stream.header['$ACADVER'] == parser.doc.dxfversion
+        assert stream.header['$INSUNITS'] == parser.insunits
+        assert stream.encoding == 'utf-8'
+        assert stream.layers == parser.layers
+
+
+def test_streaming_matches_full_parse():
+    """串流模式的線段（含 ID 順序）應與完整載入完全相同"""
+    for prefix in ("A-WALL", None):
+        _, expected = _full_parse(prefix)
+
+        parser = DXFParser(SAMPLE_DXF)
+        streamed = [seg.to_dict() for seg in parser.iter_wall_entities_streaming(prefix)]
+
+        assert streamed == expected
+        assert parser.segments == []  # 串流模式不保留線段
+
+
+def _write_mislabeled_big5(path):
+    """建立宣告為 ANSI_1252、實際以 Big5 (cp950) 儲存的 R2000 DXF"""
+    doc = ezdxf.new('R2000')
+    doc.layers.new('A-WALL-牆體')
+    doc.modelspace().add_line((0, 0), (1000, 0), dxfattribs={'layer': 'A-WALL-牆體'})
+    doc.saveas(path, encoding='cp950')
+
+
+def test_probe_ascii_file():
+    """純 ASCII 檔案：直接使用預設讀取"""
+    probe = probe_dxf(SAMPLE_DXF)
+    assert probe.conclusive
+    assert probe.encoding == probe.declared_encoding == 'utf-8'
+
+    parser = DXFParser(SAMPLE_DXF)
+    assert parser.load()
+    assert parser.load_report['method'] == '預設讀取'
+    assert parser.load_report['attempts'] == 1
+
+
+def test_probe_detects_mislabeled_big5(tmp_path):
+    """宣告 cp1252 但內容為 Big5：預檢應直接選用 cp950，只解析一次"""
+    path = str(tmp_path / 'big5.dxf')
+    _write_mislabeled_big5(path)
+
+    probe = probe_dxf(path)
+    assert probe.declared_encoding == 'cp1252'
+    assert probe.encoding == 'cp950'
+
+    parser = DXFParser(path)
+    assert parser.load()
+    assert parser.load_report['attempts'] == 1
+    assert 'A-WALL-牆體' in parser.extract_layers()
+
+    streamed = DXFParser(path)
+    assert [seg.layer for seg in streamed.iter_wall_entities_streaming(None)] == ['A-WALL-牆體']
+
+
+def test_probe_keeps_latin_codepage(tmp_path):
+    """含重音字母的 cp1252 圖層名稱不應被誤判為中文編碼"""
+    path = str(tmp_path / 'latin.dxf')
+    doc = ezdxf.new('R2000')
+    doc.layers.new('Séance-Wände')
+    doc.saveas(path)
+
+    assert probe_dxf(path).encoding == 'cp1252'
+
+
+if __name__ == '__main__':
+    test_tag_reader()
+    test_stream_header_and_layers()
+    test_streaming_matches_full_parse()
+    test_probe_ascii_file()
+    print("[OK] 串流模式測試通過")
@@ -0,0 +1,185 @@
+"""
+平行牆對索引測試：增量更新後的結果與整個專案重新偵測相同
+"""
+import math
+import sys
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+import numpy as np
+import pytest
+
+import database
+from database import DatabaseManager
+from geometry_utils import find_parallel_pairs_by_category
+from segment_store import SegmentStore
+
+THICKNESSES = {"RC": 150.0, "BRICK": 100.0, "EXT": 200.0}
+
+
+def _store(walls, seed, offset=0.0):
+    """雙線牆：隨機方向與牆厚，另一側可能被門洞切成數段"""
+    rng = np.random.default_rng(seed)
+    store = SegmentStore()
+    for _ in range(walls):
+        angle = rng.choice([0.0, math.pi / 2, rng.uniform(0, math.pi)])
+        direction = np.array([math.cos(angle), math.sin(angle)])
+        normal = np.array([-direction[1], direction[0]])
+        origin = rng.uniform(0, 40000, 2) + offset
+        length = rng.uniform(500, 8000)
+        gap = rng.choice(list(THICKNESSES.values())) + rng.uniform(-0.5, 0.5)
+        store.append(("A-WALL", "LINE", tuple(origin), tuple(origin + direction * length), None, None))
+        cut = sorted(rng.uniform(0, length, rng.integers(0, 3)))
+        for a, b in zip([0.0] + cut, cut + [length]):
+            start = origin + normal * gap + direction * a
+            store.append(("A-WALL", "LINE", tuple(start), tuple(start + direction * (b - a)), None, None))
+    store.fill_lengths()
+    return store
+
+
+def _expected(db, project_id, category_ids=None):
+    """整個專案重新偵測（與 detect-parallels 相同的線段與牆厚表）"""
+    def selected(category_id):
+        return category_id is not None and (category_ids is None or category_id in category_ids)
+
+    segments = sorted((seg for seg in db.get_segments(project_id)
+                       if selected(seg['category_id']) and not seg['is_merged'] and not seg['merge_excluded']),
+                      key=lambda seg: seg['id'])
+    thicknesses = {cat['id']: (cat['wall_thickness'], cat['wall_thickness_tolerance'])
+                   for cat in db.get_categories(project_id) if cat['wall_thickness'] and selected(cat['id'])}
+    return find_parallel_pairs_by_category(segments, thicknesses)
+
+
+@pytest.fixture
+def project(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'pairs.db'))
+    project_id = db.create_project("pairs")
+    for code, thickness in THICKNESSES.items():
+        category_id = db.add_wall_category(project_id, code, code)
+        db.update_category(category_id, wall_thickness=thickness, wall_thickness_tolerance=1.0)
+    db.set_layer_mapping(project_id, "A-WALL", category_id)
+    db.import_segments(project_id, _store(150, seed=0))
+    yield db, project_id
+    db.close()
+
+
+def test_incremental_matches_full(project):
+    db, project_id = project
+    total = len(db.get_segments(project_id))
+    assert db.refresh_parallel_pairs(project_id) == total  # 第一次：整個專案
+    expected = _expected(db, project_id)
+    assert set(expected) == set(db.get_parallel_pairs(project_id)) and len(expected) == 3
+    assert db.get_parallel_pairs(project_id) == expected
+    assert db.refresh_parallel_pairs(project_id) == 0  # 沒有變更
+
+    ids = [row[0] for row in db.conn.execute("SELECT id FROM wall_segments ORDER BY id")]
+    edits = [
+        # 移動：離開原本的牆、移到另一道牆旁
+        ("UPDATE wall_segments SET start_y = start_y + 150, end_y = end_y + 150 WHERE id = ?", ids[3]),
+        ("UPDATE wall_segments SET start_x = start_x + 3000, end_x = end_x + 3000 WHERE id = ?", ids[10]),
+        ("UPDATE wall_segments SET merge_excluded = 1 WHERE id = ?", ids[20]),
+        ("UPDATE wall_segments SET is_merged = 1 WHERE id = ?", ids[21]),
+        ("UPDATE wall_segments SET merge_excluded = 0 WHERE id = ?", ids[20]),
+    ]
+    for sql, seg_id in edits:
+        db.conn.execute(sql, (seg_id,))
+        db.conn.commit()
+        assert 0 < db.refresh_parallel_pairs(project_id) < total / 10
+        assert db.get_parallel_pairs(project_id) == _expected(db, project_id)
+
+    # 刪除：觸發器直接移除相關的牆對
+    db.conn.execute("DELETE FROM wall_segments WHERE id = ?", (ids[0],))
+    db.conn.commit()
+    assert db.refresh_parallel_pairs(project_id) == 0
+    assert db.get_parallel_pairs(project_id) == _expected(db, project_id)
+
+    # 重新分類：改為未分類的線段不再配對，改回牆類型後重新配對
+    paired = next(pair.primary_id for group in _expected(db, project_id).values() for pair in group)
+    for category_id in (None, db.get_categories(project_id)[0]['id']):
+        db.update_segment_category(paired, category_id)
+        assert 0 < db.refresh_parallel_pairs(project_id) < total / 10
+        pairs = db.get_parallel_pairs(project_id)
+        assert pairs == _expected(db, project_id)
+        assert any(paired in (pair.primary_id, pair.secondary_id)
+                   for group in pairs.values() for pair in group) == (category_id is not None)
+
+    # 新匯入的線段
+    store = _store(5, seed=1)
+    db.conn.execute("UPDATE wall_segments SET segment_uid = 'old_' || segment_uid")
+    db.conn.commit()
+    db.import_segments(project_id, store)
+    assert 0 < db.refresh_parallel_pairs(project_id) < total / 2
+    assert db.get_parallel_pairs(project_id) == _expected(db, project_id)
+
+
+def test_settings_change_rebuilds(project, monkeypatch):
+    db, project_id = project
+    db.refresh_parallel_pairs(project_id)
+    category_id = db.get_categories(project_id)[0]['id']
+    db.update_category(category_id, wall_thickness=120.0)
+    total = len(db.get_segments(project_id))
+    assert db.refresh_parallel_pairs(project_id) == total
+    assert db.get_parallel_pairs(project_id) == _expected(db, project_id)
+    assert db.get_parallel_pairs(project_id, category_ids=[category_id]) == {}
+
+    # 變更過多時整個專案重新偵測
+    monkeypatch.setattr(database, 'PAIR_INDEX_MAX_DIRTY', 3)
+    db.conn.execute("UPDATE wall_segments SET start_x = start_x + 1 WHERE id % 50 = 0")
+    db.conn.commit()
+    assert db.refresh_parallel_pairs(project_id) == total
+    assert db.get_parallel_pairs(project_id) == _expected(db, project_id)
+
+
+def test_unindexed_project_not_tracked(project):
+    """沒有建立索引的專案不維護外框與待更新紀錄"""
+    db, project_id = project
+    other = db.create_project("other")
+    db.import_segments(other, _store(5, seed=2))
+    db.conn.execute("UPDATE wall_segments SET start_x = start_x + 1 WHERE project_id = ?", (other,))
+    db.conn.commit()
+    assert db.conn.execute("SELECT COUNT(*) FROM segment_rtree").fetchone()[0] == 0
+    assert db.conn.execute("SELECT COUNT(*) FROM parallel_pair_dirty").fetchone()[0] == 0
+
+
+def test_only_categorized_walls(project):
+    """未分類的線（軸線、尺寸線等）即使與牆線距離等於牆厚也不配對；category_ids 限定比對的線段"""
+    db, project_id = project
+    store = SegmentStore()
+    store.append(("A-WALL", "LINE", (100000.0, 0.0), (105000.0, 0.0), None, None))
+    store.append(("S-GRID", "LINE", (100000.0, 150.0), (105000.0, 150.0), None, None))
+    store.append(("A-WALL", "LINE", (100000.0, 5000.0), (105000.0, 5000.0), None, None))
+    store.append(("A-WALL-RC", "LINE", (100000.0, 5150.0), (105000.0, 5150.0), None, None))
+    store.fill_lengths()
+    db.conn.execute("UPDATE wall_segments SET segment_uid = 'old_' || segment_uid")
+    db.conn.commit()
+    categories = [cat['id'] for cat in db.get_categories(project_id)]
+    db.set_layer_mapping(project_id, "A-WALL-RC", categories[0])
+    db.import_segments(project_id, store)
+    grid, wall, rc = [row[0] for row in db.conn.execute(
+        "SELECT id FROM wall_segments WHERE dxf_layer != 'A-WALL' OR start_x = 100000 ORDER BY id")][1:]
+
+    db.refresh_parallel_pairs(project_id)
+    pairs = [pair for group in db.get_parallel_pairs(project_id).values() for pair in group]
+    assert all(grid not in (pair.primary_id, pair.secondary_id) for pair in pairs)
+    assert any({pair.primary_id, pair.secondary_id} == {wall, rc} for pair in pairs)
+    assert db.get_parallel_pairs(project_id) == _expected(db, project_id)
+
+    # 只比對 RC 類型：RC 線段與其他類型的線段不配對
+    db.refresh_parallel_pairs(project_id, category_ids=[categories[0]])
+    assert db.get_parallel_pairs(project_id) == _expected(db, project_id, [categories[0]]) == {}
+    # 另一種範圍（RC + A-WALL 的類型）：重新比對
+    db.refresh_parallel_pairs(project_id, category_ids=[categories[0], categories[-1]])
+    assert db.get_parallel_pairs(project_id) == _expected(db, project_id, [categories[0], categories[-1]])
+
+
+def test_project_delete_clears_index(project):
+    """刪除專案時清除該專案的索引"""
+    db, project_id = project
+    db.refresh_parallel_pairs(project_id)
+    db.conn.execute("UPDATE wall_segments SET start_x = start_x + 1 WHERE id % 50 = 0")
+    db.conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+    db.conn.commit()
+    for table in ("parallel_pair_state", "parallel_pairs", "parallel_pair_dirty", "segment_rtree"):
+        assert db.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] == 0
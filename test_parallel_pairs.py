@@ -0,0 +1,188 @@
+"""
+平行牆對候選篩選測試：結果必須與逐對比對（O(n²)）完全相同
+"""
+import math
+import sys
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+import numpy as np
+import pytest
+
+from dxf_parser import DXFParser
+from geometry_utils import (
+    build_thickness_table, find_parallel_pair, find_parallel_pairs,
+    find_parallel_pairs_by_category, match_thickness,
+    parallel_pair_batch, parallel_pair_candidates
+)
+
+
+def _brute_force(segments, **kwargs):
+    pairs = []
+    for i in range(len(segments)):
+        for j in range(i + 1, len(segments)):
+            pair = find_parallel_pair(segments[i], segments[j], **kwargs)
+            if pair is not None:
+                pairs.append(pair)
+    return pairs
+
+
+def _segment(seg_id, start, end):
+    return {'id': seg_id, 'start_x': start[0], 'start_y': start[1],
+            'end_x': end[0], 'end_y': end[1], 'length': math.dist(start, end)}
+
+
+def _floor_plan(seed=0, walls=80, thickness=150.0):
+    """雙線牆平面：隨機方向、偏移誤差、斷開的共線線段、接近角度 / 距離邊界的線段"""
+    rng = np.random.default_rng(seed)
+    segments = []
+
+    def add(start, end):
+        segments.append(_segment(len(segments) + 1, tuple(start), tuple(end)))
+
+    for _ in range(walls):
+        angle = rng.choice([0.0, math.pi / 2, math.pi, rng.uniform(0, 2 * math.pi)])
+        direction = np.array([math.cos(angle), math.sin(angle)])
+        normal = np.array([-direction[1], direction[0]])
+        origin = rng.uniform(0, 60000, 2)
+        length = rng.uniform(200, 12000)
+        add(origin, origin + direction * length)
+
+        # 另一側：厚度在容許誤差邊界附近、角度在容許誤差邊界附近、可能斷成數段
+        gap = thickness + rng.choice([0.0, 0.999, -0.999, 1.001, rng.uniform(-3, 3)])
+        skew = math.radians(rng.choice([0.0, 0.999, 1.001, rng.uniform(-2, 2)]))
+        other = np.array([math.cos(angle + skew), math.sin(angle + skew)])
+        cut = sorted(rng.uniform(0, length, rng.integers(0, 3)))
+        for a, b in zip([0.0] + cut, cut + [length]):
+            start = origin + normal * gap + other * a
+            if rng.random() < 0.5:
+                add(start, start + other * (b - a))
+            else:
+                add(start + other * (b - a), start)  # 反向
+
+    add((100.0, 100.0), (100.0, 100.0))  # 零長度
+    add((0.0, 0.0), (5000.0, -1e-3))     # 接近 180° / 0° 的循環邊界
+    add((5000.0, 150.0), (0.0, 150.0 + 1e-3))
+    order = rng.permutation(len(segments))
+    return [segments[i] for i in order]
+
+
+def _assert_same(pairs, expected):
+    assert pairs == expected  # 含重疊區域，逐位元相同
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("kwargs", [
+    dict(wall_thickness=150.0, tolerance=1.0),
+    dict(wall_thickness=150.0, tolerance=5.0, angle_tolerance=2.0, min_overlap=0.0),
+    dict(wall_thickness=150.0, tolerance=1.0, angle_tolerance=0.0),
+    dict(wall_thickness=0.0, tolerance=200.0, angle_tolerance=60.0),
+])
+def test_matches_brute_force(seed, kwargs):
+    segments = _floor_plan(seed)
+    expected = _brute_force(segments, **kwargs)
+    _assert_same(find_parallel_pairs(segments, **kwargs), expected)
+
+
+def test_candidates_prune_pairs():
+    segments = _floor_plan(3, walls=400)
+    expected = _brute_force(segments, wall_thickness=150.0)
+    assert len(expected) > 100
+
+    starts = [(seg['start_x'], seg['start_y']) for seg in segments]
+    ends = [(seg['end_x'], seg['end_y']) for seg in segments]
+    candidates = parallel_pair_candidates(starts, ends, 150.0)
+    total = len(segments) * (len(segments) - 1) // 2
+    assert len(candidates) < total / 50
+    assert (candidates[:, 0] < candidates[:, 1]).all()
+    assert len(np.unique(candidates, axis=0)) == len(candidates)
+
+
+def test_sample_drawing():
+    parser = DXFParser(str(project_dir / 'test_sample.dxf'))
+    assert parser.load()
+    segments = [
+        _segment(i, seg.start_point, seg.end_point)
+        for i, seg in enumerate(parser.extract_wall_entities(wall_layer_prefix=None))
+    ]
+    # 原圖加上偏移 150mm 的複本，形成雙線牆
+    segments += [_segment(len(segments) + i, (s['start_x'], s['start_y'] + 150), (s['end_x'], s['end_y'] + 150))
+                 for i, s in enumerate(segments)]
+    for thickness in (150.0, 2000.0, 4000.0):
+        expected = _brute_force(segments, wall_thickness=thickness)
+        _assert_same(find_parallel_pairs(segments, wall_thickness=thickness), expected)
+
+
+def test_batch_kernel_matches_scalar():
+    """任意候選對（含不平行、零長度、反向）：批次結果與逐對 find_parallel_pair 相同"""
+    segments = _floor_plan(4, walls=60)
+    rng = np.random.default_rng(4)
+    n = len(segments)
+    first = np.concatenate([rng.integers(0, n, 3000), np.repeat(np.arange(n), n)])
+    second = np.concatenate([rng.integers(0, n, 3000), np.tile(np.arange(n), n)])
+
+    starts = np.array([(seg['start_x'], seg['start_y']) for seg in segments])
+    ends = np.array([(seg['end_x'], seg['end_y']) for seg in segments])
+    lengths = np.array([seg['length'] for seg in segments])
+    batch = parallel_pair_batch(starts, ends, lengths, first, second, 150.0, tolerance=2.0)
+
+    expected = [(i, j, find_parallel_pair(segments[i], segments[j], 150.0, tolerance=2.0))
+                for i, j in zip(first.tolist(), second.tolist())]
+    expected = [(i, j, pair) for i, j, pair in expected if pair is not None]
+    assert len(batch) == len(expected) > 50
+    for row, (i, j, pair) in zip(batch, expected):
+        assert (row["first"], row["second"]) == (i, j)
+        assert segments[row["primary"]]["id"] == pair.primary_id
+        assert segments[row["secondary"]]["id"] == pair.secondary_id
+        assert row["distance"] == pair.distance and row["overlap_length"] == pair.overlap_length
+        assert tuple(row["overlap_start"]) == pair.overlap_region["start"]
+        assert tuple(row["overlap_end"]) == pair.overlap_region["end"]
+
+
+def test_split_face_candidates_are_linear():
+    """同一條線上被門洞切成許多短段的牆面：候選對數量與線段數成正比，而非平方"""
+    pieces = 3000
+    segments = [_segment(i, (i * 1000.0, 0.0), (i * 1000.0 + 900.0, 0.0)) for i in range(pieces)]
+    segments += [_segment(pieces + i, (i * 1000.0, 150.0), (i * 1000.0 + 900.0, 150.0))
+                 for i in range(pieces)]
+    starts = [(seg['start_x'], seg['start_y']) for seg in segments]
+    ends = [(seg['end_x'], seg['end_y']) for seg in segments]
+    candidates = parallel_pair_candidates(starts, ends, 150.0)
+    assert len(candidates) < 10 * len(segments)
+    assert len(find_parallel_pairs(segments, wall_thickness=150.0)) == pieces
+
+
+def test_match_thickness():
+    """重疊的牆厚範圍：取包含該距離且牆厚最接近者，相同時取索引較小者"""
+    thicknesses = np.array([150.0, 120.0, 151.0, 200.0, 150.0, 300.0])
+    tolerances = np.array([1.0, 0.0, 1.0, 40.0, 2.0, 1.0])
+    table = build_thickness_table(thicknesses, tolerances)
+    rng = np.random.default_rng(6)
+    distances = np.concatenate([rng.uniform(100, 320, 5000), table.edges,
+                                np.nextafter(table.edges, np.inf), np.nextafter(table.edges, -np.inf),
+                                [np.nan, -1.0, 1e9]])
+
+    expected = []
+    for d in distances.tolist():
+        matches = [(abs(d - t), k) for k, (t, tol) in enumerate(zip(thicknesses, tolerances))
+                   if t - tol <= d <= t + tol]
+        expected.append(min(matches)[1] if matches else -1)
+    assert match_thickness(table, distances).tolist() == expected
+
+
+def test_by_category_single_pass():
+    """所有類型一次偵測，與逐類型（單一牆厚）偵測的結果相同"""
+    thicknesses = {11: (100.0, 1.0), 12: (150.0, 1.0), 13: (200.0, 5.0), 14: (400.0, 1.0)}
+    segments = []
+    for seed, thickness in enumerate((100.0, 150.0, 200.0)):
+        for seg in _floor_plan(seed, walls=60, thickness=thickness):
+            segments.append(dict(seg, id=len(segments)))
+
+    result = find_parallel_pairs_by_category(segments, thicknesses)
+    assert set(result) == {11, 12, 13}
+    for category_id, (thickness, tolerance) in thicknesses.items():
+        expected = find_parallel_pairs(segments, wall_thickness=thickness, tolerance=tolerance)
+        _assert_same(result.get(category_id, []), expected)
+    assert find_parallel_pairs_by_category(segments, {}) == {}
@@ -0,0 +1,110 @@
+"""
+解析快取測試
+"""
+import os
+import sys
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+from dxf_parser import DXFParser
+from parse_cache import ParseCache, file_content_hash
+
+SAMPLE_DXF = str(project_dir / 'test_sample.dxf')
+
+
+def _parse():
+    parser = DXFParser(SAMPLE_DXF)
+    assert parser.load()
+    layers = parser.extract_layers()
+    segments = parser.extract_wall_entities(wall_layer_prefix=None)
+    return parser, layers, segments
+
+
+def test_roundtrip(tmp_path):
+    """快取讀回的圖層、標頭與線段應與原始解析完全相同"""
+    parser, layers, segments = _parse()
+    cache = ParseCache(str(tmp_path))
+    key = cache.make_key(file_content_hash(SAMPLE_DXF))
+
+    assert cache.get(key) is None
+    cache.put(key, layers, parser.dimscale, parser.insunits, segments)
+
+    cached = cache.get(key)
+    assert cached.layers == layers
+    assert cached.dimscale == parser.dimscale
+    assert cached.insunits == parser.insunits
+    assert [seg.to_dict() for seg in cached.segments] == [seg.to_dict() for seg in segments]
+
+
+def test_lru_eviction(tmp_path):
+    """超過容量上限時淘汰最久未使用的快取"""
+    parser, layers, segments = _parse()
+    cache = ParseCache(str(tmp_path))
+    size = cache.put('a', layers, 1.0, 0, segments)
+    cache.max_bytes = size * 2
+
+    cache.put('b', layers, 1.0, 0, segments)
+    # 讓 a 成為最近使用
+    os.utime(cache._path('b'), (1, 1))
+    assert cache.get('a') is not None
+
+    cache.put('c', layers, 1.0, 0, segments)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+
+
+def test_invalidate(tmp_path):
+    """可依檔案雜湊或全部清除快取"""
+    parser, layers, segments = _parse()
+    cache = ParseCache(str(tmp_path))
+    file_hash = file_content_hash(SAMPLE_DXF)
+    cache.put(cache.make_key(file_hash), layers, 1.0, 0, segments)
+    cache.put(cache.make_key(file_hash, 'A-WALL'), layers, 1.0, 0, segments)
+    cache.put('other', layers, 1.0, 0, segments)
+
+    assert cache.invalidate(file_hash) == 2
+    assert cache.get(cache.make_key(file_hash)) is None
+    assert cache.invalidate() == 1
+    assert cache.stats()['entries'] == 0
+
+
+def test_corrupt_entry(tmp_path):
+    """損毀的快取檔視為未命中並移除"""
+    cache = ParseCache(str(tmp_path))
+    with open(cache._path('bad'), 'wb') as fp:
+        fp.write(b'garbage')
+    assert cache.get('bad') is None
+    assert not os.path.exists(cache._path('bad'))
+
+
+def test_parametric_arcs_roundtrip(tmp_path):
+    """參數式弧線經過快取後仍為參數式，離散化結果與直接提取相同"""
+    import ezdxf
+
+    path = str(tmp_path / 'arcs.dxf')
+    doc = ezdxf.new('R2000')
+    msp = doc.modelspace()
+    msp.add_line((0, 0), (5000, 0))
+    msp.add_arc((0, 0), 900, 0, 90)
+    msp.add_circle((3000, 3000), 50)
+    msp.add_lwpolyline([(0, 0), (100, 0), (100, 100)])
+    doc.saveas(path)
+
+    parser = DXFParser(path)
+    assert parser.load()
+    expected = parser.extract_wall_entities(wall_layer_prefix=None).to_dicts()
+
+    parser = DXFParser(path)
+    parser.parametric_arcs = True
+    assert parser.load()
+    segments = parser.extract_wall_entities(wall_layer_prefix=None)
+    assert len(segments.curve_rows) == 2
+
+    cache = ParseCache(str(tmp_path / 'cache'))
+    cache.put('arcs', {}, 1.0, 0, segments)
+    cached = cache.get('arcs')
+    assert cached.segments.to_dicts(parametric=True) == segments.to_dicts(parametric=True)
+    assert cached.segments.to_dicts() == expected
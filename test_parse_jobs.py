@@ -0,0 +1,95 @@
+"""
+背景解析工作測試
+"""
+import sys
+import threading
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+from dxf_parser import DXFParser
+from parse_jobs import ParseJob, ParseJobManager
+
+SAMPLE_DXF = str(project_dir / 'test_sample.dxf')
+
+
+def _parse_worker(job, prefix=None):
+    parser = DXFParser(job.filepath)
+    parser.progress_callback = job.update
+    assert parser.load()
+    parser.extract_layers()
+    segments = parser.extract_wall_entities(wall_layer_prefix=prefix)
+    return {"count": len(segments)}
+
+
+def test_job_reports_phases():
+    """工作應依序回報各階段，完成後進度為 100% 並保留結果"""
+    phases = []
+
+    def worker(job):
+        original = job.update
+
+        def record(phase, done, total):
+            phases.append(phase)
+            original(phase, done, total)
+
+        job.update = record
+        return _parse_worker(job)
+
+    manager = ParseJobManager(worker)
+    job = manager.submit(SAMPLE_DXF, '測試')
+    job = manager.wait(job.job_id, timeout=30)
+    manager.shutdown()
+
+    assert job.status == 'done'
+    assert job.percent == 100.0
+    assert job.result['count'] > 0
+    assert [p for i, p in enumerate(phases) if i == 0 or phases[i - 1] != p] == ['load', 'layers', 'entities']
+    assert job.to_dict(include_result=True)['result'] == job.result
+
+
+def test_parallel_jobs_do_not_block():
+    """多個工作同時執行；等待中的工作不影響其他工作完成"""
+    release = threading.Event()
+
+    def worker(job, block=False):
+        if block:
+            release.wait(10)
+        return _parse_worker(job)
+
+    manager = ParseJobManager(worker, max_workers=2)
+    blocked = manager.submit(SAMPLE_DXF, 'A', block=True)
+    free = manager.submit(SAMPLE_DXF, 'B')
+
+    assert manager.wait(free.job_id, timeout=30).status == 'done'
+    assert manager.get(blocked.job_id).status == 'running'
+    release.set()
+    assert manager.wait(blocked.job_id, timeout=30).status == 'done'
+    manager.shutdown()
+
+
+def test_failed_job():
+    """例外應記錄為失敗，不影響管理器"""
+    def worker(job):
+        raise ValueError("無法解析 DXF 檔案")
+
+    manager = ParseJobManager(worker)
+    job = manager.wait(manager.submit('missing.dxf', 'X').job_id, timeout=10)
+    manager.shutdown()
+
+    assert job.status == 'failed'
+    assert job.error == "無法解析 DXF 檔案"
+
+
+def test_progress_percent_is_monotonic():
+    """整體進度依階段權重換算且不倒退"""
+    job = ParseJob(job_id='1', filepath='', project_name='')
+    job.update('load', 1, 1)
+    assert job.percent == 30.0
+    job.update('entities', 50, 100)
+    assert job.percent == 60.0
+    job.update('layers', 1, 1)
+    assert job.percent == 60.0
+    job.update('import', 100, 100)
+    assert job.percent == 100.0
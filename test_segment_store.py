@@ -0,0 +1,170 @@
+"""
+欄位式線段儲存測試
+"""
+import math
+import pickle
+import sys
+from pathlib import Path
+
+project_dir = Path(__file__).parent
+sys.path.insert(0, str(project_dir))
+
+from segment_store import SegmentStore, WallSegment
+
+RECORDS = [
+    ("A-WALL", "LINE", (0.0, 0.0), (3.0, 4.0), 5.0, None),
+    ("A-WALL-RC", "LWPOLYLINE", (0.0, 0.0), (1.0, 1.0), 2.0, [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0)]),
+    ("A-WALL", "ARC", (1.0, 0.0), (0.0, 1.0), math.pi / 2, [(1.0, 0.0), (0.0, 1.0)]),
+]
+
+
+def _store(records=RECORDS):
+    store = SegmentStore()
+    for record in records:
+        store.append(record)
+    return store
+
+
+def test_lazy_view():
+    """索引、迭代時產生的 WallSegment 應與記錄內容相同，ID 依位置產生"""
+    store = _store()
+    assert len(store) == 3
+    assert store[1] == WallSegment("seg_00002", *RECORDS[1])
+    assert store[-1].id == "seg_00003"
+    assert [seg.entity_type for seg in store] == ["LINE", "LWPOLYLINE", "ARC"]
+    assert [seg.id for seg in store[:2]] == ["seg_00001", "seg_00002"]
+    assert store.to_dicts() == [seg.to_dict() for seg in store]
+    assert list(store.iter_records()) == RECORDS
+    assert SegmentStore() == []
+
+
+def test_numpy_columns():
+    store = _store()
+    assert store.start.shape == (3, 2)
+    assert store.end[0].tolist() == [3.0, 4.0]
+    assert store.length.sum() == 7.0 + math.pi / 2
+    assert store.vertex_offsets_array.tolist() == [0, 0, 3, 5]
+    assert store.vertex_buffer.shape == (5, 2)
+    assert store.layer_mask(["A-WALL"]).tolist() == [True, False, True]
+
+    store.append(RECORDS[0])  # 寫入後欄位快取應更新
+    assert store.length.shape == (4,)
+
+
+def test_extend_store_and_pickle():
+    """串接時名稱代碼重新對應；序列化後內容不變"""
+    first = _store(RECORDS[2:])
+    first.extend(_store())
+    assert list(first.iter_records()) == RECORDS[2:] + RECORDS
+
+    restored = pickle.loads(pickle.dumps(first))
+    assert restored.to_dicts() == first.to_dicts()
+    restored.append(("NEW", "LINE", (0.0, 0.0), (1.0, 0.0), 1.0, None))
+    assert restored[-1].layer == "NEW"
+
+
+def test_summarize_by_layer():
+    summary = _store().summarize_by_layer()
+    assert list(summary) == ["A-WALL", "A-WALL-RC"]
+    assert summary["A-WALL"]["count"] == 2
+    assert summary["A-WALL"]["segments"] == ["seg_00001", "seg_00003"]
+    assert math.isclose(summary["A-WALL"]["total_length"], 5.0 + math.pi / 2)
+
+
+def test_fill_lengths_matches_scalar():
+    """批次長度計算與逐筆計算的結果相同（相對誤差 1e-9 以內）"""
+    import random
+    from dxf_parser import DXFParser
+
+    random.seed(7)
+    parser = DXFParser('unused.dxf')
+    store = SegmentStore()
+    expected = []
+    for i in range(500):
+        if i % 3 == 0:
+            start = (random.uniform(-1e5, 1e5), random.uniform(-1e5, 1e5))
+            end = (random.uniform(-1e5, 1e5), random.uniform(-1e5, 1e5))
+            store.append(("A-WALL", "LINE", start, end, None, None))
+            expected.append(parser._calculate_length(start, end))
+        else:
+            vertices = [(random.uniform(-1e5, 1e5), random.uniform(-1e5, 1e5))
+                        for _ in range(random.randint(2, 40))]
+            store.append(("A-WALL", "LWPOLYLINE", vertices[0], vertices[-1], None, vertices))
+            expected.append(parser._calculate_polyline_length(vertices))
+    store.append(RECORDS[2])  # 已有長度的記錄不重新計算
+    expected.append(RECORDS[2][4])
+
+    assert store.fill_lengths() == 500
+    assert store.fill_lengths() == 0
+    for actual, value in zip(store.length.tolist(), expected):
+        assert math.isclose(actual, value, rel_tol=1e-9)
+
+
+def test_polyline_lengths_short_rows():
+    """頂點少於 2 個的多段線長度為 0，且不影響相鄰多段線"""
+    from geometry_utils import polyline_lengths
+
+    points = [(0, 0), (3, 4), (9, 9), (0, 0), (0, 1), (0, 3), (5, 5)]
+    offsets = [0, 2, 2, 3, 6, 7]
+    assert polyline_lengths(points, offsets).tolist() == [5.0, 0.0, 0.0, 3.0, 0.0]
+
+
+def test_arc_segment_counts_respect_tolerance():
+    """每段弦高不超過容許值；小圓點數少、大半徑弧線點數多"""
+    from geometry_utils import arc_segment_counts
+
+    radii = [5.0, 50.0, 900.0, 30000.0]
+    sweeps = [2 * math.pi, 2 * math.pi, math.pi / 2, math.pi / 2]
+    counts = arc_segment_counts(radii, sweeps, 1.0).tolist()
+    assert counts[0] == 8  # 每段至多 45°
+    assert counts[1] < 33 < counts[3]
+    for radius, sweep, count in zip(radii, sweeps, counts):
+        assert radius * (1 - math.cos(sweep / count / 2)) <= 1.0 + 1e-9
+
+
+def test_parametric_arcs():
+    """參數式弧線：惰性檢視即時離散化，tessellate() 批次填入且不影響其他列的頂點"""
+    from geometry_utils import ArcParams, arc_points
+
+    arc = ArcParams(0.0, 0.0, 1000.0, 0.0, math.pi / 2)
+    store = _store(RECORDS[:2])
+    store.append(("A-WALL", "ARC", (1000.0, 0.0), (0.0, 1000.0), 500 * math.pi, arc))
+    store.append(RECORDS[1])
+    expected = arc_points(arc, store.arc_tolerance)
+
+    assert store[2].vertices == expected
+    assert store.arc(2) == arc and store.arc(1) is None
+    parametric = store.to_dicts(parametric=True)
+    assert parametric[2]["vertices"] is None
+    assert parametric[2]["arc"]["end_angle"] == 90.0
+    assert "arc" not in parametric[1]
+
+    copy = pickle.loads(pickle.dumps(store))
+    copy.extend(store)
+    assert copy.tessellate() == 2
+    assert copy.tessellate() == 0
+    assert [seg.vertices for seg in copy] == [seg.vertices for seg in store] * 2
+    assert copy.arc(6) == arc  # 參數仍保留
+
+
+def test_bulge_kernels_match_ezdxf():
+    """凸度轉圓弧的圓心、半徑、角度與 ezdxf 相同；長度為弧長"""
+    import random
+    from ezdxf.math import bulge_to_arc
+    from geometry_utils import bulge_arcs, polyline_lengths
+
+    random.seed(11)
+    for _ in range(50):
+        start = (random.uniform(-1e4, 1e4), random.uniform(-1e4, 1e4))
+        end = (random.uniform(-1e4, 1e4), random.uniform(-1e4, 1e4))
+        bulge = random.choice([-1, 1]) * random.uniform(0.01, 3.0)
+        center_x, center_y, radius, angle, sweep = bulge_arcs([start], [end], [bulge])[0]
+        center, start_angle, end_angle, expected_radius = bulge_to_arc(start, end, bulge)
+        assert math.isclose(radius, expected_radius, rel_tol=1e-9)
+        assert math.dist((center_x, center_y), (center.x, center.y)) < 1e-6
+        # ezdxf 的角度一律逆時針（順時針弧線的起訖對調）
+        first = start_angle if bulge > 0 else end_angle
+        assert math.isclose(math.cos(angle), math.cos(first), abs_tol=1e-9)
+        assert math.isclose(math.sin(angle), math.sin(first), abs_tol=1e-9)
+        length = polyline_lengths([start, end], [0, 2], [bulge, 0.0])[0]
+        assert math.isclose(length, radius * abs(sweep), rel_tol=1e-9)